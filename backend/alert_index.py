@@ -0,0 +1,218 @@
+"""
+Price Alert Threshold Index
+Per-ticker sorted thresholds so a price tick finds crossed alerts by bisection
+"""
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+# Direction an alert fires in
+ABOVE = 'above'
+BELOW = 'below'
+
+# Conditions accepted by the API, mapped onto a direction
+CONDITION_DIRECTIONS = {
+    'above': ABOVE,
+    'up': ABOVE,
+    'below': BELOW,
+    'down': BELOW
+}
+
+
+def alert_threshold(alert: Dict) -> Optional[Tuple[str, float]]:
+    """
+    Normalize an alert row to (direction, trigger price)
+
+    Price alerts fire at target_price. Percentage alerts fire at
+    reference_price moved by percentage_change in the alert's direction;
+    they have no threshold until a reference price is known.
+
+    Returns:
+        (ABOVE or BELOW, price) or None if the alert cannot be placed yet
+    """
+    direction = CONDITION_DIRECTIONS.get((alert.get('condition') or '').lower())
+    if direction is None:
+        return None
+
+    if alert.get('alert_type') == 'percentage':
+        reference = alert.get('reference_price')
+        change = alert.get('percentage_change')
+        if not reference or change is None:
+            return None
+        move = abs(change) / 100.0
+        return direction, reference * (1 + move if direction == ABOVE else 1 - move)
+
+    target = alert.get('target_price')
+    if target is None:
+        return None
+    return direction, float(target)
+
+
+class TickerThresholds:
+    """
+    Sorted thresholds for one ticker
+
+    Both sides are kept so that crossed alerts always sit at the end of the
+    list: 'below' alerts ascending (a price p crosses every threshold >= p)
+    and 'above' alerts by negated threshold (p crosses every threshold <= p).
+    A tick is then one bisect plus a tail slice, O(log n + k), and removing
+    the crossed alerts is a truncation rather than a shift of the list.
+    """
+
+    __slots__ = ('keys', 'ids')
+
+    def __init__(self):
+        # Parallel lists per direction: sort keys and alert ids
+        self.keys = {ABOVE: [], BELOW: []}
+        self.ids = {ABOVE: [], BELOW: []}
+
+    @staticmethod
+    def _key(direction: str, price: float) -> float:
+        return -price if direction == ABOVE else price
+
+    def add(self, alert_id: int, direction: str, price: float):
+        keys, ids = self.keys[direction], self.ids[direction]
+        key = self._key(direction, price)
+        # Keep (key, id) order so equal thresholds stay deterministic
+        i = bisect_left(keys, key)
+        while i < len(keys) and keys[i] == key and ids[i] < alert_id:
+            i += 1
+        keys.insert(i, key)
+        ids.insert(i, alert_id)
+
+    def remove(self, alert_id: int, direction: str, price: float) -> bool:
+        keys, ids = self.keys[direction], self.ids[direction]
+        key = self._key(direction, price)
+        i = bisect_left(keys, key)
+        while i < len(keys) and keys[i] == key:
+            if ids[i] == alert_id:
+                del keys[i]
+                del ids[i]
+                return True
+            i += 1
+        return False
+
+    def pop_crossed(self, price: float) -> List[int]:
+        """Remove and return the ids of every alert the price crosses"""
+        crossed = []
+        for direction in (ABOVE, BELOW):
+            keys, ids = self.keys[direction], self.ids[direction]
+            start = bisect_left(keys, self._key(direction, price))
+            if start < len(keys):
+                crossed.extend(ids[start:])
+                del keys[start:]
+                del ids[start:]
+        return crossed
+
+    def __len__(self):
+        return len(self.ids[ABOVE]) + len(self.ids[BELOW])
+
+
+class AlertIndex:
+    """
+    In-memory index of every active, untriggered alert
+
+    Alerts that cannot be placed yet (percentage alerts without a reference
+    price) wait per ticker until the first price is seen for it.
+    """
+
+    def __init__(self):
+        self._tickers: Dict[str, TickerThresholds] = {}
+        self._alerts: Dict[int, Dict] = {}
+        self._placement: Dict[int, Tuple[str, float]] = {}
+        self._unanchored: Dict[str, Dict[int, Dict]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, alerts: List[Dict]):
+        """Replace the whole index with alert rows"""
+        with self._lock:
+            self._tickers = {}
+            self._alerts = {}
+            self._placement = {}
+            self._unanchored = {}
+            # Sort once per side instead of bisecting every insert
+            pending: Dict[str, Dict[str, List[Tuple[float, int]]]] = {}
+            for alert in alerts:
+                placement = self._track(alert)
+                if placement:
+                    direction, price = placement
+                    pending.setdefault(alert['ticker'], {ABOVE: [], BELOW: []})[direction].append(
+                        (TickerThresholds._key(direction, price), alert['id'])
+                    )
+            for ticker, sides in pending.items():
+                thresholds = self._tickers.setdefault(ticker, TickerThresholds())
+                for direction, entries in sides.items():
+                    entries.sort()
+                    thresholds.keys[direction] = [key for key, _ in entries]
+                    thresholds.ids[direction] = [alert_id for _, alert_id in entries]
+
+    def _track(self, alert: Dict) -> Optional[Tuple[str, float]]:
+        """Record an alert and return where it belongs (lock must be held)"""
+        self._alerts[alert['id']] = alert
+        placement = alert_threshold(alert)
+        if placement:
+            self._placement[alert['id']] = placement
+        elif alert.get('alert_type') == 'percentage' and not alert.get('reference_price'):
+            self._unanchored.setdefault(alert['ticker'], {})[alert['id']] = alert
+        return placement
+
+    def add(self, alert: Dict):
+        """Index one alert"""
+        with self._lock:
+            placement = self._track(alert)
+            if placement:
+                self._tickers.setdefault(alert['ticker'], TickerThresholds()).add(alert['id'], *placement)
+
+    def remove(self, alert_id: int):
+        """Drop an alert (deleted, deactivated or triggered elsewhere)"""
+        with self._lock:
+            alert = self._alerts.pop(alert_id, None)
+            if alert is None:
+                return
+            placement = self._placement.pop(alert_id, None)
+            if placement and alert['ticker'] in self._tickers:
+                self._tickers[alert['ticker']].remove(alert_id, *placement)
+            self._unanchored.get(alert['ticker'], {}).pop(alert_id, None)
+
+    def match(self, ticker: str, price: float) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Apply a price tick to a ticker
+
+        Crossed alerts are removed from the index. Unanchored percentage
+        alerts take this price as their reference and are placed.
+
+        Returns:
+            (triggered alert rows, newly anchored alert rows)
+        """
+        with self._lock:
+            anchored = []
+            waiting = self._unanchored.pop(ticker, None)
+            if waiting:
+                thresholds = self._tickers.setdefault(ticker, TickerThresholds())
+                for alert_id, alert in waiting.items():
+                    alert['reference_price'] = price
+                    placement = alert_threshold(alert)
+                    if placement:
+                        self._placement[alert_id] = placement
+                        thresholds.add(alert_id, *placement)
+                        anchored.append(alert)
+
+            thresholds = self._tickers.get(ticker)
+            if not thresholds:
+                return [], anchored
+
+            triggered = []
+            for alert_id in thresholds.pop_crossed(price):
+                self._placement.pop(alert_id, None)
+                alert = self._alerts.pop(alert_id, None)
+                if alert is not None:
+                    triggered.append(alert)
+            return triggered, anchored
+
+    def tickers(self) -> List[str]:
+        """Tickers with at least one alert waiting"""
+        with self._lock:
+            return sorted({t for t, th in self._tickers.items() if len(th)} | set(self._unanchored))
+
+    def __len__(self):
+        return len(self._alerts)
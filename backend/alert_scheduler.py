@@ -0,0 +1,241 @@
+"""
+Price Alert Scheduler
+Polls quotes for every ticker with an active alert and fires crossed alerts
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, time as dt_time
+from typing import Callable, Dict, List, Optional
+
+from leader_lease import LeaderLease
+from metrics import ALERT_SCAN_LATENCY, ALERTS_TRIGGERED
+from price_alerts_service import price_alerts_service
+from services.quote_store import quote_store
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+logger = logging.getLogger(__name__)
+
+# Regular trading session per exchange: (timezone, open, close).
+# Tickers are mapped by suffix (RELIANCE.NS, SHEL.L); no suffix means US.
+MARKET_HOURS = {
+    'US': ('America/New_York', dt_time(9, 30), dt_time(16, 0)),
+    'IN': ('Asia/Kolkata', dt_time(9, 15), dt_time(15, 30)),
+    'UK': ('Europe/London', dt_time(8, 0), dt_time(16, 30)),
+}
+SUFFIX_MARKETS = {
+    'NS': 'IN',
+    'BO': 'IN',
+    'L': 'UK',
+}
+
+
+def market_for(ticker: str) -> str:
+    """Exchange a ticker trades on, from its suffix"""
+    if '.' in ticker:
+        return SUFFIX_MARKETS.get(ticker.rsplit('.', 1)[1], 'US')
+    return 'US'
+
+
+def is_market_open(market: str, now: Optional[datetime] = None) -> bool:
+    """Whether the market's regular session is running (weekends closed, holidays not modelled)"""
+    if ZoneInfo is None or market not in MARKET_HOURS:
+        return True
+    tz_name, open_at, close_at = MARKET_HOURS[market]
+    local = (now or datetime.now(tz=ZoneInfo('UTC'))).astimezone(ZoneInfo(tz_name))
+    if local.weekday() >= 5:
+        return False
+    return open_at <= local.time() < close_at
+
+
+class AlertScheduler:
+    """
+    Background loop that evaluates price alerts
+
+    - Works on the distinct tickers that have an active alert, so the cost
+      of a scan grows with tickers, never with alerts or users
+    - Quotes are fetched in batches; tickers whose market is open are
+      polled every open_interval seconds, closed ones every closed_interval
+    - Only one process scans: a Redis lease elects the leader across
+      gunicorn workers (an exclusive lock file is used without Redis or
+      while Redis errors) and the other workers keep retrying so they take
+      over if the leader dies
+    - Triggered alerts are handed to the notifier callback
+    """
+
+    LOCK_KEY = 'alert-scheduler:leader'
+
+    def __init__(self, alerts_service=None, price_service=None,
+                 notifier: Optional[Callable[[List[Dict]], None]] = None):
+        """
+        Args:
+            alerts_service: PriceAlertsService holding the alert index
+            price_service: Quote source with get_multiple_prices(tickers, timeout, max_age)
+            notifier: Called with the triggered alerts of each scan
+        """
+        self.alerts_service = alerts_service or price_alerts_service
+        self.price_service = price_service or quote_store
+        self.notifier = notifier or self._notify_by_email
+
+        self.enabled = os.getenv('ALERT_SCHEDULER_ENABLED', 'true').lower() == 'true'
+        self.open_interval = float(os.getenv('ALERT_SCAN_INTERVAL', '60'))
+        self.closed_interval = float(os.getenv('ALERT_SCAN_CLOSED_INTERVAL', '1800'))
+        self.batch_size = int(os.getenv('ALERT_SCAN_BATCH_SIZE', str(self.price_service.max_batch_size)))
+        self.batch_timeout = float(os.getenv('ALERT_SCAN_BATCH_TIMEOUT', '10'))
+        # Alerts only fire on quotes within the store's TTL, never on the
+        # stale fallback it serves when a refresh fails
+        self.quote_max_age = float(os.getenv('ALERT_QUOTE_MAX_AGE', str(quote_store.ttl)))
+        self.lease = LeaderLease(
+            self.LOCK_KEY,
+            ttl=max(30, int(self.open_interval * 3)),
+            lock_file=os.getenv('ALERT_SCHEDULER_LOCK_FILE', 'alert_scheduler.lock')
+        )
+
+        self.redis_client = None
+        self._last_checked: Dict[str, float] = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+        # Statistics
+        self.scans = 0
+        self.quotes_fetched = 0
+        self.alerts_triggered = 0
+        self.last_scan = None
+        self.errors = 0
+
+    def start(self, redis_client=None):
+        """Start the scheduler thread (once per process)"""
+        if not self.enabled:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self.redis_client = redis_client
+            self._thread = threading.Thread(target=self._run, name='alert-scheduler', daemon=True)
+            self._thread.start()
+            logger.info(f"Alert scheduler started (every {self.open_interval}s while markets are open)")
+
+    def stop(self):
+        """Stop scanning and give up leadership"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.batch_timeout + 1)
+        self._release_leadership()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._hold_leadership():
+                    self.scan()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Alert scan failed: {str(e)}")
+            self._stop.wait(self.open_interval)
+
+    # ------------------------------------------------------------------
+    # Leader election
+
+    def _hold_leadership(self) -> bool:
+        """Acquire or renew the leader lease; True if this process should scan"""
+        return self.lease.hold(self.redis_client)
+
+    def _release_leadership(self):
+        self.lease.release(self.redis_client)
+
+    # ------------------------------------------------------------------
+    # Scanning
+
+    def due_tickers(self, now: Optional[float] = None) -> List[str]:
+        """Tickers with active alerts whose polling interval has elapsed"""
+        now = now if now is not None else time.time()
+        tickers = self.alerts_service.active_tickers()
+
+        market_open = {}
+        due = []
+        for ticker in tickers:
+            market = market_for(ticker)
+            if market not in market_open:
+                market_open[market] = is_market_open(market)
+            interval = self.open_interval if market_open[market] else self.closed_interval
+            # Small slack so a tick scheduled exactly one interval later isn't skipped
+            if now - self._last_checked.get(ticker, 0) >= interval * 0.9:
+                due.append(ticker)
+
+        # Forget tickers whose alerts are all gone
+        active = set(tickers)
+        for ticker in list(self._last_checked):
+            if ticker not in active:
+                del self._last_checked[ticker]
+        return due
+
+    def scan(self) -> List[Dict]:
+        """
+        Fetch quotes for the due tickers and fire crossed alerts
+
+        Returns:
+            Triggered alerts
+        """
+        start = time.perf_counter()
+        due = self.due_tickers()
+        triggered = []
+
+        for i in range(0, len(due), self.batch_size):
+            batch = due[i:i + self.batch_size]
+            quotes = self.price_service.get_multiple_prices(
+                batch, timeout=self.batch_timeout, max_age=self.quote_max_age
+            )
+            self.quotes_fetched += len(quotes)
+
+            now = time.time()
+            for ticker in quotes:
+                self._last_checked[ticker] = now
+
+            prices = {ticker: quote['price'] for ticker, quote in quotes.items() if quote.get('price')}
+            if prices:
+                triggered.extend(self.alerts_service.check_prices(prices))
+
+            # Long scans must not outlive the lease
+            if i + self.batch_size < len(due) and not self._hold_leadership():
+                logger.warning("Alert scheduler lost leadership mid-scan")
+                break
+
+        if triggered:
+            self.alerts_triggered += len(triggered)
+            ALERTS_TRIGGERED.inc(len(triggered))
+            try:
+                self.notifier(triggered)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Alert notification failed: {str(e)}")
+
+        self.scans += 1
+        self.last_scan = datetime.now().isoformat()
+        ALERT_SCAN_LATENCY.observe(time.perf_counter() - start)
+        return triggered
+
+    def _notify_by_email(self, alerts: List[Dict]):
+        """Default notifier: queue the emails in the notification outbox"""
+        self.alerts_service.notify_triggered(alerts)
+
+    def get_stats(self) -> Dict:
+        """Get scheduler statistics"""
+        return {
+            'enabled': self.enabled,
+            'leader': self.lease.is_leader,
+            'tracked_tickers': len(self._last_checked),
+            'scans': self.scans,
+            'quotes_fetched': self.quotes_fetched,
+            'alerts_triggered': self.alerts_triggered,
+            'last_scan': self.last_scan,
+            'errors': self.errors
+        }
+
+
+# Global instance
+alert_scheduler = AlertScheduler()
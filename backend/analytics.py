@@ -4,8 +4,10 @@ import json
 import os
 from datetime import datetime, timedelta
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, deque
+from itertools import islice
 import time
+from analytics_writer import AnalyticsWriter
 
 class AnalyticsService:
     """Enhanced analytics with real-time tracking and insights"""
@@ -13,19 +15,21 @@ class AnalyticsService:
     def __init__(self):
         self.analytics_dir = Path('/opt/stonkmarketanalyzer/analytics')
         self.analytics_dir.mkdir(parents=True, exist_ok=True)
-        self.daily_file = self.analytics_dir / f"analytics_{datetime.now().strftime('%Y-%m-%d')}.jsonl"
+        
+        # Batched daily-file writes off the request thread
+        self.writer = AnalyticsWriter(self.analytics_dir)
         
         # Real-time activity tracking (in-memory)
-        self.recent_activity = []  # Last 100 events
         self.max_recent = 100
+        self.recent_activity = deque(maxlen=self.max_recent)  # Last 100 events
         
         # Performance tracking
-        self.response_times = []  # Last 1000 response times
         self.max_response_times = 1000
+        self.response_times = deque(maxlen=self.max_response_times)  # Last 1000 response times
         
         # Error tracking
-        self.recent_errors = []  # Last 50 errors
         self.max_errors = 50
+        self.recent_errors = deque(maxlen=self.max_errors)  # Last 50 errors
     
     def track_event(self, event_data):
         """Store analytics event"""
@@ -33,14 +37,12 @@ class AnalyticsService:
             # Add server timestamp
             event_data['server_timestamp'] = datetime.now().isoformat()
             
-            # Append to daily file
-            with open(self.daily_file, 'a') as f:
-                f.write(json.dumps(event_data) + '\n')
+            # Queue for the background writer (flushed in batches)
+            if not self.writer.write(event_data):
+                return False
             
             # Add to recent activity (in-memory)
             self.recent_activity.append(event_data)
-            if len(self.recent_activity) > self.max_recent:
-                self.recent_activity.pop(0)
             
             return True
         except Exception as e:
@@ -54,8 +56,6 @@ class AnalyticsService:
             'duration_ms': duration_ms,
             'timestamp': time.time()
         })
-        if len(self.response_times) > self.max_response_times:
-            self.response_times.pop(0)
     
     def track_error(self, error_type, error_message, stack_trace=None):
         """Track error occurrence"""
@@ -65,8 +65,6 @@ class AnalyticsService:
             'stack_trace': stack_trace,
             'timestamp': datetime.now().isoformat()
         })
-        if len(self.recent_errors) > self.max_errors:
-            self.recent_errors.pop(0)
     
     def get_stats(self, date=None):
         """Get analytics stats for a specific date"""
@@ -142,7 +140,7 @@ class AnalyticsService:
     
     def get_recent_activity(self, limit=50):
         """Get recent activity feed"""
-        return self.recent_activity[-limit:][::-1]  # Most recent first
+        return list(islice(reversed(self.recent_activity), limit))  # Most recent first
     
     def get_performance_stats(self):
         """Get API performance statistics"""
@@ -179,7 +177,7 @@ class AnalyticsService:
     
     def get_recent_errors(self, limit=20):
         """Get recent errors"""
-        return self.recent_errors[-limit:][::-1]
+        return list(islice(reversed(self.recent_errors), limit))
     
     def get_hourly_stats(self, date=None):
         """Get hourly breakdown of activity"""
@@ -0,0 +1,220 @@
+"""
+Incremental Analytics Aggregates
+Per-day counters maintained by tailing the daily JSONL files from a byte offset
+"""
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Events that involve stock analysis
+STOCK_EVENTS = frozenset([
+    'stock_search', 'stock_analysis', 'research_fundamentals',
+    'research_news', 'research_technical', 'research_overview',
+    'chat_query', 'stock_comparison'
+])
+
+
+class DailyAggregate:
+    """Running totals for one day of analytics events"""
+
+    def __init__(self, date: str):
+        self.date = date
+        self.offset = 0  # Bytes of the daily file already folded in
+
+        self.total_events = 0
+        self.events = Counter()
+        self.users = set()
+        self.sessions = set()
+        self.tickers = Counter()
+        # YYYY-MM-DDTHH -> {'events': int, 'users': set, 'sessions': set}
+        self.hourly = {}
+
+    def add(self, event: Dict):
+        """Fold one event into the counters"""
+        self.total_events += 1
+        self.events[event.get('event', 'unknown')] += 1
+
+        user_id = event.get('userId')
+        session_id = event.get('sessionId')
+        if 'userId' in event:
+            self.users.add(user_id)
+        if 'sessionId' in event:
+            self.sessions.add(session_id)
+
+        timestamp = event.get('server_timestamp', event.get('timestamp', ''))
+        if timestamp:
+            hour = timestamp[:13]  # YYYY-MM-DDTHH
+            bucket = self.hourly.get(hour)
+            if bucket is None:
+                bucket = self.hourly[hour] = {'events': 0, 'users': set(), 'sessions': set()}
+            bucket['events'] += 1
+            if 'userId' in event:
+                bucket['users'].add(user_id)
+            if 'sessionId' in event:
+                bucket['sessions'].add(session_id)
+
+        ticker = event.get('ticker', '')
+        if ticker and event.get('event', '') in STOCK_EVENTS:
+            # Comparison events carry "AAPL,TSLA"
+            for t in ticker.split(','):
+                t = t.strip()
+                if t:
+                    self.tickers[t] += 1
+
+    def daily_stats(self) -> Dict:
+        """Totals and unique counts for the day"""
+        return {
+            'date': self.date,
+            'total_events': self.total_events,
+            'unique_users': len(self.users),
+            'unique_sessions': len(self.sessions),
+            'events': dict(self.events)
+        }
+
+    def hourly_stats(self) -> List[Dict]:
+        """Per-hour counts, oldest first"""
+        return [
+            {
+                'hour': hour,
+                'events': data['events'],
+                'users': len(data['users']),
+                'sessions': len(data['sessions'])
+            }
+            for hour, data in sorted(self.hourly.items())
+        ]
+
+    def feature_usage(self) -> Dict:
+        """Event counts by type"""
+        return dict(self.events)
+
+    def popular_stocks(self, limit: int = 10) -> List[Dict]:
+        """Most analyzed tickers"""
+        return [{'ticker': ticker, 'count': count} for ticker, count in self.tickers.most_common(limit)]
+
+
+class AggregateStore:
+    """
+    Keeps a DailyAggregate per day in sync with its JSONL file
+
+    Every gunicorn worker appends to the same daily file, so the file is the
+    source of truth: catching up reads only the bytes appended since the last
+    call, and dashboard reads become O(new events) instead of O(all events).
+    """
+
+    def __init__(self, analytics_dir: Path, max_days: int = None):
+        """
+        Args:
+            analytics_dir: Directory holding analytics_YYYY-MM-DD.jsonl files
+            max_days: Number of day aggregates kept in memory
+        """
+        self.analytics_dir = Path(analytics_dir)
+        self.max_days = max_days or int(os.getenv('ANALYTICS_AGGREGATE_DAYS', '35'))
+
+        self._days = OrderedDict()
+        # Query results for compacted (immutable) days
+        self._closed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _file_for(self, date: str) -> Path:
+        return self.analytics_dir / f"analytics_{date}.jsonl"
+
+    def _catch_up(self, agg: DailyAggregate, file_path: Path, size: int):
+        """Fold in the complete lines appended since agg.offset (lock must be held)"""
+        with open(file_path, 'rb') as f:
+            f.seek(agg.offset)
+            chunk = f.read(size - agg.offset)
+
+        # A writer may be mid-line; leave the partial tail for next time
+        end = chunk.rfind(b'\n')
+        if end < 0:
+            return
+
+        for line in chunk[:end].split(b'\n'):
+            try:
+                agg.add(json.loads(line))
+            except Exception:
+                continue
+
+        agg.offset += end + 1
+
+    def _get(self, date: str) -> Optional[DailyAggregate]:
+        """Get the up-to-date aggregate for a day (lock must be held)"""
+        file_path = self._file_for(date)
+        try:
+            size = file_path.stat().st_size
+        except FileNotFoundError:
+            self._days.pop(date, None)
+            return None
+
+        agg = self._days.get(date)
+        if agg is None or size < agg.offset:
+            # New day, or the file was truncated/replaced: rebuild
+            agg = DailyAggregate(date)
+            self._days[date] = agg
+        self._days.move_to_end(date)
+
+        if size > agg.offset:
+            self._catch_up(agg, file_path, size)
+
+        while len(self._days) > self.max_days:
+            self._days.popitem(last=False)
+
+        return agg
+
+    def _closed_query(self, date: str, query: str, *args):
+        """Answer a query from a compacted day's columns (lock must be held)"""
+        # Imported here: analytics_columnar depends on this module
+        from analytics_columnar import open_columnar
+
+        key = (date, query) + args
+        if key in self._closed:
+            self._closed.move_to_end(key)
+            return self._closed[key]
+
+        day = open_columnar(self.analytics_dir, date)
+        if day is None:
+            return None
+
+        result = getattr(day, query)(*args)
+        self._closed[key] = result
+        while len(self._closed) > self.max_days * 4:
+            self._closed.popitem(last=False)
+        return result
+
+    def _query(self, date: str, query: str, *args):
+        """Run a query against the live aggregate or the compacted columns"""
+        with self._lock:
+            agg = self._get(date)
+            if agg is not None:
+                return getattr(agg, query)(*args)
+            return self._closed_query(date, query, *args)
+
+    def catch_up(self, date: str):
+        """Fold in anything appended to a day's file"""
+        with self._lock:
+            self._get(date)
+
+    def daily_stats(self, date: str) -> Optional[Dict]:
+        """Get totals and unique counts for a day, or None if it has no data"""
+        return self._query(date, 'daily_stats')
+
+    def hourly_stats(self, date: str) -> List[Dict]:
+        """Get per-hour counts for a day"""
+        return self._query(date, 'hourly_stats') or []
+
+    def popular_stocks(self, date: str, limit: int = 10) -> List[Dict]:
+        """Get the most analyzed tickers for a day"""
+        return self._query(date, 'popular_stocks', limit) or []
+
+    def feature_usage(self, date: str) -> Dict:
+        """Get event counts by type for a day"""
+        return self._query(date, 'feature_usage') or {}
+
+    def clear(self):
+        """Drop all cached aggregates"""
+        with self._lock:
+            self._days.clear()
+            self._closed.clear()
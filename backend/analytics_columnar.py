@@ -0,0 +1,306 @@
+"""
+Columnar Analytics Storage
+Compacts closed days of JSONL events into dictionary-encoded column files
+
+File layout (analytics_YYYY-MM-DD.col):
+    MAGIC | header length (uint32, little endian) | JSON header | column blobs
+
+Each column is an array of integer codes into a per-column dictionary
+(code 0 means the field was absent), compressed with zlib. The dictionary
+is stored as its own zlib-compressed JSON blob next to the codes; the
+header only holds offsets and sizes. Queries seek to and decode only the
+columns, and only the dictionaries, they need. Only the fields the
+dashboards query are columnized; the raw JSONL is kept as
+analytics_YYYY-MM-DD.jsonl.gz so exports still see every field.
+"""
+import gzip
+import json
+import os
+import shutil
+import struct
+import sys
+import zlib
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from analytics_aggregates import STOCK_EVENTS
+
+MAGIC = b'SCOL1\n'
+COLUMNS = ('event', 'user', 'session', 'hour', 'ticker')
+
+_ABSENT = object()
+
+
+def _extract(event: Dict) -> Tuple:
+    """Column values for one event, in COLUMNS order"""
+    timestamp = event.get('server_timestamp', event.get('timestamp', ''))
+    return (
+        event.get('event', 'unknown'),
+        event['userId'] if 'userId' in event else _ABSENT,
+        event['sessionId'] if 'sessionId' in event else _ABSENT,
+        timestamp[:13] if timestamp else _ABSENT,  # YYYY-MM-DDTHH
+        event['ticker'] if 'ticker' in event else _ABSENT,
+    )
+
+
+class _ColumnEncoder:
+    """Dictionary-encodes one column while rows stream in"""
+
+    def __init__(self):
+        self.codes = {}
+        self.dictionary = [None]  # code 0 = absent
+        self.values = array('I')
+
+    def add(self, value):
+        if value is _ABSENT:
+            self.values.append(0)
+            return
+        try:
+            key = ('v', value)
+            hash(key)
+        except TypeError:
+            # Lists/dicts from odd clients: key them by their JSON form
+            key = ('j', json.dumps(value, sort_keys=True))
+        code = self.codes.get(key)
+        if code is None:
+            code = len(self.dictionary)
+            self.codes[key] = code
+            self.dictionary.append(value)
+        self.values.append(code)
+
+    def encode(self) -> Tuple[bytes, str]:
+        """Narrowest array type that fits the dictionary, zlib-compressed"""
+        size = len(self.dictionary)
+        typecode = 'B' if size <= 0xFF else 'H' if size <= 0xFFFF else 'I'
+        packed = array(typecode, self.values) if typecode != 'I' else self.values
+        if sys.byteorder != 'little':
+            packed.byteswap()
+        return zlib.compress(packed.tobytes(), 6), typecode
+
+
+def compact_file(jsonl_path: Path, col_path: Path) -> int:
+    """
+    Convert one JSONL day file into a column file
+
+    Returns:
+        Number of rows written
+    """
+    encoders = [_ColumnEncoder() for _ in COLUMNS]
+    rows = 0
+
+    with open(jsonl_path, 'rb') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except Exception:
+                continue
+            for encoder, value in zip(encoders, _extract(event)):
+                encoder.add(value)
+            rows += 1
+
+    blobs = []
+    header = {'date': col_path.stem.replace('analytics_', ''), 'rows': rows, 'columns': {}}
+    offset = 0
+    for name, encoder in zip(COLUMNS, encoders):
+        blob, typecode = encoder.encode()
+        dict_blob = zlib.compress(json.dumps(encoder.dictionary, separators=(',', ':')).encode('utf-8'), 6)
+        header['columns'][name] = {
+            'offset': offset,
+            'length': len(blob),
+            'type': typecode,
+            'dict_offset': offset + len(blob),
+            'dict_length': len(dict_blob),
+            'distinct': len(encoder.dictionary) - 1
+        }
+        blobs.append(blob)
+        blobs.append(dict_blob)
+        offset += len(blob) + len(dict_blob)
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+    tmp_path = col_path.with_suffix('.col.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        for blob in blobs:
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, col_path)
+
+    return rows
+
+
+class ColumnarDay:
+    """Read-only view of one compacted day"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not an analytics column file: {path}")
+            (header_len,) = struct.unpack('<I', f.read(4))
+            self.header = json.loads(f.read(header_len))
+        self.data_start = len(MAGIC) + 4 + header_len
+        self._dictionaries = {}
+
+    @property
+    def rows(self) -> int:
+        return self.header['rows']
+
+    def _read(self, offset: int, length: int) -> bytes:
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_start + offset)
+            return f.read(length)
+
+    def dictionary(self, name: str) -> List:
+        """Distinct values of a column; index 0 stands for absent (loaded on first use)"""
+        if name not in self._dictionaries:
+            meta = self.header['columns'][name]
+            if 'dictionary' in meta:
+                # Files compacted before dictionaries had their own blobs
+                self._dictionaries[name] = meta['dictionary']
+            else:
+                blob = self._read(meta['dict_offset'], meta['dict_length'])
+                self._dictionaries[name] = json.loads(zlib.decompress(blob))
+        return self._dictionaries[name]
+
+    def distinct(self, name: str) -> int:
+        """Number of distinct values in a column, without loading its dictionary"""
+        meta = self.header['columns'][name]
+        if 'distinct' in meta:
+            return meta['distinct']
+        return len(meta['dictionary']) - 1
+
+    def codes(self, name: str) -> array:
+        """Decode one column's codes, reading only that column's bytes"""
+        meta = self.header['columns'][name]
+        blob = self._read(meta['offset'], meta['length'])
+        values = array(meta['type'])
+        values.frombytes(zlib.decompress(blob))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values
+
+    def daily_stats(self) -> Dict:
+        """Totals and unique counts (only the event column is decoded)"""
+        names = self.dictionary('event')
+        counts = Counter(self.codes('event'))
+        return {
+            'date': self.header['date'],
+            'total_events': self.rows,
+            # Every dictionary entry occurs at least once
+            'unique_users': self.distinct('user'),
+            'unique_sessions': self.distinct('session'),
+            'events': {names[code]: counts[code] for code in sorted(counts)}
+        }
+
+    def feature_usage(self) -> Dict:
+        """Event counts by type"""
+        return self.daily_stats()['events']
+
+    def hourly_stats(self) -> List[Dict]:
+        """Per-hour counts from the hour, user and session columns"""
+        hours = self.dictionary('hour')
+        hourly = {}
+        for hour, user, session in zip(self.codes('hour'), self.codes('user'), self.codes('session')):
+            if not hour:
+                continue
+            bucket = hourly.get(hour)
+            if bucket is None:
+                bucket = hourly[hour] = [0, set(), set()]
+            bucket[0] += 1
+            if user:
+                bucket[1].add(user)
+            if session:
+                bucket[2].add(session)
+
+        return [
+            {'hour': hours[code], 'events': events, 'users': len(users), 'sessions': len(sessions)}
+            for code, (events, users, sessions) in sorted(hourly.items(), key=lambda item: hours[item[0]])
+        ]
+
+    def popular_stocks(self, limit: int = 10) -> List[Dict]:
+        """Most analyzed tickers from the event and ticker columns"""
+        events = self.dictionary('event')
+        tickers = self.dictionary('ticker')
+        stock_codes = {code for code, name in enumerate(events) if name in STOCK_EVENTS}
+
+        pairs = Counter(
+            (event, ticker)
+            for event, ticker in zip(self.codes('event'), self.codes('ticker'))
+            if ticker and event in stock_codes
+        )
+
+        counts = Counter()
+        for (_, ticker_code), count in pairs.items():
+            ticker = tickers[ticker_code]
+            if not ticker or not isinstance(ticker, str):
+                continue
+            # Comparison events carry "AAPL,TSLA"
+            for t in ticker.split(','):
+                t = t.strip()
+                if t:
+                    counts[t] += count
+
+        return [{'ticker': ticker, 'count': count} for ticker, count in counts.most_common(limit)]
+
+
+def compact_closed_days(analytics_dir: Path, min_age_minutes: int = None) -> List[str]:
+    """
+    Compact every closed day that is still stored as JSONL
+
+    A day is closed once it is before today and its file has not been
+    written for min_age_minutes (late batches from the writer can land just
+    after midnight).
+
+    Returns:
+        Dates that were compacted
+    """
+    analytics_dir = Path(analytics_dir)
+    if min_age_minutes is None:
+        min_age_minutes = int(os.getenv('ANALYTICS_COMPACT_MIN_AGE_MINUTES', '15'))
+
+    today = datetime.now().strftime('%Y-%m-%d')
+    cutoff = datetime.now() - timedelta(minutes=min_age_minutes)
+    compacted = []
+
+    for jsonl_path in sorted(analytics_dir.glob('analytics_*.jsonl')):
+        date = jsonl_path.stem.replace('analytics_', '')
+        if date >= today:
+            continue
+        if datetime.fromtimestamp(jsonl_path.stat().st_mtime) > cutoff:
+            continue
+
+        col_path = jsonl_path.with_suffix('.col')
+        rows = compact_file(jsonl_path, col_path)
+
+        # Keep the raw events (every field) for exports, compressed
+        gz_path = jsonl_path.with_name(jsonl_path.name + '.gz')
+        with open(jsonl_path, 'rb') as src, gzip.open(gz_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        jsonl_path.unlink()
+
+        print(f"📦 Compacted {date}: {rows} events")
+        compacted.append(date)
+
+    return compacted
+
+
+def open_columnar(analytics_dir: Path, date: str) -> Optional[ColumnarDay]:
+    """Open a compacted day, or None if it hasn't been compacted"""
+    path = Path(analytics_dir) / f"analytics_{date}.col"
+    if not path.exists():
+        return None
+    return ColumnarDay(path)
+
+
+if __name__ == '__main__':
+    # Run from cron, e.g. nightly: python analytics_columnar.py
+    directory = sys.argv[1] if len(sys.argv) > 1 else Path(__file__).parent / 'analytics_data'
+    done = compact_closed_days(directory)
+    print(f"Compacted {len(done)} day(s)")
@@ -1,13 +1,25 @@
 """Comprehensive Analytics System for Stonk Market Analyzer"""
 
+import csv
+import gzip
+import io
 import json
 import os
 from datetime import datetime, timedelta
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, deque
+from itertools import islice
 import time
+import threading
 import psutil
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator, Tuple
+from analytics_aggregates import AggregateStore
+from analytics_writer import AnalyticsWriter
+from analytics_columnar import compact_closed_days
+from latency_histogram import RollingHistogram
+
+# Fields available to the CSV export, in default order
+EXPORT_COLUMNS = ['date', 'event', 'userId', 'sessionId', 'timestamp', 'ticker']
 
 class ComprehensiveAnalytics:
     """Complete analytics system with all admin features"""
@@ -17,18 +29,32 @@ class ComprehensiveAnalytics:
         self.analytics_dir = Path(__file__).parent / 'analytics_data'
         self.analytics_dir.mkdir(parents=True, exist_ok=True)
         
-        # In-memory tracking
-        self.recent_activity = []
-        self.response_times = []
-        self.recent_errors = []
-        self.api_calls = defaultdict(int)
-        self.cache_hits = 0
-        self.cache_misses = 0
+        # Per-day counters, kept in sync with the daily files incrementally
+        self.aggregates = AggregateStore(self.analytics_dir)
+        
+        # Batched daily-file writes; aggregates catch up after each flush
+        self.writer = AnalyticsWriter(self.analytics_dir, on_flush=self.aggregates.catch_up)
         
         # Limits
         self.max_recent = 200
         self.max_response_times = 2000
         self.max_errors = 100
+        self.slow_query_ms = 2000
+        
+        # In-memory tracking (fixed-size ring buffers)
+        self.recent_activity = deque(maxlen=self.max_recent)
+        self.response_times = deque(maxlen=self.max_response_times)
+        self.recent_errors = deque(maxlen=self.max_errors)
+        self.api_calls = defaultdict(int)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # Streaming latency histograms, overall and per endpoint
+        self.latency_window = int(os.getenv('PERF_WINDOW_SECONDS', '3600'))
+        self.latency = RollingHistogram(self.latency_window)
+        self.endpoint_latency = {}
+        self._latency_lock = threading.Lock()
+        self.max_export_days = int(os.getenv('ANALYTICS_EXPORT_MAX_DAYS', '92'))
     
     def track_event(self, event_data: Dict[str, Any]) -> bool:
         """Track any analytics event with enriched data"""
@@ -36,17 +62,14 @@ class ComprehensiveAnalytics:
             # Enrich event data
             event_data['server_timestamp'] = datetime.now().isoformat()
             
-            # Add to daily file
-            daily_file = self.analytics_dir / f"analytics_{datetime.now().strftime('%Y-%m-%d')}.jsonl"
-            with open(daily_file, 'a') as f:
-                f.write(json.dumps(event_data) + '\n')
+            # Queue for the background writer (flushed in batches)
+            if not self.writer.write(event_data):
+                return False
             
             # Add to recent activity with better formatting
             if event_data.get('event') not in ['page_hidden', 'page_visible', 'heartbeat']:
                 activity_item = self._format_activity(event_data)
                 self.recent_activity.append(activity_item)
-                if len(self.recent_activity) > self.max_recent:
-                    self.recent_activity.pop(0)
             
             return True
         except Exception as e:
@@ -85,11 +108,15 @@ class ComprehensiveAnalytics:
             'timestamp': time.time()
         })
         
-        if len(self.response_times) > self.max_response_times:
-            self.response_times.pop(0)
+        histogram = self.endpoint_latency.get(endpoint)
+        if histogram is None:
+            with self._latency_lock:
+                histogram = self.endpoint_latency.setdefault(endpoint, RollingHistogram(self.latency_window))
+        histogram.record(duration_ms)
+        self.latency.record(duration_ms)
         
         # Track slow queries
-        if duration_ms > 2000:  # Slower than 2 seconds
+        if duration_ms > self.slow_query_ms:  # Slower than 2 seconds
             self.track_error('slow_query', f"{endpoint} took {duration_ms}ms")
     
     def track_error(self, error_type: str, message: str, stack_trace: str = None):
@@ -100,9 +127,6 @@ class ComprehensiveAnalytics:
             'stack_trace': stack_trace,
             'timestamp': datetime.now().isoformat()
         })
-        
-        if len(self.recent_errors) > self.max_errors:
-            self.recent_errors.pop(0)
     
     def track_cache(self, hit: bool):
         """Track cache hit/miss"""
@@ -113,43 +137,32 @@ class ComprehensiveAnalytics:
     
     def get_recent_activity(self, limit: int = 50) -> List[Dict]:
         """Get formatted recent activity"""
-        return self.recent_activity[-limit:][::-1]
+        return list(islice(reversed(self.recent_activity), limit))
     
     def get_performance_metrics(self) -> Dict:
-        """Get comprehensive performance metrics"""
-        if not self.response_times:
-            return {
-                'avg_response_time': 0,
-                'min_response_time': 0,
-                'max_response_time': 0,
-                'total_requests': 0,
-                'slow_queries': 0,
-                'by_endpoint': {}
-            }
-        
-        times = [r['duration_ms'] for r in self.response_times]
-        slow_queries = len([t for t in times if t > 2000])
-        
-        # Group by endpoint
-        by_endpoint = defaultdict(list)
-        for r in self.response_times:
-            by_endpoint[r['endpoint']].append(r['duration_ms'])
-        
-        endpoint_stats = {
-            endpoint: {
-                'avg': sum(times) / len(times),
-                'count': len(times),
-                'max': max(times)
-            }
-            for endpoint, times in by_endpoint.items()
-        }
+        """
+        Get comprehensive performance metrics
+        Percentiles come from the rolling histograms (last 1-2 windows)
+        """
+        overall = self.latency.snapshot()
+        summary = overall.summary()
+        
+        endpoint_stats = {}
+        for endpoint, histogram in list(self.endpoint_latency.items()):
+            stats = histogram.summary()
+            if stats['count']:
+                endpoint_stats[endpoint] = stats
         
         return {
-            'avg_response_time': sum(times) / len(times),
-            'min_response_time': min(times),
-            'max_response_time': max(times),
-            'total_requests': len(times),
-            'slow_queries': slow_queries,
+            'avg_response_time': summary['avg'],
+            'min_response_time': summary['min'],
+            'max_response_time': summary['max'],
+            'p50_response_time': summary['p50'],
+            'p95_response_time': summary['p95'],
+            'p99_response_time': summary['p99'],
+            'total_requests': summary['count'],
+            'slow_queries': overall.count_above(self.slow_query_ms),
+            'window_seconds': self.latency_window,
             'by_endpoint': endpoint_stats
         }
     
@@ -167,7 +180,7 @@ class ComprehensiveAnalytics:
     
     def get_recent_errors(self, limit: int = 20) -> List[Dict]:
         """Get recent errors"""
-        return self.recent_errors[-limit:][::-1]
+        return list(islice(reversed(self.recent_errors), limit))
     
     def get_revenue_metrics(self, date: str = None) -> Dict:
         """Calculate revenue/usage metrics"""
@@ -195,22 +208,7 @@ class ComprehensiveAnalytics:
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
         
-        file_path = self.analytics_dir / f"analytics_{date}.jsonl"
-        if not file_path.exists():
-            return {}
-        
-        features = defaultdict(int)
-        
-        with open(file_path, 'r') as f:
-            for line in f:
-                try:
-                    event = json.loads(line)
-                    event_type = event.get('event', 'unknown')
-                    features[event_type] += 1
-                except:
-                    continue
-        
-        return dict(features)
+        return self.aggregates.feature_usage(date)
     
     def get_user_behavior(self, date: str = None) -> Dict:
         """Analyze user behavior patterns"""
@@ -253,9 +251,8 @@ class ComprehensiveAnalytics:
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
         
-        file_path = self.analytics_dir / f"analytics_{date}.jsonl"
-        
-        if not file_path.exists():
+        stats = self.aggregates.daily_stats(date)
+        if stats is None:
             return {
                 'date': date,
                 'total_events': 0,
@@ -264,113 +261,21 @@ class ComprehensiveAnalytics:
                 'events': {}
             }
         
-        events = []
-        users = set()
-        sessions = set()
-        event_counts = defaultdict(int)
-        
-        with open(file_path, 'r') as f:
-            for line in f:
-                try:
-                    event = json.loads(line)
-                    events.append(event)
-                    
-                    if 'userId' in event:
-                        users.add(event['userId'])
-                    if 'sessionId' in event:
-                        sessions.add(event['sessionId'])
-                    
-                    event_name = event.get('event', 'unknown')
-                    event_counts[event_name] += 1
-                except:
-                    continue
-        
-        return {
-            'date': date,
-            'total_events': len(events),
-            'unique_users': len(users),
-            'unique_sessions': len(sessions),
-            'events': dict(event_counts)
-        }
+        return stats
     
     def get_hourly_stats(self, date: str = None) -> List[Dict]:
         """Get hourly breakdown"""
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
         
-        file_path = self.analytics_dir / f"analytics_{date}.jsonl"
-        
-        if not file_path.exists():
-            return []
-        
-        hourly = defaultdict(lambda: {'events': 0, 'users': set(), 'sessions': set()})
-        
-        with open(file_path, 'r') as f:
-            for line in f:
-                try:
-                    event = json.loads(line)
-                    timestamp = event.get('server_timestamp', event.get('timestamp', ''))
-                    if timestamp:
-                        hour = timestamp[:13]  # YYYY-MM-DDTHH
-                        hourly[hour]['events'] += 1
-                        if 'userId' in event:
-                            hourly[hour]['users'].add(event['userId'])
-                        if 'sessionId' in event:
-                            hourly[hour]['sessions'].add(event['sessionId'])
-                except:
-                    continue
-        
-        return [
-            {
-                'hour': hour,
-                'events': data['events'],
-                'users': len(data['users']),
-                'sessions': len(data['sessions'])
-            }
-            for hour, data in sorted(hourly.items())
-        ]
+        return self.aggregates.hourly_stats(date)
     
     def get_popular_stocks(self, date: str = None, limit: int = 10) -> List[Dict]:
         """Get most analyzed stocks"""
         if date is None:
             date = datetime.now().strftime('%Y-%m-%d')
         
-        file_path = self.analytics_dir / f"analytics_{date}.jsonl"
-        
-        if not file_path.exists():
-            return []
-        
-        stock_counts = defaultdict(int)
-        
-        # Events that involve stock analysis
-        stock_events = [
-            'stock_search', 'stock_analysis', 'research_fundamentals', 
-            'research_news', 'research_technical', 'research_overview',
-            'chat_query', 'stock_comparison'
-        ]
-        
-        with open(file_path, 'r') as f:
-            for line in f:
-                try:
-                    event = json.loads(line)
-                    event_type = event.get('event', '')
-                    ticker = event.get('ticker', '')
-                    
-                    # Count any stock-related event with a ticker
-                    if event_type in stock_events and ticker:
-                        # Handle comparison events (ticker format: "AAPL,TSLA")
-                        if ',' in ticker:
-                            for t in ticker.split(','):
-                                t = t.strip()
-                                if t:
-                                    stock_counts[t] += 1
-                        else:
-                            stock_counts[ticker] += 1
-                except:
-                    continue
-        
-        sorted_stocks = sorted(stock_counts.items(), key=lambda x: x[1], reverse=True)
-        return [{'ticker': ticker, 'count': count} for ticker, count in sorted_stocks[:limit]]
+        return self.aggregates.popular_stocks(date, limit)
     
     def get_weekly_trend(self, days: int = 7) -> List[Dict]:
         """Get weekly trend data"""
@@ -388,34 +293,93 @@ class ComprehensiveAnalytics:
         
         return trend[::-1]  # Oldest first
     
-    def export_csv(self, date: str = None) -> str:
-        """Export to CSV"""
-        if date is None:
-            date = datetime.now().strftime('%Y-%m-%d')
-        
+    def _open_day(self, date: str):
+        """Open a day's raw events, live or archived by compaction"""
         file_path = self.analytics_dir / f"analytics_{date}.jsonl"
+        if file_path.exists():
+            return open(file_path, 'r')
+        
+        archive_path = self.analytics_dir / f"analytics_{date}.jsonl.gz"
+        if archive_path.exists():
+            return gzip.open(archive_path, 'rt')
+        
+        return None
+    
+    def compact_closed_days(self) -> List[str]:
+        """Convert finished days to the columnar format"""
+        compacted = compact_closed_days(self.analytics_dir)
+        self.aggregates.clear()
+        return compacted
+    
+    def plan_export(self, start_date: str = None, end_date: str = None,
+                    columns: List[str] = None) -> Tuple[List[str], List[str]]:
+        """
+        Validate export parameters
+        
+        Returns:
+            (dates, columns) to export
+            
+        Raises:
+            ValueError: On a bad date, an unknown column or too long a range
+        """
+        today = datetime.now().strftime('%Y-%m-%d')
+        start = datetime.strptime(start_date or today, '%Y-%m-%d')
+        end = datetime.strptime(end_date or start_date or today, '%Y-%m-%d')
+        if end < start:
+            raise ValueError("end date is before start date")
+        
+        days = (end - start).days + 1
+        if days > self.max_export_days:
+            raise ValueError(f"Export range is limited to {self.max_export_days} days")
+        
+        columns = columns or list(EXPORT_COLUMNS)
+        unknown = [c for c in columns if c not in EXPORT_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown export columns: {', '.join(unknown)}")
+        
+        dates = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+        return dates, columns
+    
+    def iter_export_csv(self, dates: List[str], columns: List[str],
+                        chunk_size: int = 64 * 1024) -> Iterator[str]:
+        """
+        Stream events as CSV, one day file at a time
+        
+        Only one chunk of rows is held in memory, so memory stays flat
+        however many days are exported.
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(columns)
+        
+        for date in dates:
+            f = self._open_day(date)
+            if f is None:
+                continue
+            
+            with f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    
+                    writer.writerow([
+                        date if column == 'date' else event.get(column, '')
+                        for column in columns
+                    ])
+                    
+                    if buffer.tell() >= chunk_size:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate(0)
         
-        if not file_path.exists():
-            return "date,event,userId,sessionId,timestamp,ticker\n"
-        
-        csv_lines = ["date,event,userId,sessionId,timestamp,ticker"]
-        
-        with open(file_path, 'r') as f:
-            for line in f:
-                try:
-                    event = json.loads(line)
-                    csv_lines.append(
-                        f"{date},"
-                        f"{event.get('event', '')},"
-                        f"{event.get('userId', '')},"
-                        f"{event.get('sessionId', '')},"
-                        f"{event.get('timestamp', '')},"
-                        f"{event.get('ticker', '')}"
-                    )
-                except:
-                    continue
-        
-        return '\n'.join(csv_lines)
+        yield buffer.getvalue()
+    
+    def export_csv(self, date: str = None) -> str:
+        """Export to CSV"""
+        dates, columns = self.plan_export(date, date)
+        return ''.join(self.iter_export_csv(dates, columns))
     
     def get_stats(self, date: str = None) -> Dict:
         """Alias for get_daily_stats for backward compatibility"""
@@ -0,0 +1,251 @@
+"""
+Buffered Analytics Writer
+Batches analytics events off the request thread into daily JSONL files
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from metrics import ANALYTICS_DROPPED, ANALYTICS_QUEUE
+
+# What to do with a new event when the queue is full
+POLICY_DROP_NEWEST = 'drop_newest'
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_BLOCK = 'block'
+
+
+class AnalyticsWriter:
+    """
+    Background appender for analytics_YYYY-MM-DD.jsonl files
+
+    - Events go into a bounded queue; track_event never touches the disk
+    - A writer thread flushes batches when batch_size events are waiting or
+      flush_interval seconds have passed, whichever comes first
+    - One O_APPEND file descriptor is kept open per day and swapped at
+      midnight; each batch is a single write, so lines from several gunicorn
+      workers never interleave
+    - Pending events are flushed at interpreter exit
+    """
+
+    def __init__(self, analytics_dir: Path, max_queue: Optional[int] = None,
+                 batch_size: Optional[int] = None, flush_interval: Optional[float] = None,
+                 policy: Optional[str] = None, block_timeout: Optional[float] = None,
+                 on_flush: Optional[Callable[[str], Any]] = None):
+        """
+        Args:
+            analytics_dir: Directory for the daily files
+            max_queue: Events buffered before the backpressure policy applies
+            batch_size: Flush as soon as this many events are waiting
+            flush_interval: Max seconds an event waits before being written
+            policy: 'drop_newest', 'drop_oldest' or 'block' when the queue is full
+            block_timeout: Max seconds the 'block' policy waits before dropping
+            on_flush: Called with the date of every file written to
+        """
+        self.analytics_dir = Path(analytics_dir)
+        self.max_queue = max_queue or int(os.getenv('ANALYTICS_QUEUE_SIZE', '10000'))
+        self.batch_size = batch_size or int(os.getenv('ANALYTICS_BATCH_SIZE', '200'))
+        self.flush_interval = flush_interval or float(os.getenv('ANALYTICS_FLUSH_INTERVAL', '1.0'))
+        self.policy = policy or os.getenv('ANALYTICS_QUEUE_POLICY', POLICY_DROP_NEWEST)
+        self.block_timeout = block_timeout if block_timeout is not None else float(os.getenv('ANALYTICS_BLOCK_TIMEOUT', '0.05'))
+        self.on_flush = on_flush
+
+        if self.policy not in (POLICY_DROP_NEWEST, POLICY_DROP_OLDEST, POLICY_BLOCK):
+            raise ValueError(f"Unknown analytics queue policy: {self.policy}")
+
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._fd = None
+        self._fd_date = None
+        # Serializes disk writes between the writer thread and flush()/close()
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopped = False
+
+        # Statistics
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.errors = 0
+
+        atexit.register(self.close)
+
+    def _ensure_thread(self):
+        """Start the writer thread (again after a fork)"""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            # A forked child inherits the parent's descriptor but not its thread
+            self._fd = None
+            self._fd_date = None
+            self._thread = threading.Thread(target=self._run, name='analytics-writer', daemon=True)
+            self._thread.start()
+
+    def write(self, event: Dict) -> bool:
+        """
+        Queue an event for writing
+
+        Returns:
+            True if the event was queued, False if backpressure dropped it
+        """
+        if self._stopped:
+            return False
+        self._ensure_thread()
+
+        try:
+            if self.policy == POLICY_BLOCK:
+                self._queue.put(event, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(event)
+        except queue.Full:
+            if self.policy != POLICY_DROP_OLDEST:
+                self.dropped += 1
+                ANALYTICS_DROPPED.inc()
+                return False
+            # Make room by discarding the oldest buffered event
+            try:
+                self._queue.get_nowait()
+                self.dropped += 1
+                ANALYTICS_DROPPED.inc()
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+                ANALYTICS_DROPPED.inc()
+                return False
+
+        self.enqueued += 1
+        return True
+
+    def _run(self):
+        """Writer thread: collect batches and write them out"""
+        while not self._stopped:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            ANALYTICS_QUEUE.set(self._queue.qsize())
+            with self._write_lock:
+                if batch:
+                    self._write_batch(batch)
+                else:
+                    # Idle: let go of yesterday's file after midnight
+                    self._rotate_if_needed(datetime.now().strftime('%Y-%m-%d'))
+
+    def _event_date(self, event: Dict) -> str:
+        """Day an event belongs to, from its server timestamp"""
+        timestamp = event.get('server_timestamp') or ''
+        return timestamp[:10] if len(timestamp) >= 10 else datetime.now().strftime('%Y-%m-%d')
+
+    def _rotate_if_needed(self, date: str):
+        """Point the open descriptor at date's file (write lock must be held)"""
+        if self._fd is not None and self._fd_date == date:
+            return
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+            self._fd_date = None
+
+    def _open(self, date: str) -> int:
+        """Get the descriptor for date's file (write lock must be held)"""
+        self._rotate_if_needed(date)
+        if self._fd is None:
+            path = self.analytics_dir / f"analytics_{date}.jsonl"
+            self._fd = os.open(str(path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._fd_date = date
+        return self._fd
+
+    def _write_batch(self, batch):
+        """Append a batch, one write per day touched (write lock must be held)"""
+        by_date = {}
+        for event in batch:
+            try:
+                line = json.dumps(event) + '\n'
+            except (TypeError, ValueError) as e:
+                self.errors += 1
+                print(f"Analytics serialization error: {e}")
+                continue
+            by_date.setdefault(self._event_date(event), []).append(line)
+
+        for date, lines in by_date.items():
+            data = ''.join(lines).encode('utf-8')
+            try:
+                fd = self._open(date)
+                view = memoryview(data)
+                while view:
+                    written = os.write(fd, view)
+                    view = view[written:]
+                self.written += len(lines)
+                self.batches += 1
+            except OSError as e:
+                self.errors += 1
+                print(f"Analytics write error: {e}")
+                self._rotate_if_needed(None)
+                continue
+
+            if self.on_flush:
+                try:
+                    self.on_flush(date)
+                except Exception as e:
+                    print(f"Analytics flush callback error: {e}")
+
+    def flush(self):
+        """Write everything queued so far from the calling thread"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        with self._write_lock:
+            if batch:
+                self._write_batch(batch)
+
+    def close(self):
+        """Flush pending events and release the file descriptor"""
+        if self._stopped:
+            return
+        self._stopped = True
+
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+        with self._write_lock:
+            self._rotate_if_needed(None)
+
+    def get_stats(self) -> Dict:
+        """Get queue and throughput statistics"""
+        return {
+            'queued': self._queue.qsize(),
+            'max_queue': self.max_queue,
+            'policy': self.policy,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'errors': self.errors
+        }
@@ -1,21 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
+import json
 import hashlib
 
 # Load environment variables FIRST before any other imports
 load_dotenv()
 
 from services.perplexity_service import PerplexityService
-from services.stock_price_service import stock_price_service
+from services.quote_store import quote_store
 from prompts.templates import prompt_templates, free_chat_template
 from analytics import AnalyticsService
 from analytics_comprehensive import ComprehensiveAnalytics
 from secure_portal import setup_portal_routes
 from cache import SimpleCache
-from cache_enhanced import EnhancedCache
+from cache_enhanced import EnhancedCache, SingleFlight, RefreshAhead
+from cache_ttl import CACHE_TTL, ttl_for_step
 from auth_routes import auth_bp
+from metrics import init_metrics
+from alert_scheduler import alert_scheduler
+from market_overview_service import market_overview_service
+from notification_outbox import notification_outbox
 import time
 from functools import wraps
 
@@ -44,15 +50,21 @@ analytics_service = ComprehensiveAnalytics()
 redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 response_cache = EnhancedCache(redis_url=redis_url, default_ttl=3600)
 
-# Cache TTL strategy (in seconds)
-CACHE_TTL = {
-    'fundamentals': 86400,  # 24 hours - changes slowly
-    'news': 3600,           # 1 hour - changes frequently  
-    'technical': 14400,     # 4 hours - moderate
-    'chat': 1800,           # 30 minutes - conversational
-    'comparison': 7200,     # 2 hours - moderate
-    'overview': 14400,      # 4 hours
-}
+# Coalesce identical in-flight Perplexity calls (across workers via Redis)
+llm_flight = SingleFlight(response_cache)
+
+# Regenerate popular guided research entries before they expire
+refresh_ahead = RefreshAhead(response_cache)
+
+# Evaluate price alerts in the background (one worker wins the Redis lease)
+alert_scheduler.start(redis_client=response_cache.redis_client)
+
+# Keep market overview snapshots warm (one worker refreshes, all serve)
+market_overview_service.start_background_refresh(shared_cache=response_cache)
+
+# Deliver queued emails (password resets, alerts) off the request threads
+# (one worker wins the Redis lease, so send-rate limits hold deployment-wide)
+notification_outbox.start(redis_client=response_cache.redis_client)
 
 # Performance tracking decorator
 def track_performance(endpoint_name):
@@ -79,10 +91,30 @@ portal_path, portal_username = setup_portal_routes(app, analytics_service)
 print(f"🔒 Secure portal initialized at: /api/{portal_path}")
 print(f"🔑 Portal username: {portal_username}")
 
+# Prometheus metrics for every route (portal path kept out of labels)
+init_metrics(app, hidden_segments=[portal_path])
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok', 'message': 'Stock Research API is running'})
 
+def _generate_guided(step, ticker, horizon, risk_level):
+    """Run one guided research step against Perplexity"""
+    # Get the prompt template and inject user inputs
+    template_func = prompt_templates[step]['template']
+    prompt = template_func(ticker, horizon, risk_level)
+    
+    # Call Perplexity API
+    response = perplexity_service.query(prompt)
+    
+    return {
+        'step': step,
+        'ticker': ticker,
+        'response': response['content'],
+        'citations': response.get('citations', []),
+        'cached': False
+    }
+
 @app.route('/api/research/guided', methods=['POST'])
 @track_performance('/api/research/guided')
 def guided_research():
@@ -94,8 +126,6 @@ def guided_research():
         horizon = data.get('horizon', '1-3 years')
         risk_level = data.get('riskLevel', 'moderate')
         
-        print(f"[DEBUG] Guided research request: step={step}, ticker={ticker}")
-        
         if not ticker:
             return jsonify({'error': 'Ticker is required'}), 400
         
@@ -111,40 +141,32 @@ def guided_research():
             risk=risk_level
         )
         
+        def generate():
+            return _generate_guided(step, ticker, horizon, risk_level)
+        
+        # Determine TTL based on step type
+        ttl = ttl_for_step(step)
+        
         # Check cache first
         cached_result = response_cache.get(cache_key)
         if cached_result:
             print(f"[CACHE HIT] {ticker} - {step}")
             analytics_service.track_cache(hit=True)
+            # Popular entry close to expiry: regenerate it in the background
+            if refresh_ahead.on_hit(cache_key, ttl, generate):
+                print(f"[REFRESH AHEAD] {ticker} - {step}")
             cached_result['cached'] = True
             return jsonify(cached_result)
         
         print(f"[CACHE MISS] {ticker} - {step} - Calling API...")
         analytics_service.track_cache(hit=False)
         
-        # Get the prompt template and inject user inputs
-        template_func = prompt_templates[step]['template']
-        prompt = template_func(ticker, horizon, risk_level)
-        
-        # Call Perplexity API
-        response = perplexity_service.query(prompt)
-        
-        print(f"[DEBUG] API call successful")
-        
-        result = {
-            'step': step,
-            'ticker': ticker,
-            'response': response['content'],
-            'citations': response.get('citations', []),
-            'cached': False
-        }
-        
-        # Determine TTL based on step type
-        ttl = CACHE_TTL.get(step, 3600)  # Default 1 hour
-        
-        # Cache the result
-        response_cache.set(cache_key, result, ttl)
-        print(f"[CACHE SET] {ticker} - {step} (TTL: {ttl}s)")
+        # One API call per cache key, shared by every concurrent request
+        result, shared = llm_flight.do(cache_key, generate, ttl)
+        if shared:
+            print(f"[COALESCED] {ticker} - {step}")
+        else:
+            print(f"[CACHE SET] {ticker} - {step} (TTL: {ttl}s)")
         
         return jsonify(result)
     
@@ -184,25 +206,171 @@ def free_chat():
         print(f"[CACHE MISS] Chat: {ticker} - Calling API...")
         analytics_service.track_cache(hit=False)
         
-        # Generate prompt for free chat
-        prompt = free_chat_template(ticker, question)
+        def generate():
+            # Generate prompt for free chat
+            prompt = free_chat_template(ticker, question)
+            
+            # Call Perplexity API
+            response = perplexity_service.query(prompt)
+            
+            return {
+                'ticker': ticker,
+                'question': question,
+                'response': response['content'],
+                'citations': response.get('citations', []),
+                'cached': False
+            }
         
-        # Call Perplexity API
-        response = perplexity_service.query(prompt)
+        # Cache for 30 minutes (chat responses change more frequently)
+        result, shared = llm_flight.do(cache_key, generate, CACHE_TTL['chat'])
+        if shared:
+            print(f"[COALESCED] Chat: {ticker}")
+        else:
+            print(f"[CACHE SET] Chat: {ticker} (TTL: {CACHE_TTL['chat']}s)")
         
-        result = {
-            'ticker': ticker,
-            'question': question,
-            'response': response['content'],
-            'citations': response.get('citations', []),
-            'cached': False
+        return jsonify(result)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _sse(payload):
+    """Format a dict as one server-sent event"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+def _sse_response(events):
+    """Wrap an event generator in an unbuffered text/event-stream response"""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
         }
+    )
+
+def _stream_completion(prompt, result, cache_key, ttl, label):
+    """
+    Forward Perplexity tokens as server-sent events
+    
+    Emits {"type": "token"} events while the completion streams, then one
+    {"type": "done"} event carrying the same fields as the JSON endpoint.
+    The assembled result is written to response_cache when the stream ends.
+    """
+    def events():
+        try:
+            for event in perplexity_service.query_stream(prompt):
+                if not event.get('done'):
+                    yield _sse({'type': 'token', 'content': event['delta']})
+                    continue
+                
+                final = {
+                    **result,
+                    'response': event['content'],
+                    'citations': event.get('citations', []),
+                    'cached': False
+                }
+                
+                if final['response']:
+                    response_cache.set(cache_key, final, ttl)
+                    print(f"[CACHE SET] {label} (TTL: {ttl}s)")
+                
+                yield _sse({'type': 'done', **final})
+        except Exception as e:
+            print(f"[ERROR] Stream failed for {label}: {str(e)}")
+            yield _sse({'type': 'error', 'error': str(e)})
+    
+    return _sse_response(events())
+
+@app.route('/api/research/guided/stream', methods=['POST'])
+@track_performance('/api/research/guided/stream')
+def guided_research_stream():
+    """Stream a guided research step as server-sent events"""
+    try:
+        data = request.json
+        step = data.get('step')
+        ticker = data.get('ticker', '').upper()
+        horizon = data.get('horizon', '1-3 years')
+        risk_level = data.get('riskLevel', 'moderate')
         
-        # Cache for 30 minutes (chat responses change more frequently)
-        response_cache.set(cache_key, result, CACHE_TTL['chat'])
-        print(f"[CACHE SET] Chat: {ticker} (TTL: {CACHE_TTL['chat']}s)")
+        if not ticker:
+            return jsonify({'error': 'Ticker is required'}), 400
         
-        return jsonify(result)
+        if step not in prompt_templates:
+            return jsonify({'error': f'Invalid step: {step}'}), 400
+        
+        cache_key = response_cache._generate_key(
+            'guided',
+            ticker=ticker,
+            step=step,
+            horizon=horizon,
+            risk=risk_level
+        )
+        
+        ttl = ttl_for_step(step)
+        
+        # Cache hits are sent as a single complete event
+        cached_result = response_cache.get(cache_key)
+        if cached_result:
+            print(f"[CACHE HIT] {ticker} - {step} (stream)")
+            analytics_service.track_cache(hit=True)
+            if refresh_ahead.on_hit(cache_key, ttl, lambda: _generate_guided(step, ticker, horizon, risk_level)):
+                print(f"[REFRESH AHEAD] {ticker} - {step}")
+            cached_result['cached'] = True
+            return _sse_response(iter([_sse({'type': 'done', **cached_result})]))
+        
+        analytics_service.track_cache(hit=False)
+        
+        template_func = prompt_templates[step]['template']
+        prompt = template_func(ticker, horizon, risk_level)
+        
+        return _stream_completion(
+            prompt,
+            {'step': step, 'ticker': ticker},
+            cache_key,
+            ttl,
+            f"{ticker} - {step}"
+        )
+    
+    except Exception as e:
+        print(f"[ERROR] Guided research stream failed: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/research/chat/stream', methods=['POST'])
+@track_performance('/api/research/chat/stream')
+def free_chat_stream():
+    """Stream a free-form chat answer as server-sent events"""
+    try:
+        data = request.json
+        ticker = data.get('ticker', '').upper()
+        question = data.get('question', '')
+        
+        if not ticker or not question:
+            return jsonify({'error': 'Ticker and question are required'}), 400
+        
+        cache_key = response_cache._generate_key(
+            'chat',
+            ticker=ticker,
+            question=question
+        )
+        
+        cached_result = response_cache.get(cache_key)
+        if cached_result:
+            print(f"[CACHE HIT] Chat: {ticker} (stream)")
+            analytics_service.track_cache(hit=True)
+            cached_result['cached'] = True
+            return _sse_response(iter([_sse({'type': 'done', **cached_result})]))
+        
+        analytics_service.track_cache(hit=False)
+        
+        prompt = free_chat_template(ticker, question)
+        
+        return _stream_completion(
+            prompt,
+            {'ticker': ticker, 'question': question},
+            cache_key,
+            CACHE_TTL['chat'],
+            f"Chat: {ticker}"
+        )
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -230,22 +398,15 @@ def get_stock_price(ticker):
         
         ticker = ticker.upper()
         
-        # Check cache first (cache for 1 minute)
-        cache_key = f"price:{ticker}"
-        cached_price = response_cache.get(cache_key)
-        if cached_price:
-            cached_price['cached'] = True
-            return jsonify(cached_price)
+        # Served from the shared quote store (fetched at most once per TTL)
+        requested_at = time.time()
+        quote = quote_store.get(ticker)
         
-        # Fetch real-time price
-        price_data = stock_price_service.get_stock_price(ticker)
-        
-        if not price_data:
+        if not quote:
             return jsonify({'error': 'Could not fetch price data'}), 404
         
-        # Cache for 1 minute
-        response_cache.set(cache_key, price_data, 60)
-        price_data['cached'] = False
+        price_data = quote.to_dict()
+        price_data['cached'] = quote.fetched_at < requested_at
         
         return jsonify(price_data)
     
@@ -291,8 +452,10 @@ def get_cache_stats():
         expired = response_cache.cleanup_expired()
         
         return jsonify({
-            'size': response_cache.size(),
-            'ttl_seconds': response_cache.ttl,
+            **response_cache.get_stats(),
+            'refresh_ahead': refresh_ahead.get_stats(),
+            'quote_store': quote_store.get_stats(),
+            'ttl_seconds': response_cache.default_ttl,
             'expired_cleaned': expired
         })
     except Exception as e:
@@ -303,6 +466,7 @@ def clear_cache():
     """Clear all cache (admin only - add auth if needed)"""
     try:
         response_cache.clear()
+        quote_store.clear()
         return jsonify({'message': 'Cache cleared successfully'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -334,9 +498,10 @@ def compare_stocks():
             cached_result['cached'] = True
             return jsonify(cached_result)
         
-        # Build comparison prompt
-        ticker_list = ', '.join(tickers)
-        prompt = f"""Compare these stocks for investment: {ticker_list}
+        def generate():
+            # Build comparison prompt
+            ticker_list = ', '.join(tickers)
+            prompt = f"""Compare these stocks for investment: {ticker_list}
 
 For each stock, provide:
 1. Current recommendation (Buy/Hold/Sell)
@@ -363,52 +528,53 @@ Format your response as JSON with this structure:
   "winner": "explanation of best choice"
 }}"""
         
-        # Call Perplexity API
-        response = perplexity_service.query(prompt)
+            # Call Perplexity API
+            response = perplexity_service.query(prompt)
         
-        # Try to parse JSON response
-        import json
-        import re
+            # Try to parse JSON response
+            import re
         
-        content = response['content']
+            content = response['content']
         
-        # Remove markdown code blocks if present
-        if '```json' in content:
-            content = re.sub(r'```json\s*', '', content)
-            content = re.sub(r'```\s*$', '', content)
-        elif '```' in content:
-            content = re.sub(r'```\s*', '', content)
+            # Remove markdown code blocks if present
+            if '```json' in content:
+                content = re.sub(r'```json\s*', '', content)
+                content = re.sub(r'```\s*$', '', content)
+            elif '```' in content:
+                content = re.sub(r'```\s*', '', content)
         
-        try:
-            result = json.loads(content.strip())
+            try:
+                result = json.loads(content.strip())
             
-            # Ensure all required fields exist
-            if 'stocks' not in result:
-                raise ValueError('Missing stocks field')
-            if 'summary' not in result:
-                result['summary'] = 'Stock comparison analysis'
-            if 'winner' not in result:
-                result['winner'] = 'See analysis above'
+                # Ensure all required fields exist
+                if 'stocks' not in result:
+                    raise ValueError('Missing stocks field')
+                if 'summary' not in result:
+                    result['summary'] = 'Stock comparison analysis'
+                if 'winner' not in result:
+                    result['winner'] = 'See analysis above'
                 
-        except Exception as e:
-            # If parsing fails, create structured response from raw content
-            result = {
-                'summary': content[:500] if len(content) > 500 else content,
-                'stocks': [
-                    {
-                        'ticker': t, 
-                        'recommendation': 'Hold', 
-                        'risk': 'Medium', 
-                        'growth': 'Medium', 
-                        'highlights': ['See detailed analysis in summary']
-                    } for t in tickers
-                ],
-                'winner': 'Analysis provided in summary section'
-            }
-        
-        # Add cached flag and cache the result
-        result['cached'] = False
-        response_cache.set(cache_key, result)
+            except Exception as e:
+                # If parsing fails, create structured response from raw content
+                result = {
+                    'summary': content[:500] if len(content) > 500 else content,
+                    'stocks': [
+                        {
+                            'ticker': t, 
+                            'recommendation': 'Hold', 
+                            'risk': 'Medium', 
+                            'growth': 'Medium', 
+                            'highlights': ['See detailed analysis in summary']
+                        } for t in tickers
+                    ],
+                    'winner': 'Analysis provided in summary section'
+                }
+        
+            result['cached'] = False
+            return result
+        
+        # Coalesce concurrent identical comparisons and cache the result
+        result, shared = llm_flight.do(cache_key, generate)
         
         return jsonify(result)
     
@@ -9,12 +9,12 @@ from auth_service import (
     update_last_login, require_auth, get_user_by_id
 )
 import sqlite3
+from db import users_db
 import os
 import secrets
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__)
-DB_PATH = 'users.db'
 
 # Session configuration
 SESSION_SECRET = os.getenv('SESSION_SECRET', secrets.token_hex(32))
@@ -184,7 +184,7 @@ def change_password():
 @require_auth
 def get_portfolio():
     """Get user's portfolio"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = users_db.connect()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
@@ -215,7 +215,7 @@ def add_to_portfolio():
         return jsonify({'error': 'Missing required fields'}), 400
     
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         c.execute('''
             INSERT INTO portfolio (user_id, ticker, shares, purchase_price, purchase_date, notes)
@@ -239,7 +239,7 @@ def update_portfolio_holding(holding_id):
     """Update a portfolio holding"""
     data = request.json
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = users_db.connect()
     c = conn.cursor()
     
     # Verify ownership
@@ -282,7 +282,7 @@ def update_portfolio_holding(holding_id):
 @require_auth
 def delete_portfolio_holding(holding_id):
     """Delete a portfolio holding"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = users_db.connect()
     c = conn.cursor()
     
     # Verify ownership and delete
@@ -339,7 +339,7 @@ def get_portfolio_insights():
 @require_auth
 def get_watchlist():
     """Get user's watchlist"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = users_db.connect()
     conn.row_factory = sqlite3.Row
     c = conn.cursor()
     
@@ -367,7 +367,7 @@ def add_to_watchlist():
         return jsonify({'error': 'Ticker is required'}), 400
     
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         c.execute('''
             INSERT INTO watchlist (user_id, ticker, notes)
@@ -389,7 +389,7 @@ def add_to_watchlist():
 @require_auth
 def remove_from_watchlist(watchlist_id):
     """Remove stock from watchlist"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = users_db.connect()
     c = conn.cursor()
     
     c.execute('DELETE FROM watchlist WHERE id = ? AND user_id = ?', 
@@ -701,7 +701,7 @@ def get_watchlist_news():
         limit_per_stock = int(request.args.get('limit_per_stock', 3))
         
         # Get user's portfolio stocks (unique tickers)
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -796,7 +796,7 @@ def get_portfolio_sentiment():
         user_id = request.user_id
         
         # Get user's portfolio stocks
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -886,8 +886,7 @@ def ai_chat():
             system_prompt += " The user is viewing social sentiment data."
         
         # Call Perplexity API
-        import os
-        import requests
+        from services.http_client import http_client
         
         api_key = os.getenv('PERPLEXITY_API_KEY')
         
@@ -909,7 +908,7 @@ def ai_chat():
             "max_tokens": 300
         }
         
-        response = requests.post(
+        response = http_client.post(
             "https://api.perplexity.ai/chat/completions",
             json=payload,
             headers=headers,
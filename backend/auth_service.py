@@ -10,6 +10,8 @@ from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify
 import sqlite3
+from db import users_db
+from migrations import USERS_MIGRATIONS, migrate
 import secrets
 
 # JWT Configuration
@@ -18,12 +20,10 @@ JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 24 * 7  # 7 days (default)
 JWT_EXPIRATION_HOURS_EXTENDED = 24 * 30  # 30 days (remember me)
 
-# Database setup
-DB_PATH = 'users.db'
-
+# Database setup (pooled WAL connections, see db.py)
 def init_db():
     """Initialize the user database"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = users_db.connect()
     c = conn.cursor()
     
     # Users table
@@ -91,6 +91,8 @@ def init_db():
     conn.commit()
     conn.close()
 
+    migrate(users_db, USERS_MIGRATIONS)
+
 # Initialize database on import
 init_db()
 
@@ -125,7 +127,7 @@ def decode_token(token):
 
 def get_user_by_email(email):
     """Get user by email"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = users_db.connect()
     c = conn.cursor()
     c.execute('SELECT * FROM users WHERE email = ?', (email,))
     user = c.fetchone()
@@ -134,7 +136,7 @@ def get_user_by_email(email):
 
 def get_user_by_id(user_id):
     """Get user by ID"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = users_db.connect()
     c = conn.cursor()
     c.execute('SELECT * FROM users WHERE id = ?', (user_id,))
     user = c.fetchone()
@@ -146,7 +148,7 @@ def create_user(email, password, name=None):
     password_hash = hash_password(password)
     
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         c.execute('''
             INSERT INTO users (email, password_hash, name)
@@ -161,7 +163,7 @@ def create_user(email, password, name=None):
 
 def update_last_login(user_id):
     """Update user's last login timestamp"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = users_db.connect()
     c = conn.cursor()
     c.execute('UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?', (user_id,))
     conn.commit()
@@ -194,7 +196,7 @@ def require_auth(f):
 def update_user_name(user_id, name):
     """Update user's name"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         c.execute('UPDATE users SET name = ? WHERE id = ?', (name, user_id))
         conn.commit()
@@ -207,7 +209,7 @@ def update_user_password(user_id, new_password):
     """Update user's password"""
     try:
         password_hash = hash_password(new_password)
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         c.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
         conn.commit()
@@ -218,7 +220,7 @@ def update_user_password(user_id, new_password):
 
 def get_user_by_google_id(google_id):
     """Get user by Google ID"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = users_db.connect()
     c = conn.cursor()
     c.execute('SELECT * FROM users WHERE google_id = ?', (google_id,))
     user = c.fetchone()
@@ -228,7 +230,7 @@ def get_user_by_google_id(google_id):
 def link_google_account(user_id, google_id):
     """Link Google account to existing user"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         
         # Check if Google ID is already linked to another account
@@ -258,7 +260,7 @@ def link_google_account(user_id, google_id):
 def unlink_google_account(user_id):
     """Unlink Google account from user"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         
         # Check if user has password (can't unlink if Google is only method)
@@ -291,7 +293,7 @@ def unlink_google_account(user_id):
 
 def get_linked_accounts(user_id):
     """Get list of linked authentication providers"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = users_db.connect()
     c = conn.cursor()
     c.execute('SELECT google_id, auth_provider, primary_auth_method FROM users WHERE id = ?', (user_id,))
     result = c.fetchone()
@@ -326,7 +328,7 @@ def get_linked_accounts(user_id):
 def set_primary_auth_method(user_id, method):
     """Set primary authentication method"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         
         # Verify the method is actually linked
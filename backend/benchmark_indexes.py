@@ -0,0 +1,168 @@
+"""
+Index Benchmark
+Seeds large portfolio/watchlist/alert tables in a scratch directory, checks
+that the hot queries are planned on the migration indexes and times them
+against a forced full scan.
+
+Usage: python benchmark_indexes.py [--rows 1000000] [--users 20000] [--keep]
+Exits non-zero if any query plan does not use its index.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+TICKERS = [
+    'AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA', 'META', 'TSLA', 'JPM', 'V', 'WMT',
+    'JNJ', 'PG', 'MA', 'HD', 'DIS', 'NFLX', 'ADBE', 'CRM', 'INTC', 'AMD',
+    'PYPL', 'KO', 'PEP', 'NKE', 'MCD', 'BA', 'XOM', 'CVX', 'PFE', 'ORCL'
+]
+
+# (name, database, query, parameter factory, index the plan must use).
+# Queries are copied verbatim from the services that run them.
+QUERIES = [
+    ('portfolio with metrics', 'users', '''
+        SELECT id, user_id, ticker, shares, purchase_price, purchase_date, notes, created_at
+        FROM portfolio
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+    ''', lambda users: (random.randint(1, users),), 'idx_portfolio_user_created'),
+    ('watchlist', 'users', '''
+        SELECT * FROM watchlist
+        WHERE user_id = ?
+        ORDER BY added_at DESC
+    ''', lambda users: (random.randint(1, users),), 'idx_watchlist_user_added'),
+    ('user alerts', 'alerts', '''
+        SELECT * FROM price_alerts
+        WHERE user_id = ?
+     AND is_active = 1 AND triggered = 0 ORDER BY created_at DESC''', lambda users: (random.randint(1, users),),
+     'idx_price_alerts_user_created'),
+    ('check alerts', 'alerts', '''
+        SELECT * FROM price_alerts
+        WHERE ticker = ? AND is_active = 1 AND triggered = 0
+    ''', lambda users: (random.choice(TICKERS),), 'idx_price_alerts_active_ticker'),
+]
+
+
+def seed(conn, sql, rows, make_row, batch=50000):
+    """Insert rows in large transactions"""
+    for start in range(0, rows, batch):
+        conn.executemany(sql, (make_row(i) for i in range(start, min(start + batch, rows))))
+        conn.commit()
+
+
+def seed_all(users_db, alerts_db, rows, users):
+    """Fill portfolio, watchlist and price_alerts with rows each"""
+    base = datetime(2024, 1, 1)
+
+    def stamp(i):
+        return (base + timedelta(seconds=i * 17)).strftime('%Y-%m-%d %H:%M:%S')
+
+    conn = users_db.connect()
+    seed(conn, '''
+        INSERT OR IGNORE INTO portfolio
+            (user_id, ticker, shares, purchase_price, purchase_date, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows, lambda i: (
+        i % users + 1, TICKERS[(i // users) % len(TICKERS)], 10, 100.0,
+        (base + timedelta(days=i // (users * len(TICKERS)))).strftime('%Y-%m-%d'), stamp(i)
+    ))
+    # UNIQUE(user_id, ticker) caps the watchlist at users * tickers rows
+    seed(conn, '''
+        INSERT OR IGNORE INTO watchlist (user_id, ticker, added_at) VALUES (?, ?, ?)
+    ''', min(rows, users * len(TICKERS)), lambda i: (
+        i % users + 1, TICKERS[(i // users) % len(TICKERS)], stamp(i)
+    ))
+    conn.close()
+
+    conn = alerts_db.connect()
+    # Most alerts have already fired or been switched off, as in production
+    seed(conn, '''
+        INSERT INTO price_alerts
+            (user_id, ticker, alert_type, target_price, condition, is_active, triggered, created_at)
+        VALUES (?, ?, 'price', ?, 'above', ?, ?, ?)
+    ''', rows, lambda i: (
+        i % users + 1, TICKERS[i % len(TICKERS)], 100.0 + i % 50,
+        0 if i % 10 == 0 else 1, 0 if i % 20 == 0 else 1, stamp(i)
+    ))
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+
+    conn = users_db.connect()
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+
+
+def plan(conn, query, params) -> str:
+    """EXPLAIN QUERY PLAN as one string"""
+    rows = conn.execute('EXPLAIN QUERY PLAN ' + query, params).fetchall()
+    return ' | '.join(row[-1] for row in rows)
+
+
+def time_query(conn, query, make_params, users, iterations) -> float:
+    """Average milliseconds per execution"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        conn.execute(query, make_params(users)).fetchall()
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help='Rows per table')
+    parser.add_argument('--users', type=int, default=20000, help='Distinct users')
+    parser.add_argument('--iterations', type=int, default=200, help='Timed runs per query')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch databases')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='stonk-bench-')
+    os.environ['USERS_DB_PATH'] = os.path.join(workdir, 'users.db')
+    os.environ['ALERTS_DB_PATH'] = os.path.join(workdir, 'stonk_market.db')
+
+    try:
+        # Importing creates the schema and runs the migrations on the scratch files
+        from db import users_db, alerts_db
+        import auth_service  # noqa: F401
+        from price_alerts_service import PriceAlertsService
+        PriceAlertsService()
+
+        print(f"Seeding {args.rows:,} rows per table in {workdir} ...")
+        start = time.perf_counter()
+        seed_all(users_db, alerts_db, args.rows, args.users)
+        print(f"Seeded in {time.perf_counter() - start:.1f}s\n")
+
+        failures = 0
+        databases = {'users': users_db, 'alerts': alerts_db}
+        for name, database, query, make_params, index in QUERIES:
+            conn = databases[database].connect()
+            try:
+                query_plan = plan(conn, query, make_params(args.users))
+                indexed_ms = time_query(conn, query, make_params, args.users, args.iterations)
+                table = query.split('FROM', 1)[1].split()[0]
+                scan_query = query.replace(f'FROM {table}', f'FROM {table} NOT INDEXED', 1)
+                scan_ms = time_query(conn, scan_query, make_params, args.users, max(1, args.iterations // 50))
+            finally:
+                conn.close()
+
+            ok = f'INDEX {index}' in query_plan and 'TEMP B-TREE' not in query_plan
+            failures += not ok
+            print(f"{'PASS' if ok else 'FAIL'}  {name}: {indexed_ms:.3f} ms (full scan {scan_ms:.1f} ms)")
+            print(f"      plan: {query_plan}")
+
+        print(f"\n{len(QUERIES) - failures}/{len(QUERIES)} query plans use their index")
+        return 1 if failures else 0
+    finally:
+        if args.keep:
+            print(f"Databases kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,48 +1,198 @@
 """
 Simple in-memory cache for API responses
 """
+import heapq
+import json
+import sys
+import threading
 import time
-from typing import Any, Optional
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class BoundedCache:
+    """
+    Bounded in-memory cache with LRU ordering and per-entry TTL
+
+    - O(1) get/set/delete using an OrderedDict kept in recency order
+    - Capped by entry count and by an approximate byte budget
+    - Expiry driven by a min-heap of deadlines, so expired entries are
+      dropped even if nobody reads them again
+    """
+
+    def __init__(self, max_entries: int = 5000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # key -> (value, expires_at, size)
+        self._entries = OrderedDict()
+        # (expires_at, key) - may hold stale items for overwritten keys
+        self._expiry_heap = []
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _estimate_size(self, key: str, value: Any) -> int:
+        """Approximate memory cost of an entry in bytes"""
+        try:
+            payload = len(json.dumps(value, default=str))
+        except (TypeError, ValueError):
+            payload = sys.getsizeof(value)
+        return payload + len(key)
+
+    def _remove(self, key: str):
+        """Drop an entry (lock must be held)"""
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _expire(self, now: float) -> int:
+        """Pop every deadline that has passed (lock must be held)"""
+        expired = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            entry = self._entries.get(key)
+            # Skip heap items left behind by an overwrite
+            if entry is not None and entry[1] == expires_at:
+                self._remove(key)
+                expired += 1
+
+        # Overwrites leave stale heap items behind; rebuild if they pile up
+        if len(heap) > 2 * len(self._entries) + 64:
+            self._expiry_heap = [(entry[1], k) for k, entry in self._entries.items()]
+            heapq.heapify(self._expiry_heap)
+
+        self.expirations += expired
+        return expired
+
+    def _evict(self):
+        """Evict least recently used entries until within bounds (lock must be held)"""
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a value if present and not expired"""
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl: float):
+        """Store a value for ttl seconds"""
+        size = self._estimate_size(key, value)
+
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+
+            if key in self._entries:
+                self._remove(key)
+
+            # Never keep a single entry larger than the whole budget
+            if size > self.max_bytes:
+                self.evictions += 1
+                return
+
+            expires_at = now + ttl
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+            self._evict()
+
+    def delete(self, key: str) -> bool:
+        """Delete a key, returning whether it existed"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                return True
+            return False
+
+    def ttl_remaining(self, key: str) -> Optional[float]:
+        """Seconds until a key expires, or None if it is not cached"""
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return entry[1] - now
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+            self._expiry_heap = []
+            self._bytes = 0
+
+    def cleanup_expired(self) -> int:
+        """Remove expired entries, returning how many were dropped"""
+        with self._lock:
+            return self._expire(time.time())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: str):
+        return self.ttl_remaining(key) is not None
+
+    def get_stats(self) -> Dict:
+        """Get size and eviction statistics"""
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
 
 class SimpleCache:
-    def __init__(self, ttl_seconds=3600):
+    def __init__(self, ttl_seconds=3600, max_entries=1000, max_bytes=16 * 1024 * 1024):
         """
         Initialize cache with time-to-live in seconds
-        Default: 1 hour (3600 seconds)
+        Default: 1 hour (3600 seconds), bounded to max_entries / max_bytes
         """
-        self.cache = {}
+        self.cache = BoundedCache(max_entries=max_entries, max_bytes=max_bytes)
         self.ttl = ttl_seconds
-    
+
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache if not expired"""
-        if key in self.cache:
-            value, timestamp = self.cache[key]
-            if time.time() - timestamp < self.ttl:
-                return value
-            else:
-                # Expired, remove it
-                del self.cache[key]
-        return None
-    
+        return self.cache.get(key)
+
     def set(self, key: str, value: Any):
         """Set value in cache with current timestamp"""
-        self.cache[key] = (value, time.time())
-    
+        self.cache.set(key, value, self.ttl)
+
     def clear(self):
         """Clear all cache entries"""
         self.cache.clear()
-    
+
     def size(self):
         """Get number of cached items"""
         return len(self.cache)
-    
+
     def cleanup_expired(self):
         """Remove expired entries"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, (_, timestamp) in self.cache.items()
-            if current_time - timestamp >= self.ttl
-        ]
-        for key in expired_keys:
-            del self.cache[key]
-        return len(expired_keys)
+        return self.cache.cleanup_expired()
+
+    def get_stats(self) -> Dict:
+        """Get cache statistics"""
+        return {**self.cache.get_stats(), 'ttl': self.ttl}
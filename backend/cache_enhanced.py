@@ -1,12 +1,20 @@
 """
 Enhanced caching with Redis support and intelligent TTL
 """
+import os
 import time
 import json
 import hashlib
-from typing import Any, Optional, Dict
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import zlib
+from typing import Any, Callable, Optional, Dict, Tuple
 from functools import wraps
 
+from cache import BoundedCache
+from metrics import record_cache
+
 try:
     import redis
     REDIS_AVAILABLE = True
@@ -14,29 +22,185 @@ except ImportError:
     REDIS_AVAILABLE = False
     print("⚠️  Redis not installed. Using memory cache only.")
 
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+    print("⚠️  msgpack not installed. Cached values are encoded as JSON.")
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+    print("⚠️  zstandard not installed. Cached values are compressed with zlib.")
+
+
+class CacheSerializer:
+    """
+    Versioned binary encoding for values stored in Redis
+    
+    Layout: MAGIC (2 bytes) | version | format | compression | payload
+    
+    Values are packed with msgpack when installed (JSON otherwise) and
+    compressed with zstd or zlib once they exceed a size threshold.
+    Entries without the header are legacy plain JSON and still decode.
+    """
+    
+    MAGIC = b'\xa7C'
+    VERSION = 1
+    HEADER_SIZE = 5
+    
+    FORMAT_JSON = 0
+    FORMAT_MSGPACK = 1
+    
+    COMPRESS_NONE = 0
+    COMPRESS_ZLIB = 1
+    COMPRESS_ZSTD = 2
+    
+    def __init__(self, fmt: Optional[str] = None, compression: Optional[str] = None,
+                 threshold: Optional[int] = None, level: int = 3):
+        """
+        Args:
+            fmt: 'msgpack' or 'json' (default: msgpack if installed)
+            compression: 'zstd', 'zlib' or 'none' (default: zstd if installed)
+            threshold: Only compress payloads larger than this many bytes
+            level: Compression level
+        """
+        fmt = fmt or os.getenv('CACHE_SERIALIZER', 'msgpack')
+        compression = compression or os.getenv('CACHE_COMPRESSION', 'zstd')
+        
+        self.format = self.FORMAT_MSGPACK if fmt == 'msgpack' and MSGPACK_AVAILABLE else self.FORMAT_JSON
+        
+        if compression == 'zstd' and ZSTD_AVAILABLE:
+            self.compression = self.COMPRESS_ZSTD
+        elif compression == 'none':
+            self.compression = self.COMPRESS_NONE
+        else:
+            self.compression = self.COMPRESS_ZLIB
+        
+        self.threshold = threshold if threshold is not None else int(os.getenv('CACHE_COMPRESS_THRESHOLD', '1024'))
+        self.level = level
+        
+        self._zstd_compressor = zstandard.ZstdCompressor(level=level) if ZSTD_AVAILABLE else None
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if ZSTD_AVAILABLE else None
+    
+    def dumps(self, value: Any) -> bytes:
+        """Encode a value with a format header"""
+        if self.format == self.FORMAT_MSGPACK:
+            payload = msgpack.packb(value, use_bin_type=True)
+        else:
+            payload = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        
+        compression = self.COMPRESS_NONE
+        if self.compression != self.COMPRESS_NONE and len(payload) > self.threshold:
+            if self.compression == self.COMPRESS_ZSTD:
+                payload = self._zstd_compressor.compress(payload)
+            else:
+                payload = zlib.compress(payload, self.level)
+            compression = self.compression
+        
+        header = self.MAGIC + bytes([self.VERSION, self.format, compression])
+        return header + payload
+    
+    def loads(self, data: Any) -> Any:
+        """Decode a value written by dumps() or a legacy JSON entry"""
+        if isinstance(data, str):
+            return json.loads(data)
+        
+        if not data.startswith(self.MAGIC):
+            # Written before the header existed: plain JSON
+            return json.loads(data)
+        
+        version, fmt, compression = data[2], data[3], data[4]
+        if version != self.VERSION:
+            raise ValueError(f"Unsupported cache format version: {version}")
+        
+        payload = data[self.HEADER_SIZE:]
+        
+        if compression == self.COMPRESS_ZSTD:
+            if not ZSTD_AVAILABLE:
+                raise ValueError("Entry is zstd-compressed but zstandard is not installed")
+            payload = self._zstd_decompressor.decompress(payload)
+        elif compression == self.COMPRESS_ZLIB:
+            payload = zlib.decompress(payload)
+        
+        if fmt == self.FORMAT_MSGPACK:
+            if not MSGPACK_AVAILABLE:
+                raise ValueError("Entry is msgpack-encoded but msgpack is not installed")
+            return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        
+        return json.loads(payload)
+    
+    def describe(self) -> Dict:
+        """Active serializer settings for stats output"""
+        return {
+            'format': 'msgpack' if self.format == self.FORMAT_MSGPACK else 'json',
+            'compression': {self.COMPRESS_NONE: 'none', self.COMPRESS_ZLIB: 'zlib',
+                            self.COMPRESS_ZSTD: 'zstd'}[self.compression],
+            'threshold': self.threshold
+        }
+
 
 class EnhancedCache:
-    def __init__(self, redis_url=None, default_ttl=3600):
+    # Pub/sub channel used to drop keys from every worker's L1 tier
+    INVALIDATION_CHANNEL = 'cache:invalidate'
+    
+    def __init__(self, redis_url=None, default_ttl=3600, max_entries=None, max_bytes=None,
+                 serializer: Optional[CacheSerializer] = None, name: str = 'response'):
         """
         Initialize cache with optional Redis backend
         Falls back to in-memory if Redis unavailable
+        
+        With Redis, a small per-process L1 tier sits in front of it (two-tier
+        read-through) so hot keys skip the Redis round trip and JSON decode.
         """
         self.default_ttl = default_ttl
-        self.memory_cache = {}  # Fallback
+        self.serializer = serializer or CacheSerializer()
+        self.name = name  # Label for metrics
+        
+        # Fallback memory tier, bounded so a Redis outage can't grow it forever
+        self.memory_cache = BoundedCache(
+            max_entries=max_entries or int(os.getenv('CACHE_MAX_ENTRIES', '5000')),
+            max_bytes=max_bytes or int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+        )
+        
+        # L1 tier: short-lived copies of Redis entries, invalidated via pub/sub
+        self.l1_enabled = os.getenv('CACHE_L1_ENABLED', 'true').lower() == 'true'
+        self.l1_ttl = float(os.getenv('CACHE_L1_TTL', '30'))
+        self.l1 = BoundedCache(
+            max_entries=int(os.getenv('CACHE_L1_MAX_ENTRIES', '1000')),
+            max_bytes=int(os.getenv('CACHE_L1_MAX_BYTES', str(16 * 1024 * 1024)))
+        )
+        self._subscriber = None
+        self._subscriber_pid = None
+        self._subscriber_lock = threading.Lock()
+        self._origin = None
+        self._origin_pid = None
         
         # Try to connect to Redis
         self.redis_client = None
         if redis_url and REDIS_AVAILABLE:
             try:
-                self.redis_client = redis.from_url(redis_url, decode_responses=True)
+                self.redis_client = redis.from_url(redis_url, decode_responses=False)
                 self.redis_client.ping()
                 print("✓ Redis cache connected")
             except Exception as e:
+                self.redis_client = None
                 print(f"⚠️  Redis unavailable, using memory cache: {e}")
         
         # Cache statistics
         self.hits = 0
         self.misses = 0
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.invalidations = 0
+    
+    @property
+    def two_tier(self) -> bool:
+        """Whether the L1 tier is active in front of Redis"""
+        return bool(self.redis_client) and self.l1_enabled
     
     def _generate_key(self, prefix: str, **kwargs) -> str:
         """Generate cache key from parameters"""
@@ -46,28 +210,109 @@ class EnhancedCache:
         hash_str = hashlib.md5(param_str.encode()).hexdigest()[:8]
         return f"{prefix}:{hash_str}"
     
+    def _ensure_subscriber(self):
+        """
+        Listen for invalidations from other workers
+        Started lazily and per PID so it survives a gunicorn fork
+        """
+        if self._subscriber_pid == os.getpid():
+            return
+        
+        with self._subscriber_lock:
+            if self._subscriber_pid == os.getpid():
+                return
+            self._subscriber_pid = os.getpid()
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.INVALIDATION_CHANNEL: self._handle_invalidation})
+                self._subscriber = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            except Exception as e:
+                # L1 entries still expire after l1_ttl without pub/sub
+                print(f"Redis subscribe error: {e}")
+    
+    def _origin_id(self) -> str:
+        """
+        Id of this process in invalidation messages
+        Regenerated per PID, so forked workers never share one
+        """
+        if self._origin_pid != os.getpid():
+            self._origin_pid = os.getpid()
+            self._origin = uuid.uuid4().hex
+        return self._origin
+    
+    def _handle_invalidation(self, message):
+        """Drop a key (or everything, for '*') from the local L1 tier"""
+        data = message.get('data')
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if not data:
+            return
+        # "<origin> <key>": our own writes already updated our L1
+        origin, _, key = data.partition(' ')
+        if origin == self._origin_id():
+            return
+        if key == '*':
+            self.l1.clear()
+        elif key:
+            self.l1.delete(key)
+        self.invalidations += 1
+    
+    def _publish_invalidation(self, key: str):
+        """Tell every other worker to drop a key from its L1 tier"""
+        try:
+            self.redis_client.publish(self.INVALIDATION_CHANNEL, f"{self._origin_id()} {key}")
+        except Exception as e:
+            print(f"Redis publish error: {e}")
+    
+    def _copy(self, value: Any) -> Any:
+        """L1 values are shared objects; give callers their own top-level dict"""
+        return dict(value) if isinstance(value, dict) else value
+    
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
+        if self.two_tier:
+            self._ensure_subscriber()
+            value = self.l1.get(key)
+            if value is not None:
+                self.hits += 1
+                record_cache(self.name, key, True)
+                return self._copy(value)
+        
         # Try Redis first
         if self.redis_client:
             try:
-                value = self.redis_client.get(key)
+                if self.two_tier:
+                    # One round trip for the value and its remaining TTL
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    pipe.get(key)
+                    pipe.pttl(key)
+                    value, pttl = pipe.execute()
+                else:
+                    value, pttl = self.redis_client.get(key), None
+                
                 if value:
                     self.hits += 1
-                    return json.loads(value)
+                    self.l2_hits += 1
+                    record_cache(self.name, key, True)
+                    decoded = self.serializer.loads(value)
+                    if self.two_tier:
+                        l1_ttl = self.l1_ttl if not pttl or pttl < 0 else min(self.l1_ttl, pttl / 1000)
+                        self.l1.set(key, decoded, l1_ttl)
+                        return self._copy(decoded)
+                    return decoded
+                self.l2_misses += 1
             except Exception as e:
                 print(f"Redis get error: {e}")
         
         # Fallback to memory cache
-        if key in self.memory_cache:
-            value, timestamp, ttl = self.memory_cache[key]
-            if time.time() - timestamp < ttl:
-                self.hits += 1
-                return value
-            else:
-                del self.memory_cache[key]
+        value = self.memory_cache.get(key)
+        if value is not None:
+            self.hits += 1
+            record_cache(self.name, key, True)
+            return value
         
         self.misses += 1
+        record_cache(self.name, key, False)
         return None
     
     def set(self, key: str, value: Any, ttl: Optional[int] = None):
@@ -80,14 +325,40 @@ class EnhancedCache:
                 self.redis_client.setex(
                     key,
                     ttl,
-                    json.dumps(value)
+                    self.serializer.dumps(value)
                 )
+                if self.two_tier:
+                    # Other workers may hold an older copy in their L1
+                    self._ensure_subscriber()
+                    self._publish_invalidation(key)
+                    self.l1.set(key, value, min(self.l1_ttl, ttl))
                 return
             except Exception as e:
                 print(f"Redis set error: {e}")
         
         # Fallback to memory cache
-        self.memory_cache[key] = (value, time.time(), ttl)
+        self.memory_cache.set(key, value, ttl)
+    
+    def ttl(self, key: str) -> Optional[float]:
+        """
+        Get the remaining lifetime of a key
+        
+        Returns:
+            Seconds until expiry, inf if the key never expires,
+            or None if the key is not cached
+        """
+        if self.redis_client:
+            try:
+                remaining = self.redis_client.ttl(key)
+                if remaining == -1:
+                    return float('inf')
+                if remaining >= 0:
+                    return float(remaining)
+                return None
+            except Exception as e:
+                print(f"Redis ttl error: {e}")
+        
+        return self.memory_cache.ttl_remaining(key)
     
     def delete(self, key: str):
         """Delete key from cache"""
@@ -96,9 +367,11 @@ class EnhancedCache:
                 self.redis_client.delete(key)
             except:
                 pass
+            if self.two_tier:
+                self._publish_invalidation(key)
         
-        if key in self.memory_cache:
-            del self.memory_cache[key]
+        self.l1.delete(key)
+        self.memory_cache.delete(key)
     
     def clear(self):
         """Clear all cache"""
@@ -107,10 +380,15 @@ class EnhancedCache:
                 self.redis_client.flushdb()
             except:
                 pass
+            if self.two_tier:
+                self._publish_invalidation('*')
         
+        self.l1.clear()
         self.memory_cache.clear()
         self.hits = 0
         self.misses = 0
+        self.l2_hits = 0
+        self.l2_misses = 0
     
     def size(self):
         """Get cache size"""
@@ -126,28 +404,38 @@ class EnhancedCache:
         total = self.hits + self.misses
         hit_rate = (self.hits / total * 100) if total > 0 else 0
         
-        return {
+        stats = {
             'hits': self.hits,
             'misses': self.misses,
             'hit_rate': round(hit_rate, 2),
             'size': self.size(),
             'backend': 'redis' if self.redis_client else 'memory',
-            'ttl': self.default_ttl
+            'ttl': self.default_ttl,
+            'memory': self.memory_cache.get_stats(),
+            'serializer': self.serializer.describe()
         }
+        
+        if self.redis_client:
+            l2_total = self.l2_hits + self.l2_misses
+            stats['tiers'] = {
+                'l1': {**self.l1.get_stats(), 'enabled': self.two_tier, 'ttl': self.l1_ttl,
+                       'invalidations': self.invalidations},
+                'l2': {
+                    'hits': self.l2_hits,
+                    'misses': self.l2_misses,
+                    'hit_rate': round(self.l2_hits / l2_total * 100, 2) if l2_total > 0 else 0
+                }
+            }
+        
+        return stats
     
     def cleanup_expired(self):
-        """Remove expired entries from memory cache"""
+        """Remove expired entries from the memory tiers"""
         if self.redis_client:
-            return 0  # Redis handles expiry automatically
+            # Redis handles expiry automatically; only L1 needs sweeping
+            return self.l1.cleanup_expired()
         
-        current_time = time.time()
-        expired_keys = [
-            key for key, (_, timestamp, ttl) in self.memory_cache.items()
-            if current_time - timestamp >= ttl
-        ]
-        for key in expired_keys:
-            del self.memory_cache[key]
-        return len(expired_keys)
+        return self.memory_cache.cleanup_expired()
 
 
 # Decorator for automatic caching
@@ -190,3 +478,294 @@ def cached(cache_instance, ttl=3600, key_prefix='api'):
         
         return wrapper
     return decorator
+
+
+class _Call:
+    """An in-flight computation that other threads can wait on"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Request coalescing for expensive cache misses
+    
+    Concurrent callers asking for the same cache key share one computation.
+    Within a process, followers wait on the leader thread. Across gunicorn
+    workers, a Redis lock elects one leader and the other workers poll until
+    the leader has written the result into the cache.
+    
+    Usage:
+        flight = SingleFlight(response_cache)
+        result, shared = flight.do(cache_key, lambda: call_api(), ttl=3600)
+    """
+    
+    # Delete the lock only if we still own it
+    _RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+    
+    def __init__(self, cache: EnhancedCache, lock_ttl: int = 150,
+                 wait_timeout: float = 150, poll_interval: float = 0.5):
+        """
+        Args:
+            cache: Cache the computed results are stored in
+            lock_ttl: Seconds before an abandoned Redis lock expires
+            wait_timeout: Max seconds a follower waits before computing itself
+            poll_interval: Seconds between checks while another worker computes
+        """
+        self.cache = cache
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        
+        # Statistics
+        self.leaders = 0
+        self.coalesced = 0
+    
+    def do(self, key: str, fn: Callable[[], Any], ttl: Optional[int] = None) -> Tuple[Any, bool]:
+        """
+        Compute the value for a key once, no matter how many callers ask
+        
+        Args:
+            key: Cache key identifying the computation
+            fn: Function producing the value on a miss
+            ttl: TTL used when caching the value
+            
+        Returns:
+            (value, shared) - shared is True when another caller computed it
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+            else:
+                leader = False
+        
+        if not leader:
+            self.coalesced += 1
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return self._copy(call.result), True
+        
+        try:
+            call.result, shared = self._do_distributed(key, fn, ttl)
+            return self._copy(call.result), shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+    
+    def _do_distributed(self, key: str, fn: Callable[[], Any], ttl: Optional[int]) -> Tuple[Any, bool]:
+        """Elect one leader across workers via a Redis lock"""
+        redis_client = self.cache.redis_client
+        if not redis_client:
+            self.leaders += 1
+            return self._compute(key, fn, ttl), False
+        
+        lock_key = f"singleflight:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.time() + self.wait_timeout
+        
+        while True:
+            try:
+                acquired = redis_client.set(lock_key, token, nx=True, ex=self.lock_ttl)
+            except Exception as e:
+                print(f"Redis lock error: {e}")
+                return self._compute(key, fn, ttl), False
+            
+            if acquired:
+                self.leaders += 1
+                try:
+                    # Another worker may have finished just before we got the lock
+                    cached = self.cache.get(key)
+                    if cached is not None:
+                        return cached, True
+                    return self._compute(key, fn, ttl), False
+                finally:
+                    try:
+                        redis_client.eval(self._RELEASE_SCRIPT, 1, lock_key, token)
+                    except Exception as e:
+                        print(f"Redis unlock error: {e}")
+            
+            # Another worker is computing: wait for its lock to go away
+            self.coalesced += 1
+            while time.time() < deadline:
+                time.sleep(self.poll_interval)
+                try:
+                    if not redis_client.exists(lock_key):
+                        break
+                except Exception:
+                    break
+            
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached, True
+            
+            if time.time() >= deadline:
+                return self._compute(key, fn, ttl), False
+            # The leader failed without caching anything - try to take over
+    
+    def _compute(self, key: str, fn: Callable[[], Any], ttl: Optional[int]) -> Any:
+        """Run the computation and cache its result"""
+        result = fn()
+        if result is not None:
+            self.cache.set(key, result, ttl)
+        return result
+    
+    def _copy(self, value: Any) -> Any:
+        """Give each caller its own top-level dict so flags don't leak"""
+        return dict(value) if isinstance(value, dict) else value
+    
+    def get_stats(self) -> Dict:
+        """Get coalescing statistics"""
+        return {
+            'in_flight': len(self._calls),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced
+        }
+
+
+class RefreshAhead:
+    """
+    Regenerate popular entries in the background before they expire
+    
+    When a cache hit lands in the last `fraction` of an entry's TTL and the
+    key has been hit at least `min_hits` times, the entry is recomputed on a
+    small worker pool while callers keep getting the current value. A Redis
+    lock keeps gunicorn workers from refreshing the same key twice.
+    
+    Usage:
+        refresh_ahead = RefreshAhead(response_cache)
+        refresh_ahead.on_hit(cache_key, ttl, lambda: call_api())
+    """
+    
+    def __init__(self, cache: EnhancedCache, fraction: Optional[float] = None,
+                 min_hits: Optional[int] = None, max_workers: Optional[int] = None,
+                 lock_ttl: int = 150):
+        """
+        Args:
+            cache: Cache holding the entries
+            fraction: Refresh once less than this fraction of the TTL is left
+            min_hits: Hits within an entry's lifetime before it counts as popular
+            max_workers: Background regeneration threads
+            lock_ttl: Seconds before an abandoned refresh lock expires
+        """
+        self.cache = cache
+        self.fraction = fraction if fraction is not None else float(os.getenv('REFRESH_AHEAD_FRACTION', '0.2'))
+        self.min_hits = min_hits if min_hits is not None else int(os.getenv('REFRESH_AHEAD_MIN_HITS', '3'))
+        self.lock_ttl = lock_ttl
+        
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv('REFRESH_AHEAD_WORKERS', '2')),
+            thread_name_prefix='refresh-ahead'
+        )
+        
+        # Per-key hit counts, expiring with the entry they count
+        self._hits = BoundedCache(max_entries=10000, max_bytes=4 * 1024 * 1024)
+        self._pending = set()
+        self._lock = threading.Lock()
+        
+        # Statistics
+        self.scheduled = 0
+        self.refreshed = 0
+        self.failed = 0
+    
+    def _record_hit(self, key: str, ttl: int) -> int:
+        """Count a hit and return the running total"""
+        with self._lock:
+            count = (self._hits.get(key) or 0) + 1
+            self._hits.set(key, count, ttl)
+            return count
+    
+    def on_hit(self, key: str, ttl: int, fn: Callable[[], Any]) -> bool:
+        """
+        Record a cache hit and schedule a refresh if the entry is due
+        
+        Args:
+            key: Cache key that was hit
+            ttl: Full TTL the entry was written with
+            fn: Function producing a fresh value
+            
+        Returns:
+            True if a background refresh was scheduled
+        """
+        if self._record_hit(key, ttl) < self.min_hits:
+            return False
+        
+        remaining = self.cache.ttl(key)
+        if remaining is None or remaining > ttl * self.fraction:
+            return False
+        
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        
+        self.scheduled += 1
+        self.executor.submit(self._refresh, key, ttl, fn)
+        return True
+    
+    def _refresh(self, key: str, ttl: int, fn: Callable[[], Any]):
+        """Recompute an entry, unless another worker already is"""
+        redis_client = self.cache.redis_client
+        lock_key = f"refresh:{key}"
+        token = uuid.uuid4().hex
+        locked = False
+        
+        try:
+            if redis_client:
+                try:
+                    locked = bool(redis_client.set(lock_key, token, nx=True, ex=self.lock_ttl))
+                except Exception as e:
+                    print(f"Redis lock error: {e}")
+                    locked = True
+                if not locked:
+                    return
+                
+                # Another worker may have refreshed it just before we got the lock
+                remaining = self.cache.ttl(key)
+                if remaining is not None and remaining > ttl * self.fraction:
+                    return
+            
+            result = fn()
+            if result is not None:
+                self.cache.set(key, result, ttl)
+                self.refreshed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Refresh-ahead failed for {key}: {e}")
+        finally:
+            if locked and redis_client:
+                try:
+                    redis_client.eval(SingleFlight._RELEASE_SCRIPT, 1, lock_key, token)
+                except Exception as e:
+                    print(f"Redis unlock error: {e}")
+            with self._lock:
+                self._pending.discard(key)
+    
+    def get_stats(self) -> Dict:
+        """Get refresh-ahead statistics"""
+        return {
+            'pending': len(self._pending),
+            'scheduled': self.scheduled,
+            'refreshed': self.refreshed,
+            'failed': self.failed,
+            'fraction': self.fraction,
+            'min_hits': self.min_hits
+        }
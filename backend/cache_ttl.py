@@ -0,0 +1,22 @@
+"""
+Cache TTL Strategy
+Lifetimes for cached research answers, shared by the API and the cache warmer
+"""
+
+# Cache TTL strategy (in seconds)
+CACHE_TTL = {
+    'fundamentals': 86400,  # 24 hours - changes slowly
+    'news': 3600,           # 1 hour - changes frequently  
+    'technical': 14400,     # 4 hours - moderate
+    'chat': 1800,           # 30 minutes - conversational
+    'comparison': 7200,     # 2 hours - moderate
+    'overview': 14400,      # 4 hours
+}
+
+# Guided research steps without their own entry
+DEFAULT_TTL = 3600  # 1 hour
+
+
+def ttl_for_step(step: str) -> int:
+    """Cache TTL for a guided research step"""
+    return CACHE_TTL.get(step, DEFAULT_TTL)
@@ -5,9 +5,13 @@ Pre-populates cache with popular stocks to improve user experience
 import os
 import sys
 import time
+import heapq
 import logging
-from datetime import datetime
-from typing import List, Dict
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from typing import List, Dict, Tuple
 import hashlib
 import hmac
 
@@ -18,6 +22,10 @@ from dotenv import load_dotenv
 from services.perplexity_service import PerplexityService
 from prompts.templates import prompt_templates
 from cache_enhanced import EnhancedCache
+from cache_ttl import ttl_for_step
+from analytics_comprehensive import ComprehensiveAnalytics
+from services.rate_limiter import TokenBucket
+from metrics import WARMER_QUEUE, WARMER_TASKS, mark_process_dead
 
 load_dotenv()
 
@@ -35,18 +43,54 @@ logger = logging.getLogger(__name__)
 # Security: Verify this script is running in authorized context
 CACHE_WARMER_SECRET = os.getenv('CACHE_WARMER_SECRET', 'change-this-secret-in-production')
 
+# Fallback warm set when there is no recent analytics demand
+SEED_STOCKS = [
+    # Top Tech Giants (most popular)
+    'AAPL', 'MSFT', 'GOOGL', 'AMZN', 'META', 'NVDA', 'TSLA',
+    # Top Finance
+    'JPM', 'BAC', 'V', 'MA',
+    # Top Healthcare
+    'JNJ', 'UNH',
+    # Top Consumer
+    'WMT', 'HD', 'DIS',
+    # Top Industrial
+    'BA',
+    # Top Energy
+    'XOM',
+    # Popular ETFs
+    'SPY', 'QQQ'
+]
+
 class SecureCacheWarmer:
     """Secure cache warming with rate limiting and monitoring"""
     
     def __init__(self):
         self.perplexity_service = PerplexityService(os.getenv('PERPLEXITY_API_KEY'))
         redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
-        self.cache = EnhancedCache(redis_url=redis_url, default_ttl=86400)  # 24 hour TTL
+        self.cache = EnhancedCache(redis_url=redis_url, default_ttl=86400, name='warmer')  # 24 hour TTL
+        
+        # Security: Rate limiting - every API call takes a token from the bucket
+        self.max_requests_per_minute = int(os.getenv('CACHE_WARMER_RPM', '10'))
+        self.rate_limiter = TokenBucket(
+            rate=self.max_requests_per_minute / 60.0,
+            capacity=float(os.getenv('CACHE_WARMER_BURST', '1'))
+        )
         
-        # Security: Rate limiting
-        self.max_requests_per_minute = 10
-        self.request_count = 0
-        self.minute_start = time.time()
+        # Perplexity calls take 30-90s, so several must be in flight to use
+        # the whole rate budget; the bucket, not the pool, sets the pace
+        self.max_workers = int(os.getenv('CACHE_WARMER_WORKERS', '8'))
+        self.acquire_timeout = float(os.getenv('CACHE_WARMER_ACQUIRE_TIMEOUT', '60'))
+        self.max_retries = int(os.getenv('CACHE_WARMER_MAX_RETRIES', '3'))
+        self.retry_backoff = float(os.getenv('CACHE_WARMER_RETRY_BACKOFF', '30'))
+        
+        # Demand-driven warm set
+        self.analytics = ComprehensiveAnalytics()
+        self.demand_days = int(os.getenv('CACHE_WARMER_DEMAND_DAYS', '7'))
+        self.demand_half_life = float(os.getenv('CACHE_WARMER_HALF_LIFE_DAYS', '2'))
+        self.max_stocks = int(os.getenv('CACHE_WARMER_MAX_STOCKS', '50'))
+        self.api_budget = int(os.getenv('CACHE_WARMER_API_BUDGET', '100'))
+        # Only rewarm entries with less than this fraction of their TTL left
+        self.refresh_fraction = float(os.getenv('CACHE_WARMER_REFRESH_FRACTION', '0.25'))
         
         # Monitoring
         self.stats = {
@@ -55,8 +99,17 @@ class SecureCacheWarmer:
             'cache_hits': 0,
             'cache_misses': 0,
             'errors': 0,
-            'api_calls': 0
+            'api_calls': 0,
+            'rate_limited': 0,
+            'retries': 0,
+            'skipped_fresh': 0
         }
+        self._stats_lock = threading.Lock()
+    
+    def _incr(self, stat: str, amount: int = 1):
+        """Thread-safe stats counter update"""
+        with self._stats_lock:
+            self.stats[stat] += amount
     
     def verify_authorization(self, provided_secret: str) -> bool:
         """
@@ -67,46 +120,67 @@ class SecureCacheWarmer:
         provided = provided_secret.encode()
         return hmac.compare_digest(expected, provided)
     
-    def rate_limit_check(self) -> bool:
+    def _is_rate_limited(self, error: Exception) -> bool:
+        """Check whether an API error was an upstream 429"""
+        cause = error.__cause__ or error.__context__
+        response = getattr(cause, 'response', None)
+        if response is not None and response.status_code == 429:
+            return True
+        message = str(error).lower()
+        return '429' in message or 'rate limit' in message
+    
+    def _is_valid_ticker(self, ticker: str) -> bool:
+        """Security: alphanumeric only, max 5 chars"""
+        return bool(ticker) and ticker.isalnum() and len(ticker) <= 5
+    
+    def get_stock_demand(self) -> Dict[str, float]:
         """
-        Check if we're within rate limits
-        Prevents overwhelming the API
+        Get recency-weighted research demand per ticker
+        
+        Each day's counts from analytics are discounted by an exponential
+        decay with a half-life of demand_half_life days.
+        
+        Returns: Dict of ticker -> demand score
         """
-        current_time = time.time()
+        demand = {}
+        today = datetime.now()
         
-        # Reset counter every minute
-        if current_time - self.minute_start >= 60:
-            self.request_count = 0
-            self.minute_start = current_time
+        for days_ago in range(self.demand_days):
+            date = (today - timedelta(days=days_ago)).strftime('%Y-%m-%d')
+            weight = 0.5 ** (days_ago / self.demand_half_life)
+            
+            try:
+                popular = self.analytics.get_popular_stocks(date, limit=self.max_stocks * 2)
+            except Exception as e:
+                logger.warning(f"Could not read analytics for {date}: {str(e)}")
+                continue
+            
+            for entry in popular:
+                ticker = str(entry['ticker']).strip().upper()
+                # Security: analytics events are user input
+                if not self._is_valid_ticker(ticker):
+                    continue
+                demand[ticker] = demand.get(ticker, 0.0) + entry['count'] * weight
         
-        if self.request_count >= self.max_requests_per_minute:
-            logger.warning(f"Rate limit reached: {self.request_count} requests in current minute")
-            return False
+        return demand
+    
+    def _rank_stocks(self) -> Tuple[List[str], Dict[str, float]]:
+        """Get the top stocks by demand along with their scores"""
+        demand = self.get_stock_demand()
+        if not demand:
+            logger.info("No recent analytics demand, using seed stocks")
+            # Seed list is already in rough popularity order
+            demand = {ticker: float(len(SEED_STOCKS) - i) for i, ticker in enumerate(SEED_STOCKS)}
         
-        return True
+        ranked = sorted(demand, key=demand.get, reverse=True)[:self.max_stocks]
+        return ranked, demand
     
     def get_popular_stocks(self) -> List[str]:
         """
         Get list of popular stocks to cache
-        Security: Hardcoded list to prevent injection attacks
-        Focus on top 20 most popular stocks for faster caching
+        Ranked by recent analytics demand, falling back to the seed list
         """
-        return [
-            # Top Tech Giants (most popular)
-            'AAPL', 'MSFT', 'GOOGL', 'AMZN', 'META', 'NVDA', 'TSLA',
-            # Top Finance
-            'JPM', 'BAC', 'V', 'MA',
-            # Top Healthcare
-            'JNJ', 'UNH',
-            # Top Consumer
-            'WMT', 'HD', 'DIS',
-            # Top Industrial
-            'BA',
-            # Top Energy
-            'XOM',
-            # Popular ETFs
-            'SPY', 'QQQ'
-        ]
+        return self._rank_stocks()[0]
     
     def get_priority_steps(self) -> List[str]:
         """
@@ -133,6 +207,61 @@ class SecureCacheWarmer:
         logger.info(f"Caching {len(sorted_steps)} steps: {', '.join(sorted_steps)}")
         return sorted_steps
     
+    def get_step_ttl(self, step: str) -> int:
+        """Get cache TTL for a research step"""
+        return ttl_for_step(step)
+    
+    def get_cache_key(self, ticker: str, step: str) -> str:
+        """Cache key used by guided research for the default inputs"""
+        return self.cache._generate_key(
+            'guided',
+            ticker=ticker,
+            step=step,
+            horizon='1-3 years',
+            risk='moderate'
+        )
+    
+    def is_fresh(self, ticker: str, step: str) -> bool:
+        """Whether a cached entry still has most of its TTL left"""
+        remaining = self.cache.ttl(self.get_cache_key(ticker, step))
+        if remaining is None:
+            return False
+        return remaining > self.get_step_ttl(step) * self.refresh_fraction
+    
+    def build_work_list(self) -> List[tuple]:
+        """
+        Build the (ticker, step) pairs worth warming
+        
+        Pairs are scored by ticker demand times a step weight taken from
+        get_priority_steps() order. Entries that are still fresh are skipped,
+        and the list is capped at api_budget API calls.
+        """
+        stocks, demand = self._rank_stocks()
+        steps = self.get_priority_steps()
+        step_weights = {step: (len(steps) - i) / len(steps) for i, step in enumerate(steps)}
+        
+        candidates = sorted(
+            ((demand[ticker] * step_weights[step], ticker, step)
+             for ticker in stocks for step in steps),
+            reverse=True
+        )
+        
+        tasks = []
+        for _, ticker, step in candidates:
+            if len(tasks) >= self.api_budget:
+                break
+            if self.is_fresh(ticker, step):
+                self._incr('skipped_fresh')
+                continue
+            tasks.append((ticker, step))
+        
+        logger.info(
+            f"Work list: {len(tasks)} of {len(candidates)} candidates "
+            f"({len(stocks)} stocks × {len(steps)} steps, budget {self.api_budget}, "
+            f"{self.stats['skipped_fresh']} still fresh)"
+        )
+        return tasks
+    
     def warm_stock(self, ticker: str, step: str) -> Dict:
         """
         Warm cache for a specific stock and step
@@ -142,31 +271,23 @@ class SecureCacheWarmer:
         
         try:
             # Security: Validate ticker format (alphanumeric only, max 5 chars)
-            if not ticker.isalnum() or len(ticker) > 5:
+            if not self._is_valid_ticker(ticker):
                 logger.error(f"Invalid ticker format: {ticker}")
-                self.stats['errors'] += 1
+                self._incr('errors')
                 return {'status': 'error', 'reason': 'invalid_ticker'}
             
             # Security: Validate step exists
             if step not in prompt_templates:
                 logger.error(f"Invalid step: {step}")
-                self.stats['errors'] += 1
+                self._incr('errors')
                 return {'status': 'error', 'reason': 'invalid_step'}
             
-            # Generate cache key
-            cache_key = self.cache._generate_key(
-                'guided',
-                ticker=ticker,
-                step=step,
-                horizon='1-3 years',
-                risk='moderate'
-            )
+            cache_key = self.get_cache_key(ticker, step)
             
-            # Check if already cached
-            cached_result = self.cache.get(cache_key)
-            if cached_result:
+            # Check if already cached with plenty of TTL left
+            if self.is_fresh(ticker, step):
                 logger.info(f"✓ Already cached: {ticker} - {step}")
-                self.stats['cache_hits'] += 1
+                self._incr('cache_hits')
                 return {
                     'status': 'cached',
                     'ticker': ticker,
@@ -174,21 +295,37 @@ class SecureCacheWarmer:
                     'duration': time.time() - start_time
                 }
             
-            # Security: Rate limit check
-            if not self.rate_limit_check():
-                logger.warning(f"Rate limit reached, skipping: {ticker} - {step}")
-                time.sleep(60)  # Wait a minute
-                return {'status': 'rate_limited'}
+            # Security: Rate limit check - wait for a token, hand back if none comes
+            if not self.rate_limiter.acquire(timeout=self.acquire_timeout):
+                logger.warning(f"Rate limit reached, requeueing: {ticker} - {step}")
+                self._incr('rate_limited')
+                return {
+                    'status': 'rate_limited',
+                    'ticker': ticker,
+                    'step': step,
+                    'retry_after': self.rate_limiter.wait_time()
+                }
             
             # Call API
             logger.info(f"⏳ Fetching: {ticker} - {step}")
             template_func = prompt_templates[step]['template']
             prompt = template_func(ticker, '1-3 years', 'moderate')
             
-            self.request_count += 1
-            self.stats['api_calls'] += 1
+            self._incr('api_calls')
             
-            response = self.perplexity_service.query(prompt)
+            try:
+                response = self.perplexity_service.query(prompt)
+            except Exception as e:
+                if not self._is_rate_limited(e):
+                    raise
+                logger.warning(f"Upstream rate limit, requeueing: {ticker} - {step}")
+                self._incr('rate_limited')
+                return {
+                    'status': 'rate_limited',
+                    'ticker': ticker,
+                    'step': step,
+                    'retry_after': self.retry_backoff
+                }
             
             # Cache the result
             result = {
@@ -201,24 +338,15 @@ class SecureCacheWarmer:
             }
             
             # Determine TTL based on step
-            ttl_map = {
-                'fundamentals': 86400,  # 24 hours
-                'overview': 14400,      # 4 hours
-                'news': 3600,           # 1 hour
-                'technical': 14400      # 4 hours
-            }
-            ttl = ttl_map.get(step, 14400)
+            ttl = self.get_step_ttl(step)
             
             self.cache.set(cache_key, result, ttl)
             
             duration = time.time() - start_time
             logger.info(f"✓ Cached: {ticker} - {step} ({duration:.1f}s)")
             
-            self.stats['cache_misses'] += 1
-            self.stats['stocks_processed'] += 1
-            
-            # Security: Add delay to prevent overwhelming API
-            time.sleep(2)  # 2 second delay between requests
+            self._incr('cache_misses')
+            self._incr('stocks_processed')
             
             return {
                 'status': 'success',
@@ -229,7 +357,7 @@ class SecureCacheWarmer:
             
         except Exception as e:
             logger.error(f"✗ Error warming {ticker} - {step}: {str(e)}")
-            self.stats['errors'] += 1
+            self._incr('errors')
             return {
                 'status': 'error',
                 'ticker': ticker,
@@ -237,6 +365,73 @@ class SecureCacheWarmer:
                 'error': str(e)
             }
     
+    def run_tasks(self, tasks: List[tuple]) -> List[Dict]:
+        """
+        Warm (ticker, step) pairs on a worker pool
+        
+        Workers pace themselves on the shared token bucket. Tasks that come
+        back rate limited go on a retry queue and are resubmitted once their
+        backoff has passed, up to max_retries times.
+        
+        Returns: One result dict per task, in completion order
+        """
+        total_tasks = len(tasks)
+        pending = deque((ticker, step, 0) for ticker, step in tasks)
+        retry_queue = []  # (ready_at, seq, task) min-heap
+        seq = 0
+        in_flight = {}
+        results = []
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix='cache-warmer') as executor:
+            while pending or retry_queue or in_flight:
+                now = time.monotonic()
+                
+                # Move retries whose backoff has elapsed back into the queue
+                while retry_queue and retry_queue[0][0] <= now:
+                    pending.append(heapq.heappop(retry_queue)[2])
+                
+                while pending and len(in_flight) < self.max_workers:
+                    task = pending.popleft()
+                    future = executor.submit(self.warm_stock, task[0], task[1])
+                    in_flight[future] = task
+                
+                WARMER_QUEUE.labels('pending').set(len(pending))
+                WARMER_QUEUE.labels('retry').set(len(retry_queue))
+                WARMER_QUEUE.labels('in_flight').set(len(in_flight))
+                
+                next_retry = retry_queue[0][0] - now if retry_queue else None
+                if not in_flight:
+                    time.sleep(max(0.0, next_retry or 0.0))
+                    continue
+                
+                done, _ = wait(in_flight, timeout=next_retry, return_when=FIRST_COMPLETED)
+                
+                for future in done:
+                    ticker, step, attempt = in_flight.pop(future)
+                    result = future.result()
+                    
+                    WARMER_TASKS.labels(result.get('status', 'unknown')).inc()
+                    
+                    if result.get('status') == 'rate_limited' and attempt < self.max_retries:
+                        delay = max(result.get('retry_after', 0), self.retry_backoff * (2 ** attempt))
+                        seq += 1
+                        heapq.heappush(retry_queue, (time.monotonic() + delay, seq, (ticker, step, attempt + 1)))
+                        self._incr('retries')
+                        continue
+                    
+                    results.append(result)
+                    
+                    # Progress update every 10 items
+                    if len(results) % 10 == 0:
+                        progress = (len(results) / total_tasks) * 100
+                        logger.info(f"Progress: {len(results)}/{total_tasks} ({progress:.1f}%)")
+        
+        for queue_name in ('pending', 'retry', 'in_flight'):
+            WARMER_QUEUE.labels(queue_name).set(0)
+        
+        return results
+    
     def warm_cache(self, secret: str = None) -> Dict:
         """
         Main cache warming function
@@ -251,23 +446,10 @@ class SecureCacheWarmer:
         logger.info("Starting Secure Cache Warming")
         logger.info("=" * 60)
         
-        stocks = self.get_popular_stocks()
-        steps = self.get_priority_steps()
-        
-        total_tasks = len(stocks) * len(steps)
-        logger.info(f"Tasks: {len(stocks)} stocks × {len(steps)} steps = {total_tasks} total")
-        
-        results = []
+        tasks = self.build_work_list()
+        total_tasks = len(tasks)
         
-        for ticker in stocks:
-            for step in steps:
-                result = self.warm_stock(ticker, step)
-                results.append(result)
-                
-                # Progress update every 10 items
-                if len(results) % 10 == 0:
-                    progress = (len(results) / total_tasks) * 100
-                    logger.info(f"Progress: {len(results)}/{total_tasks} ({progress:.1f}%)")
+        results = self.run_tasks(tasks)
         
         # Final statistics
         self.stats['completed_at'] = datetime.now().isoformat()
@@ -277,9 +459,10 @@ class SecureCacheWarmer:
         logger.info("Cache Warming Complete")
         logger.info("=" * 60)
         logger.info(f"Stocks Processed: {self.stats['stocks_processed']}")
-        logger.info(f"Cache Hits: {self.stats['cache_hits']}")
+        logger.info(f"Cache Hits: {self.stats['cache_hits']} (skipped fresh: {self.stats['skipped_fresh']})")
         logger.info(f"Cache Misses: {self.stats['cache_misses']}")
         logger.info(f"API Calls: {self.stats['api_calls']}")
+        logger.info(f"Rate Limited: {self.stats['rate_limited']} (retries: {self.stats['retries']})")
         logger.info(f"Errors: {self.stats['errors']}")
         
         return {
@@ -305,6 +488,9 @@ def main():
     warmer = SecureCacheWarmer()
     result = warmer.warm_cache(secret)
     
+    # This cron run is over; drop its live queue gauges from the shared metrics
+    mark_process_dead()
+    
     if result['status'] == 'unauthorized':
         logger.error("Unauthorized: Invalid secret")
         sys.exit(1)
@@ -2,11 +2,12 @@
 Stock Chart Data Service
 Fetches historical price data for charting
 """
-import requests
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
+from services.http_client import http_client
+
 logger = logging.getLogger(__name__)
 
 class ChartService:
@@ -55,7 +56,7 @@ class ChartService:
                 'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
             }
             
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            response = http_client.get(url, params=params, headers=headers, timeout=10)
             
             if response.status_code != 200:
                 logger.warning(f"Yahoo Finance returned {response.status_code} for {ticker}")
@@ -0,0 +1,186 @@
+"""
+Shared SQLite Access
+Pooled connections in WAL mode with tuned pragmas and statement caching
+"""
+import os
+import queue
+import sqlite3
+import threading
+
+# Database files (relative to the backend working directory, as before)
+USERS_DB_PATH = os.getenv('USERS_DB_PATH', 'users.db')
+ALERTS_DB_PATH = os.getenv('ALERTS_DB_PATH', 'stonk_market.db')
+
+
+class PooledConnection:
+    """
+    A borrowed connection that goes back to the pool on close()
+
+    Behaves like sqlite3.Connection for the calls the services make
+    (cursor, execute, commit, rollback, row_factory, close). Anything left
+    uncommitted when it is returned is rolled back, so a failed request can
+    never leave a write lock behind.
+    """
+
+    def __init__(self, pool: 'Database', conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    @property
+    def row_factory(self):
+        return self._conn.row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        self._conn.row_factory = factory
+
+    def close(self):
+        """Return the connection to the pool"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._conn is not None:
+            if exc_type is None:
+                self._conn.commit()
+            else:
+                self._conn.rollback()
+        self.close()
+        return False
+
+    def __del__(self):
+        # Safety net for code paths that return early without close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class Database:
+    """
+    Connection pool for one SQLite file
+
+    - WAL journal so readers never block the writer (and vice versa)
+    - synchronous=NORMAL: durable at checkpoints, no fsync per commit
+    - busy_timeout so concurrent writers wait instead of failing
+    - Connections are reused, so sqlite3's per-connection statement cache
+      (cached_statements) keeps prepared statements across requests
+    """
+
+    def __init__(self, path: str, pool_size: int = None, busy_timeout_ms: int = None,
+                 synchronous: str = None, cached_statements: int = 256):
+        """
+        Args:
+            path: Database file
+            pool_size: Idle connections kept for reuse
+            busy_timeout_ms: How long a writer waits for a lock
+            synchronous: PRAGMA synchronous value (OFF/NORMAL/FULL)
+            cached_statements: Prepared statements cached per connection
+        """
+        self.path = path
+        self.pool_size = pool_size or int(os.getenv('SQLITE_POOL_SIZE', '8'))
+        self.busy_timeout_ms = busy_timeout_ms or int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+        self.synchronous = synchronous or os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+        self.cached_statements = cached_statements
+
+        self._idle = queue.LifoQueue(maxsize=self.pool_size)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.created = 0
+        self.reused = 0
+
+    def _open(self) -> sqlite3.Connection:
+        """Open and configure a new connection"""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,  # Pooled: handed from thread to thread, never shared
+            cached_statements=self.cached_statements
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.execute(f'PRAGMA busy_timeout={self.busy_timeout_ms}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        self.created += 1
+        return conn
+
+    def _check_fork(self):
+        """A forked worker must not reuse its parent's connections"""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._idle = queue.LifoQueue(maxsize=self.pool_size)
+                    self._pid = os.getpid()
+
+    def connect(self) -> PooledConnection:
+        """Borrow a connection; close() returns it to the pool"""
+        self._check_fork()
+        try:
+            conn = self._idle.get_nowait()
+            self.reused += 1
+        except queue.Empty:
+            conn = self._open()
+        return PooledConnection(self, conn)
+
+    def dedicated(self) -> sqlite3.Connection:
+        """
+        Open a connection outside the pool, configured like pooled ones
+
+        For long-lived owners that need connection identity, e.g. watching
+        PRAGMA data_version, which only reports commits made by *other*
+        connections. The caller must serialize access and close it.
+        """
+        return self._open()
+
+    def _release(self, conn: sqlite3.Connection):
+        """Reset a returned connection and keep it if the pool has room"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except sqlite3.Error:
+            conn.close()
+            return
+
+        if self._pid != os.getpid():
+            conn.close()
+            return
+
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def get_stats(self) -> dict:
+        """Get pool statistics"""
+        return {
+            'path': self.path,
+            'idle': self._idle.qsize(),
+            'pool_size': self.pool_size,
+            'created': self.created,
+            'reused': self.reused
+        }
+
+
+# Global instances
+users_db = Database(USERS_DB_PATH)
+alerts_db = Database(ALERTS_DB_PATH)
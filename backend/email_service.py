@@ -1,44 +1,37 @@
 """Email notification service using AWS SES"""
 
-import boto3
-from botocore.exceptions import ClientError
 import os
 from datetime import datetime
 
+from notification_outbox import notification_outbox
+
 class EmailService:
     """Send email notifications via AWS SES"""
     
     def __init__(self):
-        self.ses_client = boto3.client('ses', region_name='us-east-1')
         self.from_email = os.getenv('ADMIN_EMAIL', 'sentinel_65d3d147@stonkmarketanalyzer.com')
         self.admin_email = os.getenv('ADMIN_EMAIL', 'sentinel_65d3d147@stonkmarketanalyzer.com')
     
     def send_email(self, subject, body_text, body_html=None, to_email=None):
-        """Send an email via SES"""
+        """Queue an email for delivery via SES (sent by the outbox dispatcher)"""
         if to_email is None:
             to_email = self.admin_email
         
-        try:
-            body_data = {'Text': {'Data': body_text, 'Charset': 'UTF-8'}}
-            
-            if body_html:
-                body_data['Html'] = {'Data': body_html, 'Charset': 'UTF-8'}
-            
-            response = self.ses_client.send_email(
-                Source=self.from_email,
-                Destination={'ToAddresses': [to_email]},
-                Message={
-                    'Subject': {'Data': subject, 'Charset': 'UTF-8'},
-                    'Body': body_data
-                }
-            )
-            
-            print(f"[EMAIL] Sent: {subject} to {to_email}")
-            return True
-            
-        except ClientError as e:
-            print(f"[EMAIL] Error: {e.response['Error']['Message']}")
+        outbox_id = notification_outbox.enqueue(
+            recipient=to_email,
+            subject=subject,
+            body_text=body_text,
+            body_html=body_html,
+            kind='admin',
+            sender=self.from_email
+        )
+        
+        if not outbox_id:
+            print(f"[EMAIL] Error queueing: {subject} to {to_email}")
             return False
+        
+        print(f"[EMAIL] Queued: {subject} to {to_email}")
+        return True
     
     def send_daily_report(self, stats):
         """Send daily analytics report"""
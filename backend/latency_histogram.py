@@ -0,0 +1,146 @@
+"""
+Streaming Latency Histograms
+Log-bucketed (HDR-style) histograms for constant-memory percentiles
+"""
+import math
+import threading
+import time
+from typing import Dict
+
+
+class LatencyHistogram:
+    """
+    Fixed-size histogram with logarithmic buckets
+
+    Bucket i covers [min_value * growth^i, min_value * growth^(i+1)), so
+    every percentile is reported within (growth - 1) relative error while
+    memory stays constant however many samples are recorded.
+    """
+
+    def __init__(self, min_value: float = 0.1, max_value: float = 600000.0, growth: float = 1.02):
+        """
+        Args:
+            min_value: Smallest distinguishable value (ms)
+            max_value: Values above this land in the last bucket (ms)
+            growth: Ratio between consecutive bucket bounds
+        """
+        self.min_value = min_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self.num_buckets = int(math.log(max_value / min_value) / self._log_growth) + 2
+
+        self.counts = [0] * self.num_buckets
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+        index = int(math.log(value / self.min_value) / self._log_growth) + 1
+        return min(index, self.num_buckets - 1)
+
+    def _upper_bound(self, index: int) -> float:
+        return self.min_value * self.growth ** index
+
+    def record(self, value: float):
+        """Add one sample"""
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other: 'LatencyHistogram'):
+        """Fold another histogram with the same layout into this one"""
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, p: float) -> float:
+        """Value at percentile p (0-100), clamped to the observed range"""
+        if not self.count:
+            return 0.0
+
+        rank = max(1, math.ceil(self.count * p / 100.0))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(max(self._upper_bound(i), self.min), self.max)
+        return self.max
+
+    def count_above(self, value: float) -> int:
+        """Samples in buckets lying entirely above value"""
+        start = self._index(value) + 1
+        return sum(self.counts[start:])
+
+    def summary(self) -> Dict:
+        """Count, mean, extremes and tail percentiles"""
+        if not self.count:
+            return {'count': 0, 'avg': 0, 'min': 0, 'max': 0, 'p50': 0, 'p95': 0, 'p99': 0}
+        return {
+            'count': self.count,
+            'avg': self.total / self.count,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+
+
+class RollingHistogram:
+    """
+    Latency histogram covering roughly the last one to two windows
+
+    Samples go into the current window; when it ends it becomes the previous
+    window and the one before is dropped, so old traffic ages out instead of
+    diluting today's tail latency.
+    """
+
+    def __init__(self, window_seconds: float = 3600, **histogram_args):
+        self.window_seconds = window_seconds
+        self._histogram_args = histogram_args
+        self._current = LatencyHistogram(**histogram_args)
+        self._previous = LatencyHistogram(**histogram_args)
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _rotate(self, now: float):
+        """Start a new window if the current one has ended (lock must be held)"""
+        elapsed = now - self._window_start
+        if elapsed < self.window_seconds:
+            return
+        # More than two windows idle: nothing recent is left
+        self._previous = self._current if elapsed < 2 * self.window_seconds else LatencyHistogram(**self._histogram_args)
+        self._current = LatencyHistogram(**self._histogram_args)
+        self._window_start = now
+
+    def record(self, value: float):
+        """Add one sample"""
+        with self._lock:
+            self._rotate(time.monotonic())
+            self._current.record(value)
+
+    def snapshot(self) -> LatencyHistogram:
+        """Merged copy of the previous and current windows"""
+        with self._lock:
+            self._rotate(time.monotonic())
+            merged = LatencyHistogram(**self._histogram_args)
+            merged.merge(self._previous)
+            merged.merge(self._current)
+            return merged
+
+    def summary(self) -> Dict:
+        """Count, mean, extremes and tail percentiles for the recent windows"""
+        return self.snapshot().summary()
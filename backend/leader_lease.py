@@ -0,0 +1,109 @@
+"""
+Leader Lease
+Elects one process among the gunicorn workers to run a background job
+"""
+import logging
+import os
+import uuid
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """
+    Lease held by at most one process at a time
+
+    - With Redis, the leader holds a key set with SET NX EX and renews it on
+      every tick; the key expires if the leader dies so another worker takes over
+    - Without Redis, or while Redis is erroring, an exclusive flock on a
+      local lock file decides instead. The lease never reports leadership
+      to every worker at once, so the job is never run in parallel.
+    """
+
+    # Extend / release the lease only if we still own it
+    _RENEW_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('expire', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+    _RELEASE_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, key: str, ttl: int, lock_file: str):
+        """
+        Args:
+            key: Redis key of the lease
+            ttl: Lease lifetime in seconds; hold() must be called more often
+            lock_file: Path of the lock file used without Redis
+        """
+        self.key = key
+        self.ttl = int(ttl)
+        self.lock_file = lock_file
+
+        self._token = uuid.uuid4().hex
+        self._redis_leader = False
+        self._lock_fd = None
+        self.is_leader = False
+
+    def hold(self, redis_client=None) -> bool:
+        """Acquire or renew the lease; True if this process is the leader"""
+        if redis_client is not None:
+            try:
+                if self._redis_leader:
+                    self._redis_leader = bool(redis_client.eval(
+                        self._RENEW_SCRIPT, 1, self.key, self._token, self.ttl
+                    ))
+                if not self._redis_leader:
+                    self._redis_leader = bool(redis_client.set(
+                        self.key, self._token, nx=True, ex=self.ttl
+                    ))
+                # Redis decides again, so stop blocking the file lock
+                self._release_file()
+                self.is_leader = self._redis_leader
+                return self.is_leader
+            except Exception as e:
+                self._redis_leader = False
+                logger.warning(f"Lease {self.key} unavailable in Redis, using {self.lock_file}: {str(e)}")
+
+        self.is_leader = self._hold_file()
+        return self.is_leader
+
+    def _hold_file(self) -> bool:
+        """Take the exclusive lock file (kept until released)"""
+        if not FCNTL_AVAILABLE:
+            return True
+        if self._lock_fd is None:
+            fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._lock_fd = fd
+            except OSError:
+                os.close(fd)
+        return self._lock_fd is not None
+
+    def _release_file(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def release(self, redis_client=None):
+        """Give up the lease"""
+        if redis_client is not None and self._redis_leader:
+            try:
+                redis_client.eval(self._RELEASE_SCRIPT, 1, self.key, self._token)
+            except Exception:
+                pass
+        self._redis_leader = False
+        self._release_file()
+        self.is_leader = False
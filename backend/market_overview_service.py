@@ -2,20 +2,69 @@
 Market Overview Service - Multi-Country Support
 Fetches market indices, top movers, and sector performance for multiple countries
 """
-import requests
 import logging
-from typing import Dict, Optional, List
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from typing import Dict, Optional, List, Tuple
 from datetime import datetime, timedelta
 import time
 
+from leader_lease import LeaderLease
+from services.http_client import http_client
+from services.quote_store import Quote, quote_store
+from services.rate_limiter import TokenBucket
+
 logger = logging.getLogger(__name__)
 
 class MarketOverviewService:
     """Fetch market overview data with multi-country support and caching"""
     
     def __init__(self):
+        # Last good snapshot per country: {cache_key: (result, fetched_at)}
         self.cache = {}
-        self.cache_duration = 300  # 5 minutes cache
+        self.cache_duration = 300  # Snapshot considered fresh for 5 minutes
+        self.partial_cache_duration = 60  # Retry sooner when symbols were missing
+        self.max_stale_duration = 1800  # After 30 minutes a partial refresh wins
+        
+        # Background refresh: keeps every country's snapshot hot so requests
+        # are answered from memory while a refresh runs (stale-while-revalidate)
+        # Only one worker (the lease holder) runs the refresher, and only for
+        # countries someone asked for within the active window. Snapshots are
+        # shared through the response cache so every worker serves them.
+        self.background_refresh = os.getenv('MARKET_OVERVIEW_BACKGROUND_REFRESH', 'true').lower() == 'true'
+        self.refresh_interval = float(os.getenv('MARKET_OVERVIEW_REFRESH_INTERVAL', '120'))
+        self.active_window = float(os.getenv('MARKET_OVERVIEW_ACTIVE_WINDOW', '900'))
+        self.shared_cache = None
+        self._lease = LeaderLease(
+            'market-overview:refresher',
+            ttl=max(30, int(self.refresh_interval * 3)),
+            lock_file=os.getenv('MARKET_OVERVIEW_LOCK_FILE', 'market_overview.lock')
+        )
+        self._last_requested = {}
+        self._demand_published = {}
+        self._refresher = None
+        self._refreshing = set()
+        self._country_locks = {}
+        self._lock = threading.Lock()
+        
+        # Collection pipeline: all symbols are fetched concurrently, paced by a
+        # global Yahoo rate limiter, and assembled until the deadline expires
+        self.collect_deadline = float(os.getenv('MARKET_OVERVIEW_DEADLINE', '6'))
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('MARKET_OVERVIEW_MAX_WORKERS', '16')),
+            thread_name_prefix='market-overview'
+        )
+        self.rate_limiter = TokenBucket(
+            rate=float(os.getenv('YAHOO_RATE_PER_SEC', '15')),
+            capacity=float(os.getenv('YAHOO_RATE_BURST', '20'))
+        )
+        self.yahoo_headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'application/json',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Referer': 'https://finance.yahoo.com/'
+        }
         
         # Country configurations
         self.countries = {
@@ -82,29 +131,54 @@ class MarketOverviewService:
         """
         Get comprehensive market overview for a specific country
         
+        Served from the last good snapshot whenever one exists; a stale
+        snapshot triggers a refresh in the background instead of blocking.
+        
         Args:
             country: Country code (US, IN, UK)
             
         Returns:
-            Dict with indices, movers, and sectors
+            Dict with indices, movers, sectors and snapshot_age_seconds
         """
-        # Check cache first
-        cache_key = f"market_overview_{country}"
-        if cache_key in self.cache:
-            cached_data, cached_time = self.cache[cache_key]
-            if time.time() - cached_time < self.cache_duration:
-                logger.info(f"Returning cached data for {country}")
-                return cached_data
+        if country not in self.countries:
+            country = 'US'  # Default to US
+        
+        self.start_background_refresh()
+        self._record_demand(country)
         
+        snapshot = self._load_snapshot(country)
+        
+        if snapshot:
+            cached_data, cached_time = snapshot
+            if self._is_stale(cached_data, cached_time):
+                self._schedule_refresh(country)
+            logger.info(f"Returning cached data for {country}")
+            return self._with_age(cached_data, cached_time)
+        
+        # Cold start: only one request per country computes, the rest wait for it
+        with self._country_lock(country):
+            snapshot = self._load_snapshot(country)
+            if not snapshot:
+                self.refresh(country)
+                snapshot = self._load_snapshot(country)
+        
+        if not snapshot:
+            return None
+        
+        return self._with_age(*snapshot)
+    
+    def refresh(self, country: str) -> Optional[Dict]:
+        """
+        Rebuild the overview for a country and store it as the new snapshot
+        
+        A failed refresh keeps the previous snapshot. A partial refresh only
+        replaces a complete snapshot once that snapshot is too old to trust.
+        """
         try:
-            if country not in self.countries:
-                country = 'US'  # Default to US
-            
             config = self.countries[country]
             
-            indices = self._get_major_indices(config['indices'])
-            movers = self._get_top_movers(config['popular_stocks'])
-            sectors = self._get_sector_performance(config['sectors']) if config['sectors'] else []
+            indices, stocks, sectors, missing = self._collect(config)
+            movers = self._get_top_movers(stocks)
             
             result = {
                 'country': country,
@@ -112,17 +186,151 @@ class MarketOverviewService:
                 'indices': indices,
                 'movers': movers,
                 'sectors': sectors,
+                'partial': missing > 0,
                 'timestamp': datetime.now().isoformat()
             }
-            
-            # Cache the result
-            self.cache[cache_key] = (result, time.time())
-            
-            return result
-            
         except Exception as e:
             logger.error(f"Error fetching market overview for {country}: {str(e)}")
             return None
+        
+        previous = self._load_snapshot(country)
+        now = time.time()
+        
+        if (previous and result['partial'] and not previous[0].get('partial')
+                and now - previous[1] < self.max_stale_duration):
+            logger.warning(f"Partial refresh for {country}, keeping previous snapshot")
+            return previous[0]
+        
+        self._store_snapshot(country, result, now)
+        return result
+    
+    def start_background_refresh(self, shared_cache=None):
+        """
+        Start the refresh scheduler thread (once per process)
+        
+        Args:
+            shared_cache: EnhancedCache used to share snapshots and demand
+                between workers; its Redis client also holds the lease
+        """
+        if shared_cache is not None and self.shared_cache is None:
+            self.shared_cache = shared_cache
+        
+        if not self.background_refresh or self._refresher is not None:
+            return
+        
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_loop,
+                name='market-overview-refresher',
+                daemon=True
+            )
+            self._refresher.start()
+            logger.info(f"Market overview background refresh every {self.refresh_interval}s")
+    
+    def _refresh_loop(self):
+        """Refresh recently requested countries while holding the lease"""
+        while True:
+            try:
+                redis_client = self.shared_cache.redis_client if self.shared_cache is not None else None
+                if self._lease.hold(redis_client):
+                    for country in self.active_countries():
+                        self._run_refresh(country)
+            except Exception as e:
+                logger.error(f"Market overview refresher failed: {str(e)}")
+            time.sleep(self.refresh_interval)
+    
+    def _schedule_refresh(self, country: str):
+        """Refresh a stale snapshot on the worker pool without blocking the caller"""
+        with self._lock:
+            if country in self._refreshing:
+                return
+            self._refreshing.add(country)
+        
+        # At most one task per country, so symbol fetches always have workers left
+        self.executor.submit(self._run_refresh, country, True)
+    
+    def _run_refresh(self, country: str, scheduled: bool = False):
+        """Run one refresh, skipping it if another is already in flight"""
+        if not scheduled:
+            with self._lock:
+                if country in self._refreshing:
+                    return
+                self._refreshing.add(country)
+        
+        try:
+            with self._country_lock(country):
+                self.refresh(country)
+        except Exception as e:
+            logger.error(f"Background refresh failed for {country}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(country)
+    
+    def _record_demand(self, country: str):
+        """Note that a country was requested (published to other workers at most once a minute)"""
+        now = time.time()
+        self._last_requested[country] = now
+        if self.shared_cache is None or now - self._demand_published.get(country, 0) < 60:
+            return
+        self._demand_published[country] = now
+        self.shared_cache.set(f"market_overview_demand:{country}", now, int(self.active_window))
+    
+    def active_countries(self) -> List[str]:
+        """Countries requested by any worker within the active window"""
+        now = time.time()
+        active = []
+        for country in self.countries:
+            requested_at = self._last_requested.get(country, 0)
+            if self.shared_cache is not None:
+                requested_at = max(requested_at, self.shared_cache.get(f"market_overview_demand:{country}") or 0)
+            if now - requested_at < self.active_window:
+                active.append(country)
+        return active
+    
+    def _load_snapshot(self, country: str) -> Optional[Tuple[Dict, float]]:
+        """Newest snapshot for a country, from memory or another worker's refresh"""
+        cache_key = f"market_overview_{country}"
+        snapshot = self.cache.get(cache_key)
+        if self.shared_cache is None or (snapshot and not self._is_stale(*snapshot)):
+            return snapshot
+        
+        shared = self.shared_cache.get(f"market_overview:{country}")
+        if shared and (not snapshot or shared['fetched_at'] > snapshot[1]):
+            snapshot = (shared['data'], shared['fetched_at'])
+            self.cache[cache_key] = snapshot
+        return snapshot
+    
+    def _store_snapshot(self, country: str, result: Dict, fetched_at: float):
+        """Keep a new snapshot locally and share it with the other workers"""
+        self.cache[f"market_overview_{country}"] = (result, fetched_at)
+        if self.shared_cache is not None:
+            self.shared_cache.set(
+                f"market_overview:{country}",
+                {'data': result, 'fetched_at': fetched_at},
+                int(self.max_stale_duration)
+            )
+    
+    def _country_lock(self, country: str) -> threading.Lock:
+        """Get the lock serializing refreshes for one country"""
+        with self._lock:
+            if country not in self._country_locks:
+                self._country_locks[country] = threading.Lock()
+            return self._country_locks[country]
+    
+    def _is_stale(self, data: Dict, fetched_at: float) -> bool:
+        """Check whether a snapshot is due for a refresh"""
+        max_age = self.partial_cache_duration if data.get('partial') else self.cache_duration
+        return time.time() - fetched_at >= max_age
+    
+    def _with_age(self, data: Dict, fetched_at: float) -> Dict:
+        """Copy a snapshot and annotate it with its age"""
+        return {
+            **data,
+            'snapshot_age_seconds': round(time.time() - fetched_at, 1),
+            'stale': self._is_stale(data, fetched_at)
+        }
     
     def get_available_countries(self) -> List[Dict]:
         """Get list of available countries"""
@@ -131,209 +339,180 @@ class MarketOverviewService:
             for code, config in self.countries.items()
         ]
     
-    def _get_major_indices(self, indices_symbols: List[tuple]):
-        """Get major market indices"""
-        indices = []
-        
-        for symbol, name in indices_symbols:
-            # Try primary endpoint
-            index_data = self._fetch_index_data(symbol, name)
-            if index_data:
-                indices.append(index_data)
-                continue
-            
-            # Try alternative endpoint
-            index_data = self._fetch_index_data_alt(symbol, name)
-            if index_data:
-                indices.append(index_data)
-                continue
-            
-            logger.warning(f"Could not fetch data for {symbol}")
+    def _collect(self, config: Dict):
+        """
+        Fetch indices, popular stocks and sectors concurrently
+        
+        Results are assembled as they arrive. Symbols still outstanding when
+        the deadline expires are skipped so the overview is returned on time.
+        
+        Returns:
+            (indices, stocks, sectors, missing_count)
+        """
+        deadline = time.monotonic() + self.collect_deadline
+        
+        futures = {}
+        for symbol, name in config['indices']:
+            futures[self.executor.submit(self._fetch_index_data, symbol, name, deadline)] = ('index', symbol)
+        for ticker in config['popular_stocks']:
+            futures[self.executor.submit(self._fetch_single_stock, ticker, deadline)] = ('stock', ticker)
+        for symbol, name in config['sectors']:
+            futures[self.executor.submit(self._fetch_sector_data, symbol, name, deadline)] = ('sector', symbol)
+        
+        collected = {'index': {}, 'stock': {}, 'sector': {}}
+        
+        try:
+            for future in as_completed(futures, timeout=self.collect_deadline):
+                kind, symbol = futures[future]
+                try:
+                    data = future.result()
+                except Exception as e:
+                    logger.debug(f"Error fetching {symbol}: {str(e)}")
+                    continue
+                if data:
+                    collected[kind][symbol] = data
+        except FuturesTimeoutError:
+            outstanding = [futures[f][1] for f in futures if not f.done()]
+            for future in futures:
+                future.cancel()
+            logger.warning(f"Market overview deadline hit, {len(outstanding)} symbols outstanding: {', '.join(outstanding)}")
+        
+        missing = len(futures) - sum(len(v) for v in collected.values())
+        
+        # Keep the configured display order
+        indices = [collected['index'][s] for s, _ in config['indices'] if s in collected['index']]
+        stocks = [collected['stock'][t] for t in config['popular_stocks'] if t in collected['stock']]
+        sectors = [collected['sector'][s] for s, _ in config['sectors'] if s in collected['sector']]
+        
+        for symbol, _ in config['indices']:
+            if symbol not in collected['index']:
+                logger.warning(f"Could not fetch data for {symbol}")
+        
+        return indices, stocks, sectors, missing
+    
+    def _fetch_chart_meta(self, symbol: str, deadline: Optional[float] = None) -> Optional[Dict]:
+        """
+        Fetch the chart API meta block for a symbol
+        Waits on the shared rate limiter, but never past the deadline
+        """
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not self.rate_limiter.acquire(timeout=timeout):
+            return None
+        
+        url = f"https://query2.finance.yahoo.com/v8/finance/chart/{symbol}"
+        params = {'interval': '1d', 'range': '1d'}
+        
+        response = http_client.get(url, params=params, headers=self.yahoo_headers)
+        
+        if response.status_code != 200:
+            return None
+        
+        data = response.json()
+        if 'chart' in data and 'result' in data['chart'] and data['chart']['result']:
+            return data['chart']['result'][0].get('meta', {})
+        
+        return None
+    
+    def _fetch_quote(self, symbol: str, deadline: Optional[float] = None) -> Optional[Quote]:
+        """
+        Quote for a symbol from the shared quote store
+        
+        A fresh quote fetched by any service is reused. Otherwise the chart
+        API is called through the store, so a symbol another service is
+        already fetching is waited on rather than fetched again.
+        """
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        return quote_store.get_with(symbol, lambda s: self._fetch_chart_quote(s, deadline), timeout)
+    
+    def _fetch_chart_quote(self, symbol: str, deadline: Optional[float] = None) -> Optional[Quote]:
+        """Build a quote from the chart API meta block"""
+        meta = self._fetch_chart_meta(symbol, deadline)
+        if not meta:
+            return None
         
-        return indices
+        current_price = meta.get('regularMarketPrice')
+        previous_close = meta.get('previousClose') or meta.get('chartPreviousClose')
+        if not current_price or not previous_close or current_price <= 0 or previous_close <= 0:
+            return None
+        
+        change = current_price - previous_close
+        return Quote(
+            symbol=symbol,
+            price=round(current_price, 2),
+            change=round(change, 2),
+            change_percent=round(change / previous_close * 100, 2),
+            currency=meta.get('currency', 'USD'),
+            market_state=meta.get('marketState'),
+            source='yahoo',
+            name=meta.get('longName') or meta.get('shortName')
+        )
     
-    def _fetch_index_data(self, symbol: str, name: str) -> Optional[Dict]:
+    def _fetch_index_data(self, symbol: str, name: str, deadline: Optional[float] = None) -> Optional[Dict]:
         """Fetch index data from Yahoo Finance chart API"""
         try:
-            url = f"https://query2.finance.yahoo.com/v8/finance/chart/{symbol}"
-            params = {'interval': '1d', 'range': '1d'}
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'application/json',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Referer': 'https://finance.yahoo.com/'
-            }
-            
-            response = requests.get(url, params=params, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if 'chart' in data and 'result' in data['chart'] and data['chart']['result']:
-                    result = data['chart']['result'][0]
-                    meta = result.get('meta', {})
-                    
-                    current_price = meta.get('regularMarketPrice')
-                    previous_close = meta.get('previousClose') or meta.get('chartPreviousClose')
-                    
-                    if current_price and previous_close:
-                        change = current_price - previous_close
-                        change_percent = (change / previous_close * 100)
-                        
-                        return {
-                            'symbol': symbol,
-                            'name': name,
-                            'price': round(current_price, 2),
-                            'change': round(change, 2),
-                            'change_percent': round(change_percent, 2)
-                        }
+            quote = self._fetch_quote(symbol, deadline)
+            if quote:
+                return {
+                    'symbol': symbol,
+                    'name': name,
+                    'price': quote.price,
+                    'change': quote.change,
+                    'change_percent': quote.change_percent
+                }
         except Exception as e:
             logger.debug(f"Error fetching {symbol} from chart API: {str(e)}")
         
         return None
     
-    def _fetch_index_data_alt(self, symbol: str, name: str) -> Optional[Dict]:
-        """Fetch index data from Yahoo Finance quote API (alternative) - DISABLED"""
-        # This endpoint is returning 401, skip it
-        return None
-    
-    def _get_top_movers(self, popular_tickers: List[str]):
-        """Get top gainers and losers"""
+    def _get_top_movers(self, all_stocks: List[Dict]):
+        """Get top gainers and losers from the fetched popular stocks"""
         movers = {
             'gainers': [],
             'losers': []
         }
         
-        try:
-            # Fetch real-time data for popular stocks
-            all_stocks = []
-            
-            # Try batch API first
-            batch_size = 10
-            for i in range(0, len(popular_tickers), batch_size):
-                batch = popular_tickers[i:i+batch_size]
-                batch_stocks = self._fetch_batch_quotes(batch)
-                all_stocks.extend(batch_stocks)
-                time.sleep(0.2)  # Small delay to avoid rate limiting
-            
-            # If batch API failed, try individual fetching for first 15 stocks
-            if len(all_stocks) < 5:
-                logger.warning(f"Batch API returned only {len(all_stocks)} stocks, trying individual fetching")
-                all_stocks = []
-                for ticker in popular_tickers[:15]:  # Limit to 15 to avoid timeout
-                    stock_data = self._fetch_single_stock(ticker)
-                    if stock_data:
-                        all_stocks.append(stock_data)
-                    time.sleep(0.1)
+        # Sort and get top 5 gainers and losers
+        if all_stocks and len(all_stocks) >= 5:
+            ranked = sorted(all_stocks, key=lambda x: x['change_percent'], reverse=True)
+            movers['gainers'] = ranked[:5]
+            movers['losers'] = ranked[-5:][::-1]  # Reverse to show worst first
             
-            # Sort and get top 5 gainers and losers
-            if all_stocks and len(all_stocks) >= 5:
-                all_stocks.sort(key=lambda x: x['change_percent'], reverse=True)
-                movers['gainers'] = all_stocks[:5]
-                movers['losers'] = all_stocks[-5:][::-1]  # Reverse to show worst first
-                
-                logger.info(f"Found {len(all_stocks)} stocks, {len(movers['gainers'])} gainers, {len(movers['losers'])} losers")
-            else:
-                logger.warning(f"Insufficient movers data: only {len(all_stocks)} stocks fetched")
-            
-        except Exception as e:
-            logger.error(f"Error fetching movers: {str(e)}", exc_info=True)
+            logger.info(f"Found {len(ranked)} stocks, {len(movers['gainers'])} gainers, {len(movers['losers'])} losers")
+        else:
+            logger.warning(f"Insufficient movers data: only {len(all_stocks)} stocks fetched")
         
         return movers
     
-    def _fetch_batch_quotes(self, tickers: List[str]) -> List[Dict]:
-        """Fetch quotes for multiple tickers in one request"""
-        stocks = []
-        
-        # Yahoo Finance batch API is unreliable, use individual fetching instead
-        logger.info(f"Fetching {len(tickers)} stocks individually")
-        
-        for ticker in tickers:
-            stock_data = self._fetch_single_stock(ticker)
-            if stock_data:
-                stocks.append(stock_data)
-            time.sleep(0.15)  # Rate limiting
-        
-        return stocks
-    
-    def _fetch_single_stock(self, ticker: str) -> Optional[Dict]:
-        """Fetch data for a single stock (fallback method)"""
+    def _fetch_single_stock(self, ticker: str, deadline: Optional[float] = None) -> Optional[Dict]:
+        """Fetch data for a single stock"""
         try:
-            # Try chart API first
-            url = f"https://query2.finance.yahoo.com/v8/finance/chart/{ticker}"
-            params = {'interval': '1d', 'range': '1d'}
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'application/json',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Referer': 'https://finance.yahoo.com/'
-            }
-            
-            response = requests.get(url, params=params, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if 'chart' in data and 'result' in data['chart'] and data['chart']['result']:
-                    result = data['chart']['result'][0]
-                    meta = result.get('meta', {})
-                    
-                    current_price = meta.get('regularMarketPrice')
-                    previous_close = meta.get('previousClose') or meta.get('chartPreviousClose')
-                    long_name = meta.get('longName') or meta.get('shortName') or ticker
-                    
-                    if current_price and previous_close and current_price > 0 and previous_close > 0:
-                        change_percent = ((current_price - previous_close) / previous_close * 100)
-                        
-                        return {
-                            'ticker': ticker,
-                            'name': long_name,
-                            'price': round(current_price, 2),
-                            'change_percent': round(change_percent, 2)
-                        }
+            quote = self._fetch_quote(ticker, deadline)
+            if quote:
+                return {
+                    'ticker': ticker,
+                    'name': quote.name or ticker,
+                    'price': quote.price,
+                    'change_percent': quote.change_percent
+                }
         except Exception as e:
             logger.debug(f"Error fetching single stock {ticker}: {str(e)}")
         
         return None
     
-    def _get_sector_performance(self, sectors: List[tuple]):
-        """Get sector performance"""
-        sector_data = []
-        
-        for symbol, name in sectors:
-            try:
-                url = f"https://query2.finance.yahoo.com/v8/finance/chart/{symbol}"
-                params = {'interval': '1d', 'range': '1d'}
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'application/json',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Referer': 'https://finance.yahoo.com/'
+    def _fetch_sector_data(self, symbol: str, name: str, deadline: Optional[float] = None) -> Optional[Dict]:
+        """Fetch performance for a sector ETF"""
+        try:
+            quote = self._fetch_quote(symbol, deadline)
+            if quote:
+                return {
+                    'name': name,
+                    'symbol': symbol,
+                    'change_percent': quote.change_percent
                 }
-                
-                response = requests.get(url, params=params, headers=headers, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if 'chart' in data and 'result' in data['chart'] and data['chart']['result']:
-                        result = data['chart']['result'][0]
-                        meta = result.get('meta', {})
-                        
-                        current_price = meta.get('regularMarketPrice')
-                        previous_close = meta.get('previousClose') or meta.get('chartPreviousClose')
-                        
-                        if current_price and previous_close:
-                            change_percent = ((current_price - previous_close) / previous_close * 100)
-                            
-                            sector_data.append({
-                                'name': name,
-                                'symbol': symbol,
-                                'change_percent': round(change_percent, 2)
-                            })
-                        
-            except Exception as e:
-                logger.debug(f"Error fetching sector {symbol}: {str(e)}")
-                continue
+        except Exception as e:
+            logger.debug(f"Error fetching sector {symbol}: {str(e)}")
         
-        return sector_data
+        return None
 
 
 # Global instance
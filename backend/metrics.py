@@ -0,0 +1,177 @@
+"""
+Prometheus Metrics
+Latency, upstream, cache and warmer metrics with a /metrics scrape endpoint
+
+Multiple workers: set PROMETHEUS_MULTIPROC_DIR to an empty, writable
+directory before the app starts. Every worker (and the cache warmer cron
+job) then writes its samples there and /metrics aggregates all of them.
+With gunicorn, call metrics.mark_process_dead(worker.pid) from child_exit.
+"""
+import os
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+try:
+    from prometheus_client import (
+        CollectorRegistry, Counter, Gauge, Histogram,
+        CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    print("⚠️  prometheus_client not installed. Metrics disabled.")
+
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+# Request latency buckets (seconds): fast JSON routes up to long LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Upstream label per host, so dashboards group query1/query2 etc.
+UPSTREAMS = {
+    'query1.finance.yahoo.com': 'yahoo',
+    'query2.finance.yahoo.com': 'yahoo',
+    'www.alphavantage.co': 'alphavantage',
+    'api.perplexity.ai': 'perplexity',
+}
+
+
+class _NoopMetric:
+    """Stands in for every metric when prometheus_client is missing"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, *args, **kwargs):
+        pass
+
+    def inc(self, *args, **kwargs):
+        pass
+
+    def dec(self, *args, **kwargs):
+        pass
+
+    def set(self, *args, **kwargs):
+        pass
+
+
+if PROMETHEUS_AVAILABLE:
+    REQUEST_LATENCY = Histogram(
+        'http_request_duration_seconds', 'Flask request latency',
+        ['route', 'method', 'status'], buckets=LATENCY_BUCKETS
+    )
+    UPSTREAM_LATENCY = Histogram(
+        'upstream_request_duration_seconds', 'Outbound HTTP call latency',
+        ['upstream', 'method', 'status'], buckets=LATENCY_BUCKETS
+    )
+    CACHE_REQUESTS = Counter(
+        'cache_requests_total', 'Cache lookups by cache, key prefix and result',
+        ['cache', 'prefix', 'result']
+    )
+    WARMER_TASKS = Counter(
+        'cache_warmer_tasks_total', 'Cache warmer task outcomes', ['status']
+    )
+    WARMER_QUEUE = Gauge(
+        'cache_warmer_queue_depth', 'Cache warmer tasks by queue',
+        ['queue'], multiprocess_mode='livesum'
+    )
+    ANALYTICS_QUEUE = Gauge(
+        'analytics_writer_queue_depth', 'Analytics events waiting to be written',
+        multiprocess_mode='livesum'
+    )
+    ANALYTICS_DROPPED = Counter(
+        'analytics_events_dropped_total', 'Analytics events dropped by backpressure'
+    )
+    ALERT_SCAN_LATENCY = Histogram(
+        'price_alert_scan_duration_seconds', 'Duration of one price alert scan',
+        buckets=LATENCY_BUCKETS
+    )
+    ALERTS_TRIGGERED = Counter(
+        'price_alerts_triggered_total', 'Price alerts triggered by the scheduler'
+    )
+    NOTIFICATIONS = Counter(
+        'notifications_total', 'Outbox emails by outcome', ['status']
+    )
+else:
+    REQUEST_LATENCY = UPSTREAM_LATENCY = CACHE_REQUESTS = _NoopMetric()
+    WARMER_TASKS = WARMER_QUEUE = ANALYTICS_QUEUE = ANALYTICS_DROPPED = _NoopMetric()
+    ALERT_SCAN_LATENCY = ALERTS_TRIGGERED = NOTIFICATIONS = _NoopMetric()
+
+
+def upstream_for(url: str) -> str:
+    """Upstream label for a URL"""
+    host = urlparse(url).hostname or 'unknown'
+    return UPSTREAMS.get(host, host)
+
+
+def observe_upstream(url: str, method: str, status, seconds: float):
+    """Record one outbound call"""
+    UPSTREAM_LATENCY.labels(upstream_for(url), method, str(status)).observe(seconds)
+
+
+def record_cache(cache: str, key: str, hit: bool):
+    """Record a cache lookup under the key's prefix ('guided:ab12' -> 'guided')"""
+    prefix = key.split(':', 1)[0] if ':' in key else 'none'
+    CACHE_REQUESTS.labels(cache, prefix, 'hit' if hit else 'miss').inc()
+
+
+def mark_process_dead(pid: Optional[int] = None):
+    """Drop a finished process's live gauges (multiprocess mode only)"""
+    if PROMETHEUS_AVAILABLE and MULTIPROCESS:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+def _route_label(hidden_segments) -> str:
+    """Route template for the current request, with secret path parts masked"""
+    from flask import request
+
+    if request.url_rule is None:
+        return 'unmatched'
+    route = request.url_rule.rule
+    for segment in hidden_segments:
+        if segment:
+            route = route.replace(segment, '<hidden>')
+    return route
+
+
+def init_metrics(app, hidden_segments=()):
+    """
+    Time every request and expose /metrics
+
+    Args:
+        app: Flask app
+        hidden_segments: Path parts that must not appear in labels (e.g. the portal path)
+    """
+    from flask import Response, g, jsonify, request
+
+    metrics_token = os.getenv('METRICS_TOKEN', '')
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None and request.path != '/metrics':
+            REQUEST_LATENCY.labels(
+                _route_label(hidden_segments), request.method, str(response.status_code)
+            ).observe(time.perf_counter() - start)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        """Prometheus scrape endpoint (not under /api, so nginx doesn't expose it)"""
+        if not PROMETHEUS_AVAILABLE:
+            return jsonify({'error': 'prometheus_client not installed'}), 503
+
+        if metrics_token and request.headers.get('Authorization') != f'Bearer {metrics_token}':
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        if MULTIPROCESS:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,129 @@
+"""
+Versioned Schema Migrations
+Ordered, numbered schema changes tracked with PRAGMA user_version
+"""
+from typing import List, Tuple
+
+from db import Database
+
+# (version, description, statements). Append only - never edit or renumber
+# a migration that has shipped; add a new one instead.
+Migration = Tuple[int, str, List[str]]
+
+# users.db (tables created by auth_service.init_db)
+USERS_MIGRATIONS: List[Migration] = [
+    (1, 'Index portfolio and watchlist by user and date', [
+        # get_portfolio_with_metrics: WHERE user_id = ? ORDER BY created_at DESC
+        'CREATE INDEX IF NOT EXISTS idx_portfolio_user_created ON portfolio(user_id, created_at)',
+        # get_watchlist: WHERE user_id = ? ORDER BY added_at DESC
+        'CREATE INDEX IF NOT EXISTS idx_watchlist_user_added ON watchlist(user_id, added_at)',
+    ]),
+    (2, 'Add the notification outbox', [
+        '''CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            user_id INTEGER,
+            sender TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body_text TEXT NOT NULL,
+            body_html TEXT,
+            summary TEXT,
+            digest_key TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            claimed_by TEXT,
+            claimed_until REAL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )''',
+        # Dispatcher: next due messages
+        'CREATE INDEX IF NOT EXISTS idx_outbox_status_due ON notification_outbox(status, next_attempt_at)',
+    ]),
+]
+
+# stonk_market.db (tables created by PriceAlertsService.init_db)
+ALERTS_MIGRATIONS: List[Migration] = [
+    (1, 'Index alerts by user and active alerts by ticker', [
+        # get_user_alerts: WHERE user_id = ? ORDER BY created_at DESC
+        'CREATE INDEX IF NOT EXISTS idx_price_alerts_user_created ON price_alerts(user_id, created_at)',
+        # check_alerts: WHERE ticker = ? AND is_active = 1 AND triggered = 0.
+        # Partial, so it only holds the alerts that can still fire.
+        '''CREATE INDEX IF NOT EXISTS idx_price_alerts_active_ticker ON price_alerts(ticker)
+           WHERE is_active = 1 AND triggered = 0''',
+    ]),
+    (2, 'Store the price percentage alerts are measured from', [
+        # Set at creation, or from the first price seen for older alerts
+        'ALTER TABLE price_alerts ADD COLUMN reference_price REAL',
+    ]),
+    (3, 'Log alert changes so the alert index can update incrementally', [
+        '''CREATE TABLE IF NOT EXISTS price_alert_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            alert_id INTEGER NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        # Every process sees every other process's changes, by sequence number
+        '''CREATE TRIGGER IF NOT EXISTS price_alerts_log_insert AFTER INSERT ON price_alerts
+           BEGIN INSERT INTO price_alert_changes (alert_id) VALUES (NEW.id); END''',
+        '''CREATE TRIGGER IF NOT EXISTS price_alerts_log_update AFTER UPDATE ON price_alerts
+           BEGIN INSERT INTO price_alert_changes (alert_id) VALUES (NEW.id); END''',
+        '''CREATE TRIGGER IF NOT EXISTS price_alerts_log_delete AFTER DELETE ON price_alerts
+           BEGIN INSERT INTO price_alert_changes (alert_id) VALUES (OLD.id); END''',
+    ]),
+]
+
+
+def current_version(db: Database) -> int:
+    """Schema version recorded in the database"""
+    conn = db.connect()
+    try:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def migrate(db: Database, migrations: List[Migration]) -> int:
+    """
+    Apply every migration newer than the database's schema version
+
+    Each migration runs in its own write transaction together with the
+    version bump, so a failure leaves the database at the last good version
+    and concurrent workers starting at once apply each migration only once.
+
+    Args:
+        db: Database to migrate
+        migrations: Ordered migration list
+
+    Returns:
+        Schema version after migrating
+    """
+    conn = db.connect()
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, description, statements in migrations:
+            if number <= version:
+                continue
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Another process may have migrated while we waited for the lock
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                if number <= version:
+                    conn.rollback()
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {int(number)}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            version = number
+            print(f"✅ Migrated {db.path} to v{number}: {description}")
+        return version
+    finally:
+        conn.close()
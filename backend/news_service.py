@@ -3,12 +3,13 @@ News Service - Fetch latest news for stocks
 Uses Alpha Vantage News API (free tier)
 """
 
-import requests
 import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import os
 
+from services.http_client import http_client
+
 class NewsService:
     def __init__(self):
         # Alpha Vantage provides free news API
@@ -43,7 +44,7 @@ class NewsService:
                 'limit': limit * 2  # Fetch more to filter
             }
             
-            response = requests.get(self.base_url, params=params, timeout=10)
+            response = http_client.get(self.base_url, params=params)
             response.raise_for_status()
             data = response.json()
             
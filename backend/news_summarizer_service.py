@@ -3,10 +3,11 @@ News Summarizer Service - AI-powered news summarization using Perplexity
 """
 
 import os
-import requests
 from typing import Dict, List
 from datetime import datetime, timedelta
 
+from services.http_client import http_client
+
 class NewsSummarizerService:
     def __init__(self):
         self.api_key = os.getenv('PERPLEXITY_API_KEY')
@@ -128,7 +129,7 @@ KEY_POINTS:
             "max_tokens": 300
         }
         
-        response = requests.post(self.api_url, json=payload, headers=headers, timeout=15)
+        response = http_client.post(self.api_url, json=payload, headers=headers, timeout=15)
         response.raise_for_status()
         
         result = response.json()
@@ -225,7 +226,7 @@ KEY_POINTS:
             "max_tokens": 250
         }
         
-        response = requests.post(self.api_url, json=payload, headers=headers, timeout=15)
+        response = http_client.post(self.api_url, json=payload, headers=headers, timeout=15)
         response.raise_for_status()
         
         result = response.json()
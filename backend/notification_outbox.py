@@ -0,0 +1,523 @@
+"""
+Notification Outbox
+Durable email queue drained in batches by a background dispatcher
+"""
+import logging
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional, Tuple
+
+import boto3
+
+import auth_service  # noqa: F401 - creates the users.db tables the migrations build on
+from db import users_db
+from leader_lease import LeaderLease
+from metrics import NOTIFICATIONS
+from migrations import USERS_MIGRATIONS, migrate
+from services.rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_SES = 'ses'
+CHANNEL_SMTP = 'smtp'
+
+# Subject used when several messages of one kind are merged for a recipient
+DIGEST_SUBJECTS = {
+    'price_alert': '🚨 {count} price alerts triggered',
+}
+
+
+class TransportNotConfigured(Exception):
+    """The channel has no credentials; retrying will not help"""
+
+
+class SMTPTransport:
+    """One authenticated SMTP session per batch (STARTTLS + login once)"""
+
+    def __init__(self):
+        self.server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
+        self.port = int(os.getenv('SMTP_PORT', '587'))
+        self.user = os.getenv('SMTP_USER', '')
+        self.password = os.getenv('SMTP_PASSWORD', '')
+        self.timeout = float(os.getenv('SMTP_TIMEOUT', '30'))
+        self._conn = None
+
+    def open(self):
+        if not self.user or not self.password:
+            raise TransportNotConfigured("SMTP credentials not configured")
+        conn = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        try:
+            conn.starttls()
+            conn.login(self.user, self.password)
+        except Exception:
+            conn.close()
+            raise
+        self._conn = conn
+
+    def send(self, message: Dict):
+        mime = MIMEMultipart('alternative')
+        mime['From'] = message['sender'] or self.user
+        mime['To'] = message['recipient']
+        mime['Subject'] = message['subject']
+        mime.attach(MIMEText(message['body_text'], 'plain'))
+        if message.get('body_html'):
+            mime.attach(MIMEText(message['body_html'], 'html'))
+
+        try:
+            self._conn.send_message(mime)
+        except smtplib.SMTPServerDisconnected:
+            # Server dropped an idle session mid-batch: reconnect once
+            self.open()
+            self._conn.send_message(mime)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.quit()
+            except smtplib.SMTPException:
+                conn.close()
+
+
+class SESTransport:
+    """SES through one long-lived client (its HTTPS connections are pooled)"""
+
+    _client = None
+    _client_lock = threading.Lock()
+
+    def __init__(self):
+        self.region = os.getenv('SES_REGION', 'us-east-1')
+
+    def open(self):
+        if SESTransport._client is None:
+            with SESTransport._client_lock:
+                if SESTransport._client is None:
+                    SESTransport._client = boto3.client('ses', region_name=self.region)
+
+    def send(self, message: Dict):
+        body = {'Text': {'Data': message['body_text'], 'Charset': 'UTF-8'}}
+        if message.get('body_html'):
+            body['Html'] = {'Data': message['body_html'], 'Charset': 'UTF-8'}
+
+        SESTransport._client.send_email(
+            Source=message['sender'],
+            Destination={'ToAddresses': [message['recipient']]},
+            Message={
+                'Subject': {'Data': message['subject'], 'Charset': 'UTF-8'},
+                'Body': body
+            }
+        )
+
+    def close(self):
+        pass
+
+
+class NotificationOutbox:
+    """
+    Outbox table plus the dispatcher that drains it
+
+    - Callers enqueue and return immediately; delivery happens on the
+      dispatcher thread. It is started in every worker but only the one
+      holding the leader lease dispatches, so the token bucket and the
+      SMTP session are limits for the whole deployment, not per worker
+    - Rows are also claimed with a lease, so a dispatcher that dies
+      mid-send never has its messages sent twice by the next leader
+    - Each batch opens one session per channel and sends everything due
+      through it, paced by a token bucket (SES / SMTP send-rate limits)
+    - Failed sends are retried with exponential backoff, then marked failed
+    - Several digestible messages of the same kind for one recipient in a
+      batch (e.g. a burst of price alerts) go out as a single digest email
+    """
+
+    LOCK_KEY = 'notification-dispatcher:leader'
+
+    def __init__(self, db=None, transports: Optional[Dict] = None):
+        """
+        Args:
+            db: Database holding the outbox table
+            transports: Channel name -> transport (defaults to SES and SMTP)
+        """
+        self.db = db or users_db
+        self.transports = transports or {CHANNEL_SES: SESTransport(), CHANNEL_SMTP: SMTPTransport()}
+
+        self.enabled = os.getenv('NOTIFY_DISPATCHER_ENABLED', 'true').lower() == 'true'
+        self.batch_size = int(os.getenv('NOTIFY_BATCH_SIZE', '50'))
+        self.poll_interval = float(os.getenv('NOTIFY_POLL_INTERVAL', '5'))
+        self.max_attempts = int(os.getenv('NOTIFY_MAX_ATTEMPTS', '6'))
+        self.retry_backoff = float(os.getenv('NOTIFY_RETRY_BACKOFF', '30'))
+        self.max_backoff = float(os.getenv('NOTIFY_MAX_BACKOFF', '3600'))
+        self.claim_ttl = float(os.getenv('NOTIFY_CLAIM_TTL', '300'))
+        self.retention_days = int(os.getenv('NOTIFY_RETENTION_DAYS', '7'))
+        self.rate_limiter = TokenBucket(
+            rate=float(os.getenv('NOTIFY_RATE_PER_SEC', '10')),
+            capacity=float(os.getenv('NOTIFY_RATE_BURST', '10'))
+        )
+
+        self.lease = LeaderLease(
+            self.LOCK_KEY,
+            ttl=max(30, int(self.poll_interval * 6)),
+            lock_file=os.getenv('NOTIFY_DISPATCHER_LOCK_FILE', 'notification_dispatcher.lock')
+        )
+
+        self.redis_client = None
+        self._lease_held_at = 0.0
+        self._token = uuid.uuid4().hex
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._last_purge = 0.0
+
+        # Statistics
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.digests = 0
+
+        migrate(self.db, USERS_MIGRATIONS)
+
+    # ------------------------------------------------------------------
+    # Producers
+
+    def enqueue(self, recipient: str, subject: str, body_text: str, body_html: Optional[str] = None,
+                channel: str = CHANNEL_SES, kind: str = 'email', sender: Optional[str] = None,
+                user_id: Optional[int] = None, summary: Optional[str] = None,
+                digest_key: Optional[str] = None) -> Optional[int]:
+        """
+        Queue one email
+
+        Args:
+            recipient: To address
+            subject: Subject line
+            body_text: Plain-text body
+            body_html: Optional HTML body
+            channel: 'ses' or 'smtp'
+            kind: Message type, used for digests and stats
+            sender: From address (SMTP defaults to SMTP_USER)
+            user_id: Recipient's user ID, if any
+            summary: One line describing the message inside a digest
+            digest_key: Messages sharing recipient and key may be merged
+
+        Returns:
+            Outbox row ID or None if it could not be queued
+        """
+        ids = self.enqueue_many([{
+            'recipient': recipient, 'subject': subject, 'body_text': body_text,
+            'body_html': body_html, 'channel': channel, 'kind': kind, 'sender': sender,
+            'user_id': user_id, 'summary': summary, 'digest_key': digest_key
+        }])
+        return ids[0] if ids else None
+
+    def enqueue_many(self, messages: List[Dict]) -> List[int]:
+        """Queue several emails in one transaction (keys as for enqueue)"""
+        if not messages:
+            return []
+
+        now = time.time()
+        conn = self.db.connect()
+        try:
+            ids = []
+            cursor = conn.cursor()
+            for message in messages:
+                channel = message.get('channel', CHANNEL_SES)
+                sender = message.get('sender') or (os.getenv('SMTP_USER', '') if channel == CHANNEL_SMTP else '')
+                cursor.execute('''
+                    INSERT INTO notification_outbox
+                    (channel, kind, user_id, sender, recipient, subject, body_text, body_html,
+                     summary, digest_key, next_attempt_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (channel, message.get('kind', 'email'), message.get('user_id'), sender,
+                      message['recipient'], message['subject'], message['body_text'],
+                      message.get('body_html'), message.get('summary'), message.get('digest_key'), now))
+                ids.append(cursor.lastrowid)
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Error queueing notifications: {str(e)}")
+            return []
+        finally:
+            conn.close()
+
+        self.enqueued += len(ids)
+        NOTIFICATIONS.labels('queued').inc(len(ids))
+        self._wake.set()
+        return ids
+
+    # ------------------------------------------------------------------
+    # Dispatcher
+
+    def start(self, redis_client=None):
+        """Start the dispatcher thread (once per process)"""
+        if not self.enabled:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self.redis_client = redis_client
+            self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                processed = 0
+                if self._hold_leadership():
+                    processed = self.process_batch()
+                    if time.time() - self._last_purge > 3600:
+                        self.purge()
+            except Exception as e:
+                processed = 0
+                logger.error(f"Notification dispatch failed: {str(e)}")
+
+            # A full batch means more may be waiting
+            if processed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _hold_leadership(self) -> bool:
+        """Acquire or renew the leader lease; True if this process should dispatch"""
+        self._lease_held_at = time.monotonic()
+        return self.lease.hold(self.redis_client)
+
+    def _keep_leadership(self) -> bool:
+        """Renew the lease during a long batch; True while dispatching may go on"""
+        if not self.lease.is_leader:
+            # Not dispatching under the lease (process_batch called directly)
+            return self._lease_held_at == 0.0
+        if time.monotonic() - self._lease_held_at < self.lease.ttl / 3:
+            return True
+        if self._hold_leadership():
+            return True
+        logger.warning("Notification dispatcher lost leadership mid-batch")
+        return False
+
+    def _claim(self) -> List[Dict]:
+        """
+        Lease the next due messages to this dispatcher
+
+        A row whose claim expired mid-send counts that send as an attempt,
+        so a message that keeps crashing or hanging dispatchers still ends
+        up failed after max_attempts.
+        """
+        now = time.time()
+        conn = self.db.connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute('BEGIN IMMEDIATE')
+            # Due pending rows, plus rows whose claimant died mid-send
+            rows = conn.execute('''
+                SELECT * FROM notification_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'sending' AND claimed_until < ?)
+                ORDER BY id
+                LIMIT ?
+            ''', (now, now, self.batch_size)).fetchall()
+
+            claimed, exhausted = [], []
+            for row in rows:
+                row = dict(row)
+                if row['status'] == 'sending':
+                    row['attempts'] += 1
+                    if row['attempts'] >= self.max_attempts:
+                        exhausted.append(row)
+                        continue
+                claimed.append(row)
+
+            conn.executemany('''
+                UPDATE notification_outbox
+                SET status = 'sending', attempts = ?, claimed_by = ?, claimed_until = ?
+                WHERE id = ?
+            ''', [(row['attempts'], self._token, now + self.claim_ttl, row['id']) for row in claimed])
+            conn.executemany('''
+                UPDATE notification_outbox
+                SET status = 'failed', attempts = ?, last_error = ?,
+                    claimed_by = NULL, claimed_until = NULL
+                WHERE id = ?
+            ''', [(row['attempts'], 'Dispatcher stopped mid-send', row['id']) for row in exhausted])
+            conn.commit()
+        finally:
+            conn.close()
+
+        if exhausted:
+            self.failed += len(exhausted)
+            NOTIFICATIONS.labels('failed').inc(len(exhausted))
+            for row in exhausted:
+                logger.error(f"Notification {row['id']} to {row['recipient']} failed: "
+                             f"dispatcher stopped mid-send {row['attempts']} times")
+        return claimed
+
+    def _digest(self, rows: List[Dict]) -> List[Tuple[Dict, List[Dict]]]:
+        """Group claimed rows into outgoing messages: (message, rows it covers)"""
+        outgoing = []
+        groups: Dict[Tuple, List[Dict]] = {}
+        for row in rows:
+            if row['digest_key']:
+                groups.setdefault((row['channel'], row['recipient'], row['digest_key']), []).append(row)
+            else:
+                outgoing.append((row, [row]))
+
+        for (channel, recipient, _), members in groups.items():
+            if len(members) == 1:
+                outgoing.append((members[0], members))
+                continue
+
+            first = members[0]
+            subject = DIGEST_SUBJECTS.get(first['kind'], '{count} notifications').format(count=len(members))
+            lines = '\n'.join(f"- {m['summary'] or m['subject']}" for m in members)
+            body_text = f"""
+{subject}
+
+{lines}
+
+Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+View your portfolio: https://stonkmarketanalyzer.com
+
+---
+Stonk Market Analyzer
+"""
+            outgoing.append(({
+                'channel': channel, 'sender': first['sender'], 'recipient': recipient,
+                'subject': subject, 'body_text': body_text, 'body_html': None
+            }, members))
+            self.digests += 1
+        return outgoing
+
+    def process_batch(self) -> int:
+        """
+        Claim and send one batch
+
+        Returns:
+            Number of outbox rows processed
+        """
+        rows = self._claim()
+        if not rows:
+            return 0
+
+        by_channel: Dict[str, List[Tuple[Dict, List[Dict]]]] = {}
+        for message, members in self._digest(rows):
+            by_channel.setdefault(message['channel'], []).append((message, members))
+
+        sent, retry, failed, released = [], [], [], []
+        for channel, messages in by_channel.items():
+            transport = self.transports.get(channel)
+            try:
+                if transport is None:
+                    raise TransportNotConfigured(f"Unknown channel: {channel}")
+                transport.open()
+            except Exception as e:
+                target = failed if isinstance(e, TransportNotConfigured) else retry
+                for _, members in messages:
+                    target.extend((row, str(e)) for row in members)
+                continue
+
+            try:
+                for message, members in messages:
+                    # Another worker is leader now: hand the rest back unsent
+                    if released or not self._keep_leadership():
+                        released.extend(members)
+                        continue
+                    self.rate_limiter.acquire()
+                    try:
+                        transport.send(message)
+                        sent.extend(members)
+                    except Exception as e:
+                        retry.extend((row, str(e)) for row in members)
+            finally:
+                try:
+                    transport.close()
+                except Exception:
+                    pass
+
+        self._record(sent, retry, failed, released)
+        return len(rows)
+
+    def _record(self, sent: List[Dict], retry: List[Tuple[Dict, str]], failed: List[Tuple[Dict, str]],
+                released: Optional[List[Dict]] = None):
+        """Write back the outcome of a batch in one transaction (released rows were never sent)"""
+        now = time.time()
+        rescheduled = []
+        for row, error in retry:
+            attempts = row['attempts'] + 1
+            if attempts >= self.max_attempts:
+                failed.append((row, error))
+            else:
+                delay = min(self.max_backoff, self.retry_backoff * (2 ** (attempts - 1)))
+                rescheduled.append((attempts, now + delay, error[:500], row['id']))
+
+        conn = self.db.connect()
+        try:
+            conn.executemany('''
+                UPDATE notification_outbox
+                SET status = 'sent', sent_at = CURRENT_TIMESTAMP, attempts = attempts + 1,
+                    claimed_by = NULL, claimed_until = NULL
+                WHERE id = ?
+            ''', [(row['id'],) for row in sent])
+            conn.executemany('''
+                UPDATE notification_outbox
+                SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ?,
+                    claimed_by = NULL, claimed_until = NULL
+                WHERE id = ?
+            ''', rescheduled)
+            conn.executemany('''
+                UPDATE notification_outbox
+                SET status = 'failed', attempts = attempts + 1, last_error = ?,
+                    claimed_by = NULL, claimed_until = NULL
+                WHERE id = ?
+            ''', [(error[:500], row['id']) for row, error in failed])
+            conn.executemany('''
+                UPDATE notification_outbox
+                SET status = 'pending', claimed_by = NULL, claimed_until = NULL
+                WHERE id = ?
+            ''', [(row['id'],) for row in released or []])
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.sent += len(sent)
+        self.retried += len(rescheduled)
+        self.failed += len(failed)
+        NOTIFICATIONS.labels('sent').inc(len(sent))
+        NOTIFICATIONS.labels('retried').inc(len(rescheduled))
+        NOTIFICATIONS.labels('failed').inc(len(failed))
+        for row, error in failed:
+            logger.error(f"Notification {row['id']} to {row['recipient']} failed: {error}")
+
+    def purge(self):
+        """Delete delivered messages older than the retention period"""
+        self._last_purge = time.time()
+        cutoff = (datetime.utcnow() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+        conn = self.db.connect()
+        try:
+            conn.execute("DELETE FROM notification_outbox WHERE status = 'sent' AND sent_at < ?", (cutoff,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_stats(self) -> Dict:
+        """Get queue and delivery statistics"""
+        conn = self.db.connect()
+        try:
+            counts = dict(conn.execute(
+                'SELECT status, COUNT(*) FROM notification_outbox GROUP BY status'
+            ).fetchall())
+        finally:
+            conn.close()
+        return {
+            'queue': counts,
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+            'digests': self.digests
+        }
+
+
+# Global instance
+notification_outbox = NotificationOutbox()
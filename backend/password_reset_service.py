@@ -6,24 +6,21 @@ Handles password reset tokens and email notifications
 import os
 import secrets
 import sqlite3
+from db import users_db
 from datetime import datetime, timedelta
-import boto3
-from botocore.exceptions import ClientError
-
-DB_PATH = 'users.db'
+from notification_outbox import notification_outbox
 
 class PasswordResetService:
     """Handle password reset functionality"""
     
     def __init__(self):
-        self.ses_client = boto3.client('ses', region_name='us-east-1')
         self.from_email = 'password-reset@stonkmarketanalyzer.com'
         self.frontend_url = os.getenv('FRONTEND_URL', 'https://stonkmarketanalyzer.com')
         self.init_db()
     
     def init_db(self):
         """Initialize password reset tokens table"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         c.execute('''
             CREATE TABLE IF NOT EXISTS password_reset_tokens (
@@ -41,7 +38,7 @@ class PasswordResetService:
     
     def generate_reset_token(self, email):
         """Generate a password reset token for a user"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         
         # Check if user exists
@@ -67,13 +64,13 @@ class PasswordResetService:
         conn.commit()
         conn.close()
         
-        # Send email
-        self.send_reset_email(email, name, token)
+        # Queue the email; the dispatcher delivers it off the request thread
+        self.send_reset_email(email, name, token, user_id)
         
         return token, None
     
-    def send_reset_email(self, email, name, token):
-        """Send password reset email"""
+    def send_reset_email(self, email, name, token, user_id=None):
+        """Queue the password reset email"""
         reset_link = f"{self.frontend_url}/reset-password?token={token}"
         
         subject = "Reset Your Password - Stonk Market Analyzer"
@@ -177,27 +174,24 @@ Stonk Market Analyzer Team
 </html>
 """
         
-        try:
-            response = self.ses_client.send_email(
-                Source=self.from_email,
-                Destination={'ToAddresses': [email]},
-                Message={
-                    'Subject': {'Data': subject, 'Charset': 'UTF-8'},
-                    'Body': {
-                        'Text': {'Data': body_text, 'Charset': 'UTF-8'},
-                        'Html': {'Data': body_html, 'Charset': 'UTF-8'}
-                    }
-                }
-            )
-            print(f"[PASSWORD_RESET] Email sent to {email}")
-            return True
-        except ClientError as e:
-            print(f"[PASSWORD_RESET] Error sending email: {e.response['Error']['Message']}")
+        outbox_id = notification_outbox.enqueue(
+            recipient=email,
+            subject=subject,
+            body_text=body_text,
+            body_html=body_html,
+            kind='password_reset',
+            sender=self.from_email,
+            user_id=user_id
+        )
+        if not outbox_id:
+            print(f"[PASSWORD_RESET] Error queueing email to {email}")
             return False
+        print(f"[PASSWORD_RESET] Email queued for {email}")
+        return True
     
     def verify_reset_token(self, token):
         """Verify if a reset token is valid"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         
         c.execute('''
@@ -232,7 +226,7 @@ Stonk Market Analyzer Team
         if error:
             return False, error
         
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         
         # Update password
@@ -249,7 +243,7 @@ Stonk Market Analyzer Team
     
     def cleanup_expired_tokens(self):
         """Remove expired tokens (run periodically)"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         c = conn.cursor()
         
         c.execute('''
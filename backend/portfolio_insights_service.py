@@ -6,10 +6,9 @@ Analyzes user portfolios and generates AI-powered insights
 import os
 from datetime import datetime, timedelta
 from services.perplexity_service import PerplexityService
-from services.stock_price_service import StockPriceService
+from services.quote_store import quote_store
 import sqlite3
-
-DB_PATH = 'users.db'
+from db import users_db
 
 # Simple in-memory cache
 insights_cache = {}
@@ -18,7 +17,6 @@ CACHE_DURATION = timedelta(hours=1)
 class PortfolioInsightsService:
     def __init__(self):
         self.perplexity = PerplexityService(os.getenv('PERPLEXITY_API_KEY'))
-        self.stock_service = StockPriceService()
     
     def get_portfolio_insights(self, user_id):
         """Get AI-generated insights for user's portfolio"""
@@ -86,7 +84,7 @@ class PortfolioInsightsService:
     
     def _get_user_portfolio(self, user_id):
         """Fetch user's portfolio from database"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
         
@@ -100,10 +98,11 @@ class PortfolioInsightsService:
         holdings = [dict(row) for row in c.fetchall()]
         conn.close()
         
-        # Enrich with current prices
+        # Enrich with current prices from the shared quote store
+        quotes = quote_store.get_multiple_prices([h['ticker'] for h in holdings])
         for holding in holdings:
             try:
-                price_data = self.stock_service.get_stock_price(holding['ticker'])
+                price_data = quotes.get(holding['ticker'], {})
                 holding['current_price'] = price_data.get('price', holding['purchase_price'])
                 holding['current_value'] = holding['current_price'] * holding['shares']
                 holding['gain_loss'] = (holding['current_price'] - holding['purchase_price']) * holding['shares']
@@ -2,50 +2,65 @@
 Portfolio Service - Enhanced portfolio management with real-time prices and analytics
 """
 
+import os
 import sqlite3
-from datetime import datetime, timedelta
-from typing import Dict, List, Any
-from services.stock_price_service import stock_price_service
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+from db import users_db
+from services.quote_store import quote_store
 
-DB_PATH = 'users.db'
 
 class PortfolioService:
     """Service for portfolio management and analytics"""
     
     def __init__(self):
-        self.price_cache = {}  # Cache prices for 1 minute
-        self.cache_expiry = {}
+        # Overall deadline for pricing a whole portfolio; quotes that miss it
+        # are shown without a current value instead of delaying the response
+        self.quote_timeout = float(os.getenv('PORTFOLIO_QUOTE_TIMEOUT', '5'))
     
-    def get_current_price(self, ticker: str) -> float:
-        """Get current stock price with caching"""
-        now = datetime.now()
+    def get_current_quotes(self, tickers: List[str], timeout: Optional[float] = None) -> Dict[str, Dict]:
+        """
+        Get quotes for many tickers at once
         
-        # Check cache
-        if ticker in self.price_cache:
-            if ticker in self.cache_expiry and now < self.cache_expiry[ticker]:
-                return self.price_cache[ticker]
+        Served from the shared quote store, which only fetches the stale
+        tickers, in concurrent batches that share one deadline.
         
-        # Fetch new price
+        Args:
+            tickers: Stock symbols (duplicates are fetched once)
+            timeout: Overall deadline in seconds (defaults to quote_timeout)
+            
+        Returns:
+            Dict mapping ticker to quote; tickers that failed are left out
+        """
         try:
-            price_data = stock_price_service.get_stock_price(ticker)
-            if price_data and 'price' in price_data:
-                price = price_data['price']
-                self.price_cache[ticker] = price
-                self.cache_expiry[ticker] = now + timedelta(minutes=1)
-                return price
+            return quote_store.get_multiple_prices(
+                tickers, timeout=timeout if timeout is not None else self.quote_timeout
+            )
         except Exception as e:
-            print(f"Error fetching price for {ticker}: {e}")
-        
-        return None
+            print(f"Error fetching prices: {e}")
+            return {}
     
-    def calculate_holding_metrics(self, holding: Dict) -> Dict:
-        """Calculate metrics for a single holding"""
+    def get_current_price(self, ticker: str) -> float:
+        """Get current stock price from the shared quote store"""
+        quote = self.get_current_quotes([ticker]).get(ticker)
+        return quote['price'] if quote else None
+    
+    def calculate_holding_metrics(self, holding: Dict, quote: Optional[Dict] = None) -> Dict:
+        """
+        Calculate metrics for a single holding
+        
+        Args:
+            holding: Portfolio row
+            quote: Quote from a prefetched snapshot (fetched if omitted)
+        """
         ticker = holding['ticker']
         shares = float(holding['shares'])
         purchase_price = float(holding['purchase_price'])
         
         # Get current price
-        current_price = self.get_current_price(ticker)
+        if quote is None:
+            quote = self.get_current_quotes([ticker]).get(ticker)
+        current_price = quote['price'] if quote else None
         
         if current_price is None:
             # If we can't get current price, return basic info
@@ -65,6 +80,11 @@ class PortfolioService:
         unrealized_gain = current_value - cost_basis
         return_percentage = (unrealized_gain / cost_basis) * 100 if cost_basis > 0 else 0
         
+        # Day change comes straight from the quote (vs. previous close)
+        change = quote.get('change')
+        day_change = round(change * shares, 2) if change is not None else None
+        day_change_percent = quote.get('change_percent')
+        
         return {
             **holding,
             'current_price': round(current_price, 2),
@@ -73,13 +93,13 @@ class PortfolioService:
             'unrealized_gain': round(unrealized_gain, 2),
             'return_percentage': round(return_percentage, 2),
             'return_dollar': round(unrealized_gain, 2),
-            'day_change': None,  # TODO: Add day change calculation
-            'day_change_percent': None
+            'day_change': day_change,
+            'day_change_percent': day_change_percent
         }
     
     def get_portfolio_with_metrics(self, user_id: int) -> Dict[str, Any]:
         """Get portfolio with real-time prices and metrics"""
-        conn = sqlite3.connect(DB_PATH)
+        conn = users_db.connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -108,11 +128,13 @@ class PortfolioService:
                 }
             }
         
-        # Calculate metrics for each holding
-        enriched_holdings = []
-        for holding in holdings:
-            enriched = self.calculate_holding_metrics(holding)
-            enriched_holdings.append(enriched)
+        # Price every distinct ticker in one concurrent batch, then value
+        # all lots from that snapshot
+        quotes = self.get_current_quotes([holding['ticker'] for holding in holdings])
+        enriched_holdings = [
+            self.calculate_holding_metrics(holding, quotes.get(holding['ticker'], {}))
+            for holding in holdings
+        ]
         
         # Calculate portfolio summary
         summary = self.calculate_portfolio_summary(enriched_holdings)
@@ -2,27 +2,46 @@
 Price Alerts Service
 Manages price alerts and notifications
 """
+import os
 import sqlite3
 import logging
+import threading
+import time
 from datetime import datetime
 from typing import List, Dict, Optional
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import os
+
+from alert_index import AlertIndex
+from db import Database, alerts_db, users_db
+from migrations import ALERTS_MIGRATIONS, migrate
+from notification_outbox import notification_outbox
 
 logger = logging.getLogger(__name__)
 
 class PriceAlertsService:
     """Manage price alerts for users"""
     
-    def __init__(self, db_path='stonk_market.db'):
-        self.db_path = db_path
+    def __init__(self, db_path=None):
+        # Shared pool unless a different database file is requested
+        self.db = Database(db_path) if db_path and db_path != alerts_db.path else alerts_db
+        self.db_path = self.db.path
+        
+        # Matching engine: loaded once, then kept current from the
+        # price_alert_changes log whenever another connection (API request,
+        # other worker) changes the table. Its own writes go through
+        # _watch_conn, which data_version ignores.
+        self.index = AlertIndex()
+        self._watch_conn = None
+        self._data_version = None
+        self._change_seq = None
+        self._last_prune = 0.0
+        self.change_retention_hours = int(os.getenv('ALERT_CHANGE_LOG_RETENTION_HOURS', '24'))
+        self._index_lock = threading.Lock()
+        
         self.init_db()
     
     def init_db(self):
         """Initialize alerts table"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.db.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -44,10 +63,12 @@ class PriceAlertsService:
         
         conn.commit()
         conn.close()
+
+        migrate(self.db, ALERTS_MIGRATIONS)
     
     def create_alert(self, user_id: int, ticker: str, alert_type: str,
                     target_price: float = None, percentage_change: float = None,
-                    condition: str = 'above') -> Optional[int]:
+                    condition: str = 'above', reference_price: float = None) -> Optional[int]:
         """
         Create a new price alert
         
@@ -58,19 +79,22 @@ class PriceAlertsService:
             target_price: Target price (for price alerts)
             percentage_change: Percentage change (for percentage alerts)
             condition: 'above', 'below', 'up', 'down'
+            reference_price: Price percentage alerts are measured from
+                (the first checked price is used if omitted)
         
         Returns:
             Alert ID or None
         """
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.db.connect()
             cursor = conn.cursor()
             
             cursor.execute('''
                 INSERT INTO price_alerts 
-                (user_id, ticker, alert_type, target_price, percentage_change, condition)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, ticker.upper(), alert_type, target_price, percentage_change, condition))
+                (user_id, ticker, alert_type, target_price, percentage_change, condition, reference_price)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, ticker.upper(), alert_type, target_price, percentage_change, condition,
+                  reference_price if alert_type == 'percentage' else None))
             
             alert_id = cursor.lastrowid
             conn.commit()
@@ -86,7 +110,7 @@ class PriceAlertsService:
     def get_user_alerts(self, user_id: int, active_only: bool = True) -> List[Dict]:
         """Get all alerts for a user"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.db.connect()
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -113,7 +137,7 @@ class PriceAlertsService:
     def delete_alert(self, alert_id: int, user_id: int) -> bool:
         """Delete an alert"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.db.connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -130,84 +154,227 @@ class PriceAlertsService:
             logger.error(f"Error deleting alert: {str(e)}")
             return False
     
-    def check_alerts(self, ticker: str, current_price: float) -> List[Dict]:
+    # Only the columns matching and notification need, to keep loads cheap
+    _INDEX_COLUMNS = '''id, user_id, ticker, alert_type, target_price, percentage_change,
+                   condition, reference_price, created_at'''
+    
+    def _sync_index(self):
         """
-        Check if any alerts should be triggered for a ticker
+        Bring the alert index up to date with the table (index lock held)
+        
+        Nothing is read unless PRAGMA data_version shows another connection
+        wrote. Then only the alerts logged in price_alert_changes since the
+        last sync are re-read, by primary key. The whole table is loaded on
+        the first sync, after a failed write, or if the log was pruned past
+        this process's position.
+        """
+        if self._watch_conn is None:
+            self._watch_conn = self.db.dedicated()
+            self._watch_conn.row_factory = sqlite3.Row
+        
+        conn = self._watch_conn
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._data_version:
+            return
+        
+        # One read snapshot, so the log position matches the rows read
+        conn.execute('BEGIN')
+        try:
+            if self._change_seq is None or not self._apply_changes():
+                self._reload_index()
+        finally:
+            conn.commit()
+        self._data_version = version
+        
+        self._prune_changes()
+    
+    def _last_change_seq(self) -> int:
+        """Highest sequence number ever logged (survives pruning)"""
+        row = self._watch_conn.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'price_alert_changes'"
+        ).fetchone()
+        return row[0] if row else 0
+    
+    def _reload_index(self):
+        """Load every active alert into the index"""
+        self._change_seq = self._last_change_seq()
+        rows = self._watch_conn.execute(f'''
+            SELECT {self._INDEX_COLUMNS}
+            FROM price_alerts 
+            WHERE is_active = 1 AND triggered = 0
+        ''').fetchall()
+        self.index.load([dict(row) for row in rows])
+        logger.info(f"Loaded {len(self.index)} active alerts into the alert index")
+    
+    def _apply_changes(self) -> bool:
+        """
+        Apply logged alert changes to the index
+        
+        Returns:
+            False if the index should be reloaded instead: changes were
+            pruned before this process saw them, or there are so many that
+            one sorted bulk load is cheaper than placing them one by one
+        """
+        changes = self._watch_conn.execute(
+            'SELECT seq, alert_id FROM price_alert_changes WHERE seq > ? ORDER BY seq',
+            (self._change_seq,)
+        ).fetchall()
+        if not changes:
+            return self._last_change_seq() <= self._change_seq
+        if changes[0]['seq'] != self._change_seq + 1:
+            return False
+        
+        alert_ids = list(dict.fromkeys(change['alert_id'] for change in changes))
+        if len(alert_ids) > max(1000, len(self.index) // 2):
+            return False
+        
+        current = {}
+        for i in range(0, len(alert_ids), 500):
+            chunk = alert_ids[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for row in self._watch_conn.execute(f'''
+                SELECT {self._INDEX_COLUMNS}
+                FROM price_alerts 
+                WHERE id IN ({placeholders}) AND is_active = 1 AND triggered = 0
+            ''', chunk):
+                current[row['id']] = dict(row)
+        
+        # Re-place every changed alert; deleted, deactivated and triggered ones just go
+        for alert_id in alert_ids:
+            self.index.remove(alert_id)
+            if alert_id in current:
+                self.index.add(current[alert_id])
+        
+        self._change_seq = changes[-1]['seq']
+        return True
+    
+    def _prune_changes(self):
+        """Drop change log entries older than the retention (at most hourly)"""
+        now = time.time()
+        if now - self._last_prune < 3600:
+            return
+        self._last_prune = now
+        try:
+            with self._watch_conn:
+                self._watch_conn.execute(
+                    "DELETE FROM price_alert_changes WHERE changed_at < datetime('now', ?)",
+                    (f'-{self.change_retention_hours} hours',)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not prune the alert change log: {str(e)}")
+    
+    def active_tickers(self) -> List[str]:
+        """Tickers with at least one active, untriggered alert"""
+        with self._index_lock:
+            self._sync_index()
+            return self.index.tickers()
+    
+    def check_prices(self, prices: Dict[str, float]) -> List[Dict]:
+        """
+        Trigger every alert crossed by a batch of prices
+        
+        Matching is done against the in-memory index, O(log n + k) per
+        ticker; triggered alerts (and newly anchored percentage alerts) are
+        written back in one transaction. An alert is only returned if this
+        call is the one that flipped it to triggered, so a stale index or a
+        second scanner can never notify it twice.
         
         Args:
-            ticker: Stock symbol
-            current_price: Current stock price
+            prices: Mapping of ticker to current price
             
         Returns:
-            List of triggered alerts
+            List of triggered alerts, each with the triggering price
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Get active alerts for this ticker
-            cursor.execute('''
-                SELECT * FROM price_alerts 
-                WHERE ticker = ? AND is_active = 1 AND triggered = 0
-            ''', (ticker.upper(),))
-            
-            alerts = [dict(row) for row in cursor.fetchall()]
-            triggered_alerts = []
-            
-            for alert in alerts:
-                should_trigger = False
+            with self._index_lock:
+                self._sync_index()
                 
-                if alert['alert_type'] == 'price':
-                    if alert['condition'] == 'above' and current_price >= alert['target_price']:
-                        should_trigger = True
-                    elif alert['condition'] == 'below' and current_price <= alert['target_price']:
-                        should_trigger = True
+                triggered_at = datetime.now().isoformat()
+                matched_alerts = []
+                anchored_alerts = []
+                for ticker, current_price in prices.items():
+                    if current_price is None:
+                        continue
+                    triggered, anchored = self.index.match(ticker.upper(), float(current_price))
+                    for alert in triggered:
+                        alert.update(triggered=1, triggered_at=triggered_at, triggered_price=current_price)
+                    matched_alerts.extend(triggered)
+                    anchored_alerts.extend(anchored)
                 
-                if should_trigger:
-                    # Mark as triggered
-                    cursor.execute('''
+                if not matched_alerts and not anchored_alerts:
+                    return []
+                
+                conn = self._watch_conn
+                try:
+                    # Take the write lock first, so no other writer can
+                    # trigger or remove an alert between the read and the write
+                    conn.execute('BEGIN IMMEDIATE')
+                    eligible = set()
+                    matched_ids = [alert['id'] for alert in matched_alerts]
+                    for i in range(0, len(matched_ids), 500):
+                        chunk = matched_ids[i:i + 500]
+                        placeholders = ','.join('?' * len(chunk))
+                        eligible.update(row[0] for row in conn.execute(f'''
+                            SELECT id FROM price_alerts 
+                            WHERE id IN ({placeholders}) AND is_active = 1 AND triggered = 0
+                        ''', chunk))
+                    triggered_alerts = [alert for alert in matched_alerts if alert['id'] in eligible]
+                    conn.executemany('''
                         UPDATE price_alerts 
                         SET triggered = 1, triggered_at = ? 
                         WHERE id = ?
-                    ''', (datetime.now().isoformat(), alert['id']))
-                    
-                    triggered_alerts.append(alert)
-            
-            conn.commit()
-            conn.close()
-            
-            return triggered_alerts
+                    ''', [(triggered_at, alert['id']) for alert in triggered_alerts])
+                    conn.executemany('''
+                        UPDATE price_alerts 
+                        SET reference_price = ? 
+                        WHERE id = ? AND reference_price IS NULL
+                    ''', [(alert['reference_price'], alert['id']) for alert in anchored_alerts])
+                    conn.commit()
+                except sqlite3.Error:
+                    conn.rollback()
+                    # Index and table disagree now; rebuild from the table next time
+                    self._data_version = None
+                    self._change_seq = None
+                    raise
+                
+                skipped = len(matched_alerts) - len(triggered_alerts)
+                if skipped:
+                    logger.info(f"{skipped} matched alerts were already triggered or removed elsewhere")
+                return triggered_alerts
             
         except Exception as e:
             logger.error(f"Error checking alerts: {str(e)}")
             return []
     
-    def send_alert_notification(self, alert: Dict, current_price: float, user_email: str):
-        """Send email notification for triggered alert"""
-        try:
-            # Email configuration
-            smtp_server = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
-            smtp_port = int(os.getenv('SMTP_PORT', '587'))
-            smtp_user = os.getenv('SMTP_USER', '')
-            smtp_password = os.getenv('SMTP_PASSWORD', '')
-            
-            if not smtp_user or not smtp_password:
-                logger.warning("SMTP credentials not configured")
-                return
-            
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = smtp_user
-            msg['To'] = user_email
-            msg['Subject'] = f"🚨 Price Alert: {alert['ticker']} reached ${current_price}"
-            
-            body = f"""
+    def check_alerts(self, ticker: str, current_price: float) -> List[Dict]:
+        """
+        Check if any alerts should be triggered for a ticker
+        
+        Args:
+            ticker: Stock symbol
+            current_price: Current stock price
+            
+        Returns:
+            List of triggered alerts
+        """
+        return self.check_prices({ticker.upper(): current_price})
+    
+    def _alert_message(self, alert: Dict, current_price: float, user_email: str) -> Dict:
+        """Build the outbox message for a triggered alert"""
+        if alert.get('alert_type') == 'percentage':
+            reference = alert.get('reference_price')
+            condition = f"{alert['condition']} {abs(alert['percentage_change'] or 0)}%"
+            if reference:
+                condition += f" from ${reference}"
+        else:
+            condition = f"{alert['condition']} ${alert['target_price']}"
+        
+        body = f"""
             Your price alert has been triggered!
             
             Stock: {alert['ticker']}
             Current Price: ${current_price}
-            Alert Condition: {alert['condition']} ${alert['target_price']}
+            Alert Condition: {condition}
             
             Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
             
@@ -216,21 +383,53 @@ class PriceAlertsService:
             ---
             Stonk Market Analyzer
             """
+        
+        return {
+            'channel': 'smtp',
+            'kind': 'price_alert',
+            'user_id': alert.get('user_id'),
+            'recipient': user_email,
+            'subject': f"🚨 Price Alert: {alert['ticker']} reached ${current_price}",
+            'body_text': body,
+            'summary': f"{alert['ticker']} at ${current_price} ({condition})",
+            # Alerts firing together for one user go out as a single digest
+            'digest_key': 'price_alert'
+        }
+    
+    def send_alert_notification(self, alert: Dict, current_price: float, user_email: str):
+        """Queue an email notification for a triggered alert"""
+        if notification_outbox.enqueue_many([self._alert_message(alert, current_price, user_email)]):
+            logger.info(f"Queued alert notification to {user_email} for {alert['ticker']}")
+    
+    def notify_triggered(self, alerts: List[Dict]) -> int:
+        """
+        Queue notifications for a batch of triggered alerts
+        
+        Args:
+            alerts: Alerts returned by check_prices (with triggered_price)
             
-            msg.attach(MIMEText(body, 'plain'))
-            
-            # Send email
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.starttls()
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
-            server.quit()
-            
-            logger.info(f"Sent alert notification to {user_email} for {alert['ticker']}")
-            
-        except Exception as e:
-            logger.error(f"Error sending alert notification: {str(e)}")
-
+        Returns:
+            Number of notifications queued
+        """
+        user_ids = sorted({alert['user_id'] for alert in alerts})
+        if not user_ids:
+            return 0
+        
+        # Users live in users.db; look all recipients up in one query
+        conn = users_db.connect()
+        try:
+            placeholders = ','.join('?' * len(user_ids))
+            emails = dict(conn.execute(
+                f'SELECT id, email FROM users WHERE id IN ({placeholders})', user_ids
+            ).fetchall())
+        finally:
+            conn.close()
+        
+        messages = [
+            self._alert_message(alert, alert['triggered_price'], emails[alert['user_id']])
+            for alert in alerts if alert['user_id'] in emails
+        ]
+        return len(notification_outbox.enqueue_many(messages))
 
 # Global instance
 price_alerts_service = PriceAlertsService()
@@ -8,6 +8,7 @@ import hashlib
 import secrets
 import os
 import time
+import zlib
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify
@@ -31,6 +32,15 @@ MAX_REQUESTS_PER_MINUTE = 10  # Max requests per minute per IP
 # Optional: IP Whitelist (set in .env as comma-separated IPs)
 ALLOWED_IPS = os.getenv('PORTAL_ALLOWED_IPS', '').split(',') if os.getenv('PORTAL_ALLOWED_IPS') else []
 
+def gzip_stream(chunks):
+    """Gzip-compress an iterator of text chunks on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
 def hash_password(password):
     """Hash password with SHA-256 and salt"""
     salt = os.getenv('PORTAL_SALT', secrets.token_hex(32))
@@ -399,16 +409,41 @@ def setup_portal_routes(app, analytics_service):
     @app.route(f'/api/{PORTAL_PATH}/analytics/export', methods=['GET'])
     @require_auth
     def portal_export():
-        """Export analytics as CSV"""
+        """
+        Stream analytics as CSV
+        
+        Query params: date, or start/end (YYYY-MM-DD); columns (comma-separated);
+        gzip=0 to disable compression for clients that accept gzip
+        """
         try:
             date = request.args.get('date')
-            csv_data = analytics_service.export_to_csv(date)
+            start = request.args.get('start') or date
+            end = request.args.get('end') or start
+            columns = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()]
+            
+            try:
+                dates, columns = analytics_service.plan_export(start, end, columns or None)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            from flask import Response, stream_with_context
+            chunks = analytics_service.iter_export_csv(dates, columns)
+            
+            label = dates[0] if len(dates) == 1 else f"{dates[0]}_to_{dates[-1]}"
+            headers = {
+                'Content-Disposition': f'attachment; filename=analytics_{label}.csv',
+                'Vary': 'Accept-Encoding'
+            }
+            
+            use_gzip = 'gzip' in request.accept_encodings and request.args.get('gzip') != '0'
+            if use_gzip:
+                chunks = gzip_stream(chunks)
+                headers['Content-Encoding'] = 'gzip'
             
-            from flask import Response
             return Response(
-                csv_data,
+                stream_with_context(chunks),
                 mimetype='text/csv',
-                headers={'Content-Disposition': f'attachment; filename=analytics_{date or "today"}.csv'}
+                headers=headers
             )
         except Exception as e:
             return jsonify({'error': str(e)}), 500
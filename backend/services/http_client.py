@@ -0,0 +1,113 @@
+"""
+Shared HTTP Client
+Pooled keep-alive connections for all outbound market data and LLM calls
+"""
+import os
+import time
+import logging
+from http.cookiejar import DefaultCookiePolicy
+from typing import Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import observe_upstream
+
+logger = logging.getLogger(__name__)
+
+# Default (connect, read) timeouts per upstream host, in seconds.
+# Callers can still pass an explicit timeout for a specific call.
+HOST_TIMEOUTS = {
+    'query1.finance.yahoo.com': (3.05, 5),
+    'query2.finance.yahoo.com': (3.05, 10),
+    'www.alphavantage.co': (3.05, 10),
+    'api.perplexity.ai': (5, 90),
+}
+DEFAULT_TIMEOUT = (3.05, 10)
+
+
+class HTTPClient:
+    """
+    Thin wrapper around a single requests.Session
+    Reuses TCP/TLS connections per host and applies a shared retry policy
+    """
+
+    def __init__(self):
+        # Number of per-host pools to keep, and connections kept per host
+        self.pool_connections = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+        self.pool_maxsize = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+        self.max_retries = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+        self.backoff_factor = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.3'))
+
+        self.session = self._build_session()
+
+    def _build_session(self) -> requests.Session:
+        """Create a session with pooled adapters and retry/backoff"""
+        # Connection errors are retried for every method (nothing was sent).
+        # Status and read retries only apply to idempotent methods, so LLM
+        # POSTs are never billed twice.
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=1,
+            status=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+            pool_block=False
+        )
+
+        session = requests.Session()
+        # The session is shared by every user and thread, so never keep
+        # cookies from one upstream response to send on later requests
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def timeout_for(self, url: str) -> Tuple[float, float]:
+        """Get the default timeout for the host of a URL"""
+        host = urlparse(url).hostname or ''
+        return HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT)
+
+    def request(self, method: str, url: str,
+                timeout: Optional[Union[float, Tuple[float, float]]] = None,
+                **kwargs) -> requests.Response:
+        """Send a request over the shared session"""
+        if timeout is None:
+            timeout = self.timeout_for(url)
+        
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            observe_upstream(url, method, status, time.perf_counter() - start)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Send a GET request"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """Send a POST request"""
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+
+# Global instance
+http_client = HTTPClient()
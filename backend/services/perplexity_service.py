@@ -1,6 +1,8 @@
 import requests
 import json
 
+from services.http_client import http_client
+
 class PerplexityService:
     """Service for interacting with Perplexity AI API"""
     
@@ -9,17 +11,8 @@ class PerplexityService:
         self.base_url = "https://api.perplexity.ai/chat/completions"
         self.model = "sonar-pro"  # Model with online search
     
-    def query(self, prompt, model=None):
-        """
-        Send a query to Perplexity AI
-        
-        Args:
-            prompt: The prompt to send
-            model: Optional model override
-            
-        Returns:
-            dict with 'content' and 'citations'
-        """
+    def _build_request(self, prompt, model=None, stream=False):
+        """Build headers and payload for a chat completion request"""
         if not self.api_key:
             raise ValueError("Perplexity API key is not configured")
         
@@ -43,12 +36,40 @@ class PerplexityService:
             "temperature": 0.2  # Lower temperature for more factual responses
         }
         
+        if stream:
+            payload["stream"] = True
+        
+        return headers, payload
+    
+    def _raise_api_error(self, e):
+        """Convert a requests exception into the service's error message"""
+        error_msg = str(e)
+        if hasattr(e, 'response') and e.response is not None:
+            try:
+                error_data = e.response.json()
+                error_msg = error_data.get('error', {}).get('message', error_msg)
+            except:
+                error_msg = e.response.text if e.response.text else error_msg
+        raise Exception(f"API error: {error_msg}")
+    
+    def query(self, prompt, model=None):
+        """
+        Send a query to Perplexity AI
+        
+        Args:
+            prompt: The prompt to send
+            model: Optional model override
+            
+        Returns:
+            dict with 'content' and 'citations'
+        """
+        headers, payload = self._build_request(prompt, model)
+        
         try:
-            response = requests.post(
+            response = http_client.post(
                 self.base_url,
                 headers=headers,
-                json=payload,
-                timeout=90  # Increased timeout
+                json=payload
             )
             
             response.raise_for_status()
@@ -67,13 +88,71 @@ class PerplexityService:
         except requests.exceptions.Timeout:
             raise Exception("Request timed out. The API took too long to respond.")
         except requests.exceptions.RequestException as e:
-            error_msg = str(e)
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_data = e.response.json()
-                    error_msg = error_data.get('error', {}).get('message', error_msg)
-                except:
-                    error_msg = e.response.text if e.response.text else error_msg
-            raise Exception(f"API error: {error_msg}")
+            self._raise_api_error(e)
         except (KeyError, IndexError) as e:
             raise Exception(f"Unexpected API response format: {str(e)}")
+    
+    def query_stream(self, prompt, model=None):
+        """
+        Stream a query to Perplexity AI, yielding tokens as they arrive
+        
+        Args:
+            prompt: The prompt to send
+            model: Optional model override
+            
+        Yields:
+            {'delta': text} for every content chunk, then a final
+            {'done': True, 'content': full_text, 'citations': [...]}
+        """
+        headers, payload = self._build_request(prompt, model, stream=True)
+        
+        try:
+            response = http_client.post(
+                self.base_url,
+                headers=headers,
+                json=payload,
+                stream=True
+            )
+            
+            response.raise_for_status()
+            
+            # text/event-stream carries no charset, and requests would fall
+            # back to ISO-8859-1 for text/*; SSE is always UTF-8
+            response.encoding = 'utf-8'
+            
+            parts = []
+            citations = []
+            
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    # Server-sent events: "data: {...}" lines, blank keep-alives
+                    if not line or not line.startswith('data:'):
+                        continue
+                    
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        break
+                    
+                    chunk = json.loads(data)
+                    citations = chunk.get('citations') or citations
+                    
+                    choices = chunk.get('choices') or [{}]
+                    delta = (choices[0].get('delta') or {}).get('content')
+                    if delta:
+                        parts.append(delta)
+                        yield {'delta': delta}
+            finally:
+                response.close()
+            
+            yield {
+                'done': True,
+                'content': ''.join(parts),
+                'citations': citations
+            }
+            
+        except requests.exceptions.Timeout:
+            raise Exception("Request timed out. The API took too long to respond.")
+        except requests.exceptions.RequestException as e:
+            self._raise_api_error(e)
+        except (KeyError, IndexError, ValueError) as e:
+            raise Exception(f"Unexpected API response format: {str(e)}")
@@ -0,0 +1,311 @@
+"""
+Quote Store
+Process-wide store of the latest quote per symbol, shared by every service
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from metrics import record_cache
+from services.stock_price_service import stock_price_service
+
+logger = logging.getLogger(__name__)
+
+
+class Quote:
+    """Latest quote for one symbol (slotted: the store holds one per symbol)"""
+
+    __slots__ = ('symbol', 'price', 'change', 'change_percent', 'currency',
+                 'market_state', 'source', 'name', 'fetched_at')
+
+    def __init__(self, symbol: str, price: float, change: float = 0.0,
+                 change_percent: float = 0.0, currency: str = 'USD',
+                 market_state: Optional[str] = None, source: Optional[str] = None,
+                 name: Optional[str] = None, fetched_at: Optional[float] = None):
+        self.symbol = symbol
+        self.price = price
+        self.change = change
+        self.change_percent = change_percent
+        self.currency = currency
+        self.market_state = market_state
+        self.source = source
+        self.name = name
+        # Wall clock, so the age survives being shown to clients
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Quote':
+        """Build a quote from a StockPriceService price dict"""
+        return cls(
+            symbol=data['symbol'],
+            price=data['price'],
+            change=data.get('change', 0.0),
+            change_percent=data.get('change_percent', 0.0),
+            currency=data.get('currency', 'USD'),
+            market_state=data.get('market_state'),
+            source=data.get('source'),
+            name=data.get('name')
+        )
+
+    def age(self, now: Optional[float] = None) -> float:
+        """Seconds since the quote was fetched"""
+        return (now if now is not None else time.time()) - self.fetched_at
+
+    def to_dict(self) -> Dict:
+        """Price dict in the StockPriceService format"""
+        data = {
+            'symbol': self.symbol,
+            'price': self.price,
+            'change': self.change,
+            'change_percent': self.change_percent,
+            'currency': self.currency,
+            'timestamp': datetime.fromtimestamp(self.fetched_at).isoformat(),
+            'source': self.source
+        }
+        if self.market_state is not None:
+            data['market_state'] = self.market_state
+        if self.name is not None:
+            data['name'] = self.name
+        return data
+
+
+class QuoteStore:
+    """
+    Single source of quotes for the whole process
+
+    - One freshness policy: a quote younger than ttl is served from memory
+    - Stale and missing symbols are refreshed together in batches that
+      share one deadline, and a symbol already being fetched by another
+      thread is waited on rather than fetched again
+    - If a refresh fails the last quote is served until it is older than
+      max_stale, so a flaky upstream degrades to slightly old prices;
+      callers that must act on current prices pass max_age=ttl
+    - Services with their own upstream fetch through get_with(), which
+      shares the same freshness check and in-flight deduplication
+    """
+
+    def __init__(self, price_service=None, ttl: Optional[float] = None):
+        """
+        Args:
+            price_service: Upstream with get_multiple_prices()
+            ttl: Seconds a quote is considered fresh
+        """
+        self.price_service = price_service or stock_price_service
+        self.ttl = ttl if ttl is not None else float(os.getenv('QUOTE_TTL_SECONDS', '60'))
+        self.max_stale = float(os.getenv('QUOTE_MAX_STALE_SECONDS', '900'))
+        self.max_symbols = int(os.getenv('QUOTE_STORE_MAX_SYMBOLS', '5000'))
+        self.timeout = float(os.getenv('QUOTE_FETCH_TIMEOUT', '6'))
+        self.max_batch_size = self.price_service.max_batch_size
+
+        # Oldest published first, so eviction pops from the front in O(1)
+        self._quotes: Dict[str, Quote] = OrderedDict()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+        self.upstream_batches = 0
+
+    def peek(self, symbol: str) -> Optional[Quote]:
+        """Latest quote for a symbol without refreshing it (may be stale)"""
+        return self._quotes.get(symbol)
+
+    def fresh(self, symbol: str) -> Optional[Quote]:
+        """Quote for a symbol if it is still fresh, without fetching"""
+        quote = self._quotes.get(symbol)
+        if quote is not None and quote.age() < self.ttl:
+            return quote
+        return None
+
+    def put(self, quote: Quote):
+        """Publish a quote fetched outside the store"""
+        with self._lock:
+            current = self._quotes.get(quote.symbol)
+            if current is None or current.fetched_at <= quote.fetched_at:
+                self._quotes[quote.symbol] = quote
+                self._quotes.move_to_end(quote.symbol)
+            if len(self._quotes) > self.max_symbols:
+                self._evict()
+
+    def get(self, symbol: str, timeout: Optional[float] = None,
+            max_age: Optional[float] = None) -> Optional[Quote]:
+        """Quote for one symbol, refreshed if stale"""
+        return self.get_many([symbol], timeout, max_age).get(symbol)
+
+    def get_many(self, symbols: Iterable[str], timeout: Optional[float] = None,
+                 max_age: Optional[float] = None) -> Dict[str, Quote]:
+        """
+        Quotes for many symbols, refreshing only the stale ones
+
+        Args:
+            symbols: Stock symbols (duplicates are fetched once)
+            timeout: Overall deadline in seconds (defaults to QUOTE_FETCH_TIMEOUT)
+            max_age: Oldest quote to return when a refresh fails (defaults to
+                max_stale; pass ttl to only ever get fresh quotes)
+
+        Returns:
+            Dict mapping each requested symbol (as given) to its quote in
+            request order; symbols with no usable quote by the deadline are
+            left out
+        """
+        # Stored under the upper-case symbol, returned under the caller's key
+        requested = {s: s.upper() for s in symbols if s}
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+
+        owned, waiting = self._claim(list(dict.fromkeys(requested.values())))
+        if owned:
+            self._refresh(owned, deadline)
+        for event in waiting:
+            event.wait(max(0.0, deadline - time.monotonic()))
+
+        return self._collect(requested, max_age)
+
+    def get_with(self, symbol: str, fetcher: Callable[[str], Optional[Quote]],
+                 timeout: Optional[float] = None, max_age: Optional[float] = None) -> Optional[Quote]:
+        """
+        Quote for one symbol, refreshed with the caller's own upstream if stale
+
+        For services that fetch quotes from another API (e.g. the chart
+        endpoint); the fetch still goes through the store's freshness check
+        and in-flight deduplication, so no symbol is fetched twice at once.
+
+        Args:
+            symbol: Stock symbol
+            fetcher: Called with the symbol, returns a Quote or None
+            timeout: How long to wait for another thread's fetch of the symbol
+            max_age: As for get_many
+        """
+        requested = {symbol: symbol.upper()}
+        owned, waiting = self._claim(list(requested.values()))
+        if owned:
+            try:
+                quote = fetcher(owned[0])
+                if quote is not None:
+                    self.put(quote)
+            except Exception as e:
+                logger.debug(f"Error fetching quote for {owned[0]}: {str(e)}")
+            finally:
+                self._release(owned)
+        for event in waiting:
+            event.wait(timeout if timeout is not None else self.timeout)
+
+        return self._collect(requested, max_age).get(symbol)
+
+    def _claim(self, symbols: List[str]) -> Tuple[List[str], List[threading.Event]]:
+        """
+        Split stale symbols into ones this caller must fetch and ones
+        another thread is already fetching
+
+        Returns:
+            (symbols to fetch, events to wait on)
+        """
+        now = time.time()
+        owned: List[str] = []
+        waiting: List[threading.Event] = []
+        with self._lock:
+            for symbol in symbols:
+                quote = self._quotes.get(symbol)
+                if quote is not None and quote.age(now) < self.ttl:
+                    self.hits += 1
+                    record_cache('quote_store', f'quote:{symbol}', True)
+                    continue
+                self.misses += 1
+                record_cache('quote_store', f'quote:{symbol}', False)
+                if symbol in self._inflight:
+                    waiting.append(self._inflight[symbol])
+                else:
+                    self._inflight[symbol] = threading.Event()
+                    owned.append(symbol)
+        return owned, waiting
+
+    def _release(self, symbols: List[str]):
+        """Mark claimed symbols as fetched and wake their waiters"""
+        with self._lock:
+            for symbol in symbols:
+                event = self._inflight.pop(symbol, None)
+                if event is not None:
+                    event.set()
+
+    def _collect(self, requested: Dict[str, str], max_age: Optional[float]) -> Dict[str, Quote]:
+        """Stored quotes no older than max_age, keyed as requested"""
+        max_age = self.max_stale if max_age is None else min(max_age, self.max_stale)
+        now = time.time()
+        quotes = {}
+        for key, symbol in requested.items():
+            quote = self._quotes.get(symbol)
+            if quote is None:
+                continue
+            age = quote.age(now)
+            if age >= max_age:
+                continue
+            if age >= self.ttl:
+                self.stale_served += 1
+            quotes[key] = quote
+        return quotes
+
+    def _refresh(self, symbols: List[str], deadline: float):
+        """Fetch symbols upstream in batches, then release their waiters"""
+        try:
+            for i in range(0, len(symbols), self.max_batch_size):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Quote refresh deadline hit, {len(symbols) - i} symbols not fetched")
+                    break
+                batch = symbols[i:i + self.max_batch_size]
+                try:
+                    fetched = self.price_service.get_multiple_prices(batch, timeout=remaining)
+                except Exception as e:
+                    logger.error(f"Error refreshing quotes: {str(e)}")
+                    continue
+                self.upstream_batches += 1
+                for symbol, data in fetched.items():
+                    if data and data.get('price') is not None:
+                        self.put(Quote.from_dict(data))
+        finally:
+            self._release(symbols)
+
+    def _evict(self):
+        """Drop the oldest quotes once the store is over max_symbols (lock held)"""
+        while len(self._quotes) > self.max_symbols:
+            self._quotes.popitem(last=False)
+
+    # StockPriceService-compatible interface, for callers that want dicts
+
+    def get_stock_price(self, ticker: str) -> Optional[Dict]:
+        """Price dict for one ticker (see StockPriceService.get_stock_price)"""
+        quote = self.get(ticker)
+        return quote.to_dict() if quote else None
+
+    def get_multiple_prices(self, tickers: list, timeout: Optional[float] = None,
+                            max_age: Optional[float] = None) -> Dict[str, Dict]:
+        """Price dicts for many tickers (see StockPriceService.get_multiple_prices)"""
+        return {symbol: quote.to_dict() for symbol, quote in self.get_many(tickers, timeout, max_age).items()}
+
+    def clear(self):
+        """Forget every quote"""
+        with self._lock:
+            self._quotes.clear()
+
+    def get_stats(self) -> Dict:
+        """Get quote store statistics"""
+        total = self.hits + self.misses
+        return {
+            'symbols': len(self._quotes),
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total * 100, 2) if total else 0,
+            'stale_served': self.stale_served,
+            'upstream_batches': self.upstream_batches,
+            'inflight': len(self._inflight)
+        }
+
+
+# Global instance
+quote_store = QuoteStore()
@@ -4,10 +4,14 @@ Fetches current stock prices from reliable free APIs
 """
 import requests
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Dict, Optional
 from datetime import datetime
 import logging
 
+from services.http_client import http_client
+
 logger = logging.getLogger(__name__)
 
 class StockPriceService:
@@ -23,6 +27,20 @@ class StockPriceService:
         # Fallback to Yahoo Finance (no API key needed)
         self.use_yahoo = True
         
+        # Batch fetching: max tickers per call, worker pool size and the
+        # overall deadline after which partial results are returned
+        self.max_batch_size = int(os.getenv('STOCK_PRICE_BATCH_LIMIT', '50'))
+        self.max_workers = int(os.getenv('STOCK_PRICE_MAX_WORKERS', '8'))
+        self.batch_timeout = float(os.getenv('STOCK_PRICE_BATCH_TIMEOUT', '6'))
+        
+        # Per-host concurrency caps so a large batch can't hammer one upstream
+        self._host_limits = {
+            'yahoo': threading.BoundedSemaphore(int(os.getenv('YAHOO_MAX_CONCURRENCY', '6'))),
+            'alphavantage': threading.BoundedSemaphore(1)
+        }
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        
     def get_stock_price(self, ticker: str) -> Optional[Dict]:
         """
         Get current stock price for a ticker
@@ -85,7 +103,8 @@ class StockPriceService:
                 'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
             }
             
-            response = requests.get(url, params=params, headers=headers, timeout=5)
+            with self._host_limits['yahoo']:
+                response = http_client.get(url, params=params, headers=headers)
             
             if response.status_code != 200:
                 logger.warning(f"Yahoo Finance returned {response.status_code} for {ticker}")
@@ -118,6 +137,7 @@ class StockPriceService:
                 'currency': meta.get('currency', 'USD'),
                 'timestamp': datetime.now().isoformat(),
                 'market_state': meta.get('marketState', 'REGULAR'),
+                'name': meta.get('longName') or meta.get('shortName'),
                 'source': 'yahoo'
             }
             
@@ -141,7 +161,8 @@ class StockPriceService:
                 'apikey': self.alpha_vantage_key
             }
             
-            response = requests.get(url, params=params, timeout=5)
+            with self._host_limits['alphavantage']:
+                response = http_client.get(url, params=params, timeout=5)
             
             if response.status_code != 200:
                 return None
@@ -174,28 +195,70 @@ class StockPriceService:
             logger.error(f"Error fetching from Alpha Vantage for {ticker}: {str(e)}")
             return None
     
-    def get_multiple_prices(self, tickers: list) -> Dict[str, Dict]:
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Lazily create the shared worker pool used for batch fetches"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix='stock-price'
+                    )
+        return self._executor
+    
+    def get_multiple_prices(self, tickers: list, timeout: Optional[float] = None) -> Dict[str, Dict]:
         """
-        Get prices for multiple tickers
+        Get prices for multiple tickers concurrently
         
         Args:
             tickers: List of stock symbols
+            timeout: Overall deadline in seconds (defaults to batch_timeout)
             
         Returns:
-            Dict mapping ticker to price data
+            Dict mapping ticker to price data. Tickers that fail or miss
+            the deadline are left out, so the result may be partial.
         """
-        # Security: Limit to 10 tickers at once
-        if len(tickers) > 10:
-            logger.warning(f"Too many tickers requested: {len(tickers)}, limiting to 10")
-            tickers = tickers[:10]
+        # Drop duplicates but keep the caller's ordering
+        tickers = list(dict.fromkeys(t for t in tickers if t))
+        
+        # Security: Limit batch size
+        if len(tickers) > self.max_batch_size:
+            logger.warning(f"Too many tickers requested: {len(tickers)}, limiting to {self.max_batch_size}")
+            tickers = tickers[:self.max_batch_size]
+        
+        if not tickers:
+            return {}
+        
+        # A lone ticker skips the pool unless the caller set a deadline
+        if len(tickers) == 1 and timeout is None:
+            price_data = self.get_stock_price(tickers[0])
+            return {tickers[0]: price_data} if price_data else {}
+        
+        deadline = timeout if timeout is not None else self.batch_timeout
+        executor = self._get_executor()
+        futures = {executor.submit(self.get_stock_price, ticker): ticker for ticker in tickers}
+        
+        done, pending = wait(futures, timeout=deadline)
         
         results = {}
-        for ticker in tickers:
-            price_data = self.get_stock_price(ticker)
+        for future in done:
+            ticker = futures[future]
+            try:
+                price_data = future.result()
+            except Exception as e:
+                logger.error(f"Error fetching price for {ticker}: {str(e)}")
+                continue
             if price_data:
                 results[ticker] = price_data
         
-        return results
+        if pending:
+            for future in pending:
+                future.cancel()
+            missed = sorted(futures[f] for f in pending)
+            logger.warning(f"Price batch deadline ({deadline}s) hit, missing: {', '.join(missed)}")
+        
+        # Preserve request order in the response
+        return {ticker: results[ticker] for ticker in tickers if ticker in results}
 
 
 # Global instance
@@ -7,6 +7,8 @@ import requests
 from typing import Dict, List
 from datetime import datetime, timedelta
 
+from services.http_client import http_client
+
 class SocialSentimentService:
     def __init__(self):
         self.api_key = os.getenv('PERPLEXITY_API_KEY')
@@ -108,7 +110,7 @@ SUMMARY: [2-3 sentences]"""
         print(f"[SocialSentiment] Calling Perplexity API for {ticker}")
         
         try:
-            response = requests.post(self.api_url, json=payload, headers=headers, timeout=20)
+            response = http_client.post(self.api_url, json=payload, headers=headers, timeout=20)
             print(f"[SocialSentiment] API response status: {response.status_code}")
             
             response.raise_for_status()
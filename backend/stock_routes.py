@@ -3,7 +3,7 @@ Stock-related API routes
 Handles stock prices, charts, alerts, and market data
 """
 from flask import Blueprint, request, jsonify
-from services.stock_price_service import stock_price_service
+from services.quote_store import quote_store
 from chart_service import chart_service
 from price_alerts_service import price_alerts_service
 from market_overview_service import market_overview_service
@@ -18,7 +18,7 @@ stock_bp = Blueprint('stock', __name__)
 def get_stock_price(ticker):
     """Get current price for a single stock"""
     try:
-        price_data = stock_price_service.get_stock_price(ticker)
+        price_data = quote_store.get_stock_price(ticker)
         
         if not price_data:
             return jsonify({'error': 'Price data not available'}), 404
@@ -39,12 +39,13 @@ def get_multiple_prices():
         if not tickers_param:
             return jsonify({'error': 'No tickers provided'}), 400
         
-        tickers = [t.strip().upper() for t in tickers_param.split(',')]
+        tickers = [t.strip().upper() for t in tickers_param.split(',') if t.strip()]
         
-        if len(tickers) > 20:
-            return jsonify({'error': 'Too many tickers (max 20)'}), 400
+        max_batch = quote_store.max_batch_size
+        if len(tickers) > max_batch:
+            return jsonify({'error': f'Too many tickers (max {max_batch})'}), 400
         
-        prices = stock_price_service.get_multiple_prices(tickers)
+        prices = quote_store.get_multiple_prices(tickers)
         
         return jsonify({'prices': prices})
         
@@ -108,13 +109,20 @@ def create_alert(user_id):
         if alert_type == 'percentage' and not percentage_change:
             return jsonify({'error': 'Percentage change is required'}), 400
         
+        # Percentage alerts are measured from the price when they were set
+        reference_price = None
+        if alert_type == 'percentage':
+            quote = quote_store.get(ticker)
+            reference_price = quote.price if quote else None
+        
         alert_id = price_alerts_service.create_alert(
             user_id=user_id,
             ticker=ticker,
             alert_type=alert_type,
             target_price=float(target_price) if target_price else None,
             percentage_change=float(percentage_change) if percentage_change else None,
-            condition=condition
+            condition=condition,
+            reference_price=reference_price
         )
         
         if not alert_id:
@@ -0,0 +1,15 @@
+"""
+Test setup: import the backend modules against throwaway databases
+"""
+import os
+import sys
+import tempfile
+
+# Must happen before db.py is imported: the global pools read these paths
+_DB_DIR = tempfile.mkdtemp(prefix='stonk-tests-')
+os.environ['USERS_DB_PATH'] = os.path.join(_DB_DIR, 'users.db')
+os.environ['ALERTS_DB_PATH'] = os.path.join(_DB_DIR, 'stonk_market.db')
+os.environ.setdefault('NOTIFY_DISPATCHER_ENABLED', 'false')
+os.environ.setdefault('ALERT_SCHEDULER_ENABLED', 'false')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
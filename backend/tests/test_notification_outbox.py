@@ -0,0 +1,349 @@
+"""
+Notification outbox dispatcher: SMTP against a local aiosmtpd server, SES
+against a stubbed boto3 client, retries, digests and lease recovery
+"""
+import socket
+import ssl
+import subprocess
+import time
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from db import users_db
+from notification_outbox import (
+    CHANNEL_SES, CHANNEL_SMTP, NotificationOutbox, SESTransport, SMTPTransport
+)
+
+
+class RecordingTransport:
+    """Collects sent messages; fails the first `failures` sends"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+        self.sessions = 0
+
+    def open(self):
+        self.sessions += 1
+
+    def send(self, message):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('upstream unavailable')
+        self.sent.append(message)
+
+    def close(self):
+        pass
+
+
+def _rows():
+    conn = users_db.connect()
+    try:
+        conn.row_factory = None
+        cursor = conn.execute('SELECT * FROM notification_outbox ORDER BY id')
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+@pytest.fixture(autouse=True)
+def empty_outbox():
+    conn = users_db.connect()
+    try:
+        conn.execute('DELETE FROM notification_outbox')
+        conn.commit()
+    finally:
+        conn.close()
+    yield
+
+
+def _outbox(**transports):
+    outbox = NotificationOutbox(transports=transports)
+    outbox.rate_limiter.rate = outbox.rate_limiter.capacity = 1000.0
+    return outbox
+
+
+# ----------------------------------------------------------------------
+# SMTP through aiosmtpd
+
+@pytest.fixture
+def smtp_server(tmp_path, monkeypatch):
+    """Local SMTP server with STARTTLS and AUTH, like the real relay"""
+    controller_module = pytest.importorskip('aiosmtpd.controller')
+    smtp_module = pytest.importorskip('aiosmtpd.smtp')
+
+    cert, key = tmp_path / 'cert.pem', tmp_path / 'key.pem'
+    try:
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+             '-subj', '/CN=localhost', '-keyout', str(key), '-out', str(cert)],
+            check=True, capture_output=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip('openssl is needed to create the test certificate')
+    tls_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    tls_context.load_cert_chain(str(cert), str(key))
+
+    class Handler:
+        def __init__(self):
+            self.messages = []
+            self.logins = 0
+
+        async def handle_DATA(self, server, session, envelope):
+            self.messages.append(envelope)
+            return '250 OK'
+
+    handler = Handler()
+
+    def authenticator(server, session, envelope, mechanism, auth_data):
+        ok = auth_data.login == b'alerts@example.com' and auth_data.password == b'secret'
+        handler.logins += ok
+        return smtp_module.AuthResult(success=ok)
+
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    controller = controller_module.Controller(
+        handler, hostname='127.0.0.1', port=port,
+        tls_context=tls_context, require_starttls=True,
+        authenticator=authenticator, auth_require_tls=True
+    )
+    controller.start()
+
+    monkeypatch.setenv('SMTP_SERVER', '127.0.0.1')
+    monkeypatch.setenv('SMTP_PORT', str(port))
+    monkeypatch.setenv('SMTP_USER', 'alerts@example.com')
+    monkeypatch.setenv('SMTP_PASSWORD', 'secret')
+    try:
+        yield handler
+    finally:
+        controller.stop()
+
+
+def test_smtp_batch_is_delivered_over_one_session(smtp_server):
+    outbox = _outbox(smtp=SMTPTransport())
+    outbox.enqueue_many([
+        {'channel': CHANNEL_SMTP, 'recipient': f'user{i}@example.com',
+         'subject': f'Reset {i}', 'body_text': 'Your link'}
+        for i in range(3)
+    ])
+
+    assert outbox.process_batch() == 3
+
+    assert sorted(m.rcpt_tos[0] for m in smtp_server.messages) == [
+        'user0@example.com', 'user1@example.com', 'user2@example.com'
+    ]
+    assert all(m.mail_from == 'alerts@example.com' for m in smtp_server.messages)
+    assert smtp_server.logins == 1
+    assert {row['status'] for row in _rows()} == {'sent'}
+
+
+# ----------------------------------------------------------------------
+# SES through a stubbed client
+
+@pytest.fixture
+def ses_stub(monkeypatch):
+    client = boto3.client(
+        'ses', region_name='us-east-1',
+        aws_access_key_id='testing', aws_secret_access_key='testing'
+    )
+    monkeypatch.setattr(SESTransport, '_client', client)
+    with Stubber(client) as stubber:
+        yield stubber
+
+
+def test_ses_sends_each_message(ses_stub):
+    ses_stub.add_response('send_email', {'MessageId': 'msg-1'}, {
+        'Source': 'noreply@example.com',
+        'Destination': {'ToAddresses': ['user@example.com']},
+        'Message': {
+            'Subject': {'Data': 'Reset your password', 'Charset': 'UTF-8'},
+            'Body': {
+                'Text': {'Data': 'Plain', 'Charset': 'UTF-8'},
+                'Html': {'Data': '<p>Html</p>', 'Charset': 'UTF-8'}
+            }
+        }
+    })
+    outbox = _outbox(ses=SESTransport())
+    outbox.enqueue('user@example.com', 'Reset your password', 'Plain', '<p>Html</p>',
+                   channel=CHANNEL_SES, sender='noreply@example.com')
+
+    assert outbox.process_batch() == 1
+
+    ses_stub.assert_no_pending_responses()
+    row, = _rows()
+    assert row['status'] == 'sent'
+
+
+def test_ses_throttling_is_retried(ses_stub):
+    ses_stub.add_client_error('send_email', service_error_code='Throttling',
+                              service_message='Maximum sending rate exceeded.')
+    outbox = _outbox(ses=SESTransport())
+    outbox.enqueue('user@example.com', 'Hi', 'Body', channel=CHANNEL_SES, sender='noreply@example.com')
+
+    outbox.process_batch()
+
+    row, = _rows()
+    assert row['status'] == 'pending'
+    assert 'Throttling' in row['last_error']
+
+
+# ----------------------------------------------------------------------
+# Retries, digests and leases
+
+def _make_due():
+    conn = users_db.connect()
+    try:
+        conn.execute("UPDATE notification_outbox SET next_attempt_at = 0 WHERE status = 'pending'")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_failed_sends_back_off_then_fail():
+    transport = RecordingTransport(failures=10)
+    outbox = _outbox(ses=transport)
+    outbox.max_attempts = 3
+    outbox.retry_backoff = 10
+    outbox.enqueue('user@example.com', 'Hi', 'Body')
+
+    start = time.time()
+    outbox.process_batch()
+    row, = _rows()
+    assert (row['status'], row['attempts']) == ('pending', 1)
+    assert 10 <= row['next_attempt_at'] - start < 12
+
+    # Not due yet: nothing is claimed
+    assert outbox.process_batch() == 0
+
+    _make_due()
+    start = time.time()
+    outbox.process_batch()
+    row, = _rows()
+    assert (row['status'], row['attempts']) == ('pending', 2)
+    assert 20 <= row['next_attempt_at'] - start < 22
+
+    _make_due()
+    outbox.process_batch()
+    row, = _rows()
+    assert (row['status'], row['attempts']) == ('failed', 3)
+    assert row['last_error'] == 'upstream unavailable'
+    assert outbox.failed == 1
+
+
+def test_alerts_for_one_recipient_are_merged_into_a_digest():
+    transport = RecordingTransport()
+    outbox = _outbox(smtp=transport)
+    outbox.enqueue_many([
+        {'channel': CHANNEL_SMTP, 'kind': 'price_alert', 'recipient': 'a@example.com',
+         'subject': f'{ticker} alert', 'body_text': 'x', 'summary': f'{ticker} crossed',
+         'digest_key': 'price_alert'}
+        for ticker in ('AAPL', 'MSFT', 'TSLA')
+    ] + [
+        {'channel': CHANNEL_SMTP, 'kind': 'price_alert', 'recipient': 'b@example.com',
+         'subject': 'NVDA alert', 'body_text': 'single', 'summary': 'NVDA crossed',
+         'digest_key': 'price_alert'}
+    ])
+
+    assert outbox.process_batch() == 4
+
+    by_recipient = {m['recipient']: m for m in transport.sent}
+    assert len(transport.sent) == 2
+    digest = by_recipient['a@example.com']
+    assert digest['subject'] == '🚨 3 price alerts triggered'
+    for line in ('- AAPL crossed', '- MSFT crossed', '- TSLA crossed'):
+        assert line in digest['body_text']
+    assert by_recipient['b@example.com']['subject'] == 'NVDA alert'
+    assert transport.sessions == 1
+    assert {row['status'] for row in _rows()} == {'sent'}
+
+
+def test_expired_lease_is_reclaimed_by_another_dispatcher():
+    crashed = _outbox(ses=RecordingTransport())
+    survivor_transport = RecordingTransport()
+    survivor = _outbox(ses=survivor_transport)
+    crashed.enqueue('user@example.com', 'Hi', 'Body')
+
+    # The first dispatcher claims the row and dies before recording anything
+    assert len(crashed._claim()) == 1
+    assert survivor.process_batch() == 0
+
+    conn = users_db.connect()
+    try:
+        conn.execute('UPDATE notification_outbox SET claimed_until = ?', (time.time() - 1,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    assert survivor.process_batch() == 1
+    assert [m['recipient'] for m in survivor_transport.sent] == ['user@example.com']
+    row, = _rows()
+    assert row['status'] == 'sent'
+    assert row['claimed_by'] is None
+
+
+def test_message_that_keeps_killing_dispatchers_fails():
+    outbox = _outbox(ses=RecordingTransport())
+    outbox.max_attempts = 3
+    outbox.enqueue('user@example.com', 'Hi', 'Body')
+
+    def crash_mid_send():
+        assert len(outbox._claim()) == 1
+        conn = users_db.connect()
+        try:
+            conn.execute('UPDATE notification_outbox SET claimed_until = ?', (time.time() - 1,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    crash_mid_send()
+    crash_mid_send()
+    row, = _rows()
+    assert (row['status'], row['attempts']) == ('sending', 1)
+    crash_mid_send()
+
+    # The third crash is counted when the row is next reclaimed
+    assert outbox._claim() == []
+    row, = _rows()
+    assert (row['status'], row['attempts']) == ('failed', 3)
+    assert row['claimed_by'] is None
+    assert outbox.failed == 1
+
+
+def test_dispatcher_that_loses_leadership_hands_back_unsent_messages(monkeypatch):
+    transport = RecordingTransport()
+    outbox = _outbox(ses=transport)
+    outbox.enqueue_many([
+        {'recipient': f'user{i}@example.com', 'subject': 'Hi', 'body_text': 'Body'}
+        for i in range(3)
+    ])
+
+    # Leader when the batch starts; the renewal after the first send fails
+    outbox.lease.is_leader = True
+    outbox._lease_held_at = time.monotonic()
+
+    def lose_lease(redis_client=None):
+        outbox.lease.is_leader = False
+        return False
+
+    monkeypatch.setattr(outbox.lease, 'hold', lose_lease)
+    original_send = transport.send
+
+    def send_then_expire(message):
+        original_send(message)
+        outbox._lease_held_at -= outbox.lease.ttl
+
+    transport.send = send_then_expire
+
+    assert outbox.process_batch() == 3
+
+    assert [m['recipient'] for m in transport.sent] == ['user0@example.com']
+    rows = _rows()
+    assert [(row['status'], row['attempts']) for row in rows] == [
+        ('sent', 1), ('pending', 0), ('pending', 0)
+    ]
+    assert all(row['claimed_by'] is None for row in rows)